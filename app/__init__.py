@@ -69,6 +69,10 @@ def create_app(config_class=Config):
     def load_user(user_id):
         return get_admin_user(user_id)
     
+    # Template filters (list views pass raw datetimes and format only what they render)
+    from app.utils import format_datetime
+    app.add_template_filter(format_datetime, 'datetime')
+    
     # Register blueprints
     from app.routes.main import main_bp
     from app.routes.admin import admin_bp
@@ -76,9 +80,25 @@ def create_app(config_class=Config):
     app.register_blueprint(main_bp)
     app.register_blueprint(admin_bp)
     
+    # Register management CLI commands
+    from app.cli import register_cli
+    register_cli(app)
+    
     # Initialize database tables
+    from app.models import ensure_schema_columns, ensure_schema_indexes
     with app.app_context():
         db.create_all()
+        ensure_schema_columns()
+        ensure_schema_indexes()
+    
+    # Initialize webhook dispatcher (partitioned, ordered per subscription)
+    from app.webhook_dispatcher import webhook_dispatcher
+    webhook_dispatcher.init_app(app)
+    
+    # Warm Plex connections in the background so requests don't pay connect latency
+    if config_class.PLEX_KEEPALIVE_ENABLED:
+        from app.plex_service import plex_servers
+        plex_servers.start_background_maintenance()
     
     # Initialize background scheduler for subscription management
     from app.scheduler import init_scheduler
@@ -0,0 +1,118 @@
+import logging
+from datetime import datetime, timedelta
+from app.models import (Subscription, SubscriptionSnapshot, SubscriptionStatus, Tier, db,
+                        take_subscription_snapshot)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'subscription_snapshot'
+
+# Statuses that still count as a retained subscriber
+RETAINED_STATUSES = (SubscriptionStatus.active, SubscriptionStatus.past_due)
+
+def snapshot_subscriptions(day=None):
+    """Record the per-tier snapshot for day (default: yesterday, UTC); returns tiers recorded."""
+    day = day or (datetime.utcnow().date() - timedelta(days=1))
+    recorded = take_subscription_snapshot(day)
+    logger.info(f"Recorded subscription snapshot for {day} ({recorded} tiers)")
+    return recorded
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+def _month(column):
+    """SQL expression for a timestamp's YYYY-MM month."""
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.to_char(column, 'YYYY-MM')
+    return db.func.strftime('%Y-%m', column)
+
+def _daily_totals(since):
+    """All tiers summed per day since the given date, oldest first (one grouped query)."""
+    rows = db.session.query(
+        SubscriptionSnapshot.day,
+        db.func.sum(SubscriptionSnapshot.active),
+        db.func.sum(SubscriptionSnapshot.past_due),
+        db.func.sum(SubscriptionSnapshot.new),
+        db.func.sum(SubscriptionSnapshot.churned),
+        db.func.sum(SubscriptionSnapshot.mrr)
+    ).filter(SubscriptionSnapshot.day >= since).group_by(SubscriptionSnapshot.day).order_by(SubscriptionSnapshot.day)
+    return [
+        {'day': day, 'active': active, 'past_due': past_due, 'new': new, 'churned': churned, 'mrr': round(mrr, 2)}
+        for day, active, past_due, new, churned, mrr in rows
+    ]
+
+def _latest_tiers():
+    """Per-tier rows of the most recent snapshot, highest MRR first."""
+    latest = db.session.query(db.func.max(SubscriptionSnapshot.day)).scalar_subquery()
+    rows = db.session.query(Tier.name, Tier.price_monthly, SubscriptionSnapshot).join(
+        SubscriptionSnapshot, SubscriptionSnapshot.tier_id == Tier.id
+    ).filter(SubscriptionSnapshot.day == latest).order_by(SubscriptionSnapshot.mrr.desc(), Tier.name)
+    return [
+        {'name': name, 'price_monthly': price, 'active': snapshot.active, 'past_due': snapshot.past_due,
+         'grandfathered': snapshot.grandfathered, 'mrr': snapshot.mrr}
+        for name, price, snapshot in rows
+    ]
+
+def get_cohort_retention(months=12):
+    """Share of each monthly sign-up cohort still subscribed (grandfathered users excluded)."""
+    today = datetime.utcnow().date()
+    first = today.replace(day=1)
+    for _ in range(months - 1):
+        first = (first - timedelta(days=1)).replace(day=1)
+    cohort = _month(Subscription.created_at)
+    rows = db.session.query(
+        cohort,
+        db.func.count(Subscription.id),
+        db.func.sum(db.case((Subscription.status.in_(RETAINED_STATUSES), 1), else_=0))
+    ).filter(
+        Subscription.created_at >= datetime.combine(first, datetime.min.time()),
+        Subscription.grandfathered == False
+    ).group_by(cohort).order_by(cohort)
+    return [
+        {'cohort': month, 'subscribers': subscribers, 'retained': retained,
+         'retention': _ratio(retained, subscribers)}
+        for month, subscribers, retained in rows
+    ]
+
+def get_analytics(days=90):
+    """Revenue and churn trends for the admin analytics page.
+
+    Everything is computed from the daily snapshot table and grouped SQL
+    aggregates, so the cost grows with the number of days shown, not with
+    the number of subscriptions. Rates use the previous day's active and
+    past-due subscribers as the base.
+    """
+    since = datetime.utcnow().date() - timedelta(days=days)
+    daily = _daily_totals(since)
+
+    for row, previous in zip(daily, [None] + daily[:-1]):
+        if previous is None:
+            row['churn_rate'] = row['mrr_growth'] = None
+            continue
+        row['churn_rate'] = _ratio(row['churned'], previous['active'] + previous['past_due'])
+        row['mrr_growth'] = _ratio(row['mrr'] - previous['mrr'], previous['mrr'])
+
+    summary = None
+    if daily:
+        latest, window = daily[-1], daily[-30:]
+        start = window[0]
+        # Subscribers at the start of the window's first day (its row is end-of-day)
+        opening = start['active'] + start['past_due'] - start['new'] + start['churned']
+        summary = {
+            'day': latest['day'],
+            'mrr': latest['mrr'],
+            'active': latest['active'],
+            'past_due': latest['past_due'],
+            'new_30d': sum(row['new'] for row in window),
+            'churned_30d': sum(row['churned'] for row in window),
+            'churn_rate_30d': _ratio(sum(row['churned'] for row in window), max(opening, 0)),
+            'mrr_growth_30d': _ratio(latest['mrr'] - start['mrr'], start['mrr']),
+        }
+
+    return {
+        'days': days,
+        'daily': daily,
+        'summary': summary,
+        'tiers': _latest_tiers(),
+        'cohorts': get_cohort_retention(),
+    }
@@ -0,0 +1,268 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from app.circuit_breaker import CircuitOpenError
+from app.models import (DeferredPlexAction, ENTITLED_STATUSES, InviteRequest, Subscription, SubscriptionStatus,
+                        Tier, db, bulk_update_subscriptions, get_job_checkpoint, get_server_loads, save_job_checkpoint)
+from app.plex_service import plex_servers
+from app.stripe_service import stripe_service
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'subscription_bulk_action'
+
+# Bulk actions offered on the subscriptions page, with the label used in reports
+ACTIONS = {
+    'revoke': 'Revoke access',
+    'extend': 'Extend',
+    'cancel_stripe': 'Cancel in Stripe',
+    'reinvite': 'Re-invite to Plex',
+}
+
+# Keep the stored report small; counts cover the rest
+MAX_REPORTED_ERRORS = 100
+
+_run_lock = threading.Lock()
+
+def _save_progress(progress):
+    """Persist progress so the admin UI (and other workers) can see it."""
+    try:
+        save_job_checkpoint(CHECKPOINT_NAME, data=dict(progress))
+    except Exception as e:
+        logger.warning(f"Could not save bulk action progress: {str(e)}")
+
+def _gather(executor, calls):
+    """Run {key: (func, args)} concurrently; return {key: exception or None}."""
+    futures = {key: executor.submit(func, *args) for key, (func, args) in calls.items()}
+    outcomes = {}
+    for key, future in futures.items():
+        try:
+            future.result()
+            outcomes[key] = None
+        except Exception as e:
+            outcomes[key] = e
+    return outcomes
+
+def _revoke(executor, subscriptions, days, now):
+    """Remove Plex access and cancel Stripe billing immediately (the single revoke action, in bulk)."""
+    calls = {('plex', s.id): (plex_servers.revoke_access, (s.plex_username,)) for s in subscriptions}
+    calls.update({
+        ('stripe', s.id): (stripe_service.cancel_subscription, (s.stripe_subscription_id, False))
+        for s in subscriptions if s.stripe_subscription_id
+    })
+    outcomes = _gather(executor, calls)
+    # As with a single revoke, a Stripe failure is logged but doesn't keep the user's access
+    for (kind, subscription_id), error in outcomes.items():
+        if kind == 'stripe' and error:
+            logger.error(f"Error cancelling Stripe subscription for subscription {subscription_id}: {str(error)}")
+
+    updates, deferred, results = [], [], {}
+    for s in subscriptions:
+        error = outcomes[('plex', s.id)]
+        if isinstance(error, CircuitOpenError):
+            deferred.append({'action': 'revoke', 'email_or_username': s.plex_username,
+                             'subscription_id': s.id, 'attempts': 0, 'created_at': now})
+            error = None
+        if error is None:
+            updates.append({'id': s.id, 'status': SubscriptionStatus.cancelled, 'updated_at': now})
+        results[s.id] = error
+    if deferred:
+        db.session.execute(db.insert(DeferredPlexAction), deferred)
+    return updates, results
+
+def _extend(executor, subscriptions, days, now):
+    """Push the period end out by days and reactivate (database only).
+
+    Grandfathered subscriptions never expire, so they are only reactivated.
+    A row isn't reactivated while its Plex user already has another entitled
+    subscription of the same kind (the unique identity index would reject
+    the whole chunk); it is reported as failed instead.
+    """
+    # Entitled (Plex user, grandfathered) pairs, including rows reactivated earlier in this chunk
+    identities = {s.plex_username_normalized for s in subscriptions if s.plex_username_normalized}
+    taken = {
+        (identity, grandfathered): subscription_id
+        for subscription_id, identity, grandfathered in db.session.query(
+            Subscription.id, Subscription.plex_username_normalized, Subscription.grandfathered
+        ).filter(Subscription.status.in_(ENTITLED_STATUSES),
+                 Subscription.plex_username_normalized.in_(identities))
+    } if identities else {}
+
+    updates, results = [], {}
+    for s in subscriptions:
+        identity = (s.plex_username_normalized, s.grandfathered)
+        if s.plex_username_normalized and s.status not in ENTITLED_STATUSES:
+            if taken.get(identity, s.id) != s.id:
+                results[s.id] = ValueError(f"{s.plex_username} already has an active subscription "
+                                           f"(#{taken[identity]})")
+                continue
+            taken[identity] = s.id
+        updates.append({
+            'id': s.id,
+            'status': SubscriptionStatus.active,
+            'current_period_end': (s.current_period_end if s.grandfathered
+                                   else (s.current_period_end or now) + timedelta(days=days)),
+            'updated_at': now
+        })
+        results[s.id] = None
+    return updates, results
+
+def _cancel_stripe(executor, subscriptions, days, now):
+    """Cancel Stripe billing at period end; access lasts until then and the webhook updates status."""
+    billed = [s for s in subscriptions if s.stripe_subscription_id]
+    outcomes = _gather(executor, {
+        s.id: (stripe_service.cancel_subscription, (s.stripe_subscription_id, True)) for s in billed
+    })
+    results = {s.id: ValueError("No Stripe subscription") for s in subscriptions if not s.stripe_subscription_id}
+    results.update(outcomes)
+    updates = [{'id': subscription_id, 'cancel_at_period_end': True, 'updated_at': now}
+               for subscription_id, error in outcomes.items() if error is None]
+    return updates, results
+
+def _reinvite(executor, subscriptions, days, now):
+    """Send a fresh Plex invite on each subscriber's server (placing unplaced ones first)."""
+    loads = get_server_loads()
+    # One query for the chunk's tiers instead of a lazy load per subscription
+    tiers = {tier.id: tier for tier in Tier.query.filter(Tier.id.in_({s.tier_id for s in subscriptions}))}
+    calls, servers, results = {}, {}, {}
+    for s in subscriptions:
+        tier = tiers.get(s.tier_id)
+        if tier is None:
+            results[s.id] = ValueError("Tier not found")
+            continue
+        try:
+            service = plex_servers.get(s.plex_server) if s.plex_server else plex_servers.choose_server(tier, loads)
+        except ValueError as e:
+            results[s.id] = e
+            continue
+        if not s.plex_server:
+            loads[service.server_name] = loads.get(service.server_name, 0) + 1
+        servers[s.id] = service.server_name
+        calls[s.id] = (service.send_invite_with_tier, (s.plex_username, tier))
+    results.update(_gather(executor, calls))
+
+    updates, invites = [], []
+    for s in subscriptions:
+        if s.id not in calls or results[s.id] is not None:
+            continue
+        invites.append({'email_or_username': s.plex_username, 'status': 'success',
+                        'subscription_id': s.id, 'free_tier': False, 'timestamp': now})
+        if not s.plex_server:
+            updates.append({'id': s.id, 'plex_server': servers[s.id], 'updated_at': now})
+    if invites:
+        db.session.execute(db.insert(InviteRequest), invites)
+    return updates, results
+
+_HANDLERS = {
+    'revoke': _revoke,
+    'extend': _extend,
+    'cancel_stripe': _cancel_stripe,
+    'reinvite': _reinvite,
+}
+
+def run_bulk_action(action, subscription_ids, days=None, on_progress=None):
+    """Apply an admin action to many subscriptions and return the final progress dict.
+
+    Subscriptions are handled ADMIN_BULK_CHUNK_SIZE at a time. Within a chunk
+    the Plex and Stripe calls run concurrently on ADMIN_BULK_WORKERS threads,
+    then every row change is written with one executemany UPDATE and the
+    chunk is committed before progress is saved.
+    """
+    if action not in _HANDLERS:
+        raise ValueError(f"Unknown bulk action: {action}")
+    if action == 'extend' and (not days or days < 1):
+        raise ValueError("Days to extend must be at least 1")
+
+    subscription_ids = sorted(set(subscription_ids))
+    progress = {
+        'action': action,
+        'label': ACTIONS[action] + (f" by {days} days" if action == 'extend' else ''),
+        'status': 'running',
+        'started_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        'finished_at': None,
+        'total': len(subscription_ids),
+        'done': 0,
+        'failed': 0,
+        'errors': [],
+        'error': None,
+    }
+
+    if not _run_lock.acquire(blocking=False):
+        raise ValueError("A bulk action is already running")
+
+    def report():
+        _save_progress(progress)
+        if on_progress:
+            on_progress(progress)
+
+    try:
+        report()
+        chunk_size = Config.ADMIN_BULK_CHUNK_SIZE
+        with ThreadPoolExecutor(max_workers=Config.ADMIN_BULK_WORKERS,
+                                thread_name_prefix='bulk-action') as executor:
+            for start in range(0, len(subscription_ids), chunk_size):
+                chunk = subscription_ids[start:start + chunk_size]
+                subscriptions = Subscription.query.filter(Subscription.id.in_(chunk)).all()
+                results = {subscription_id: ValueError("Subscription not found") for subscription_id in chunk}
+
+                now = datetime.utcnow()
+                updates, outcomes = _HANDLERS[action](executor, subscriptions, days, now)
+                results.update(outcomes)
+                try:
+                    bulk_update_subscriptions(updates, source=f'bulk_{action}')
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+
+                emails = {s.id: s.email for s in subscriptions}
+                for subscription_id, error in results.items():
+                    if error is None:
+                        progress['done'] += 1
+                        continue
+                    progress['failed'] += 1
+                    if len(progress['errors']) < MAX_REPORTED_ERRORS:
+                        progress['errors'].append({'id': subscription_id, 'email': emails.get(subscription_id),
+                                                   'error': str(error)})
+                report()
+                logger.info(f"Bulk {action}: {progress['done'] + progress['failed']}/{progress['total']} "
+                            f"processed, {progress['failed']} failed")
+
+        progress['status'] = 'complete'
+        progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        report()
+        return progress
+
+    except Exception as e:
+        progress['status'] = 'failed'
+        progress['error'] = str(e)
+        progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        _save_progress(progress)
+        logger.error(f"Bulk {action} failed: {str(e)}")
+        raise
+
+    finally:
+        _run_lock.release()
+
+def start_bulk_action(app, action, subscription_ids, days=None):
+    """Run a bulk action in a background thread (used by the admin action)."""
+    if _run_lock.locked():
+        raise ValueError("A bulk action is already running")
+
+    def run():
+        with app.app_context():
+            try:
+                run_bulk_action(action, subscription_ids, days=days)
+            except Exception:
+                pass  # Already logged and saved to the checkpoint
+
+    thread = threading.Thread(target=run, name='subscription-bulk-action', daemon=True)
+    thread.start()
+    return thread
+
+def get_bulk_action_progress():
+    """Return the progress of the current or most recent bulk action, or None."""
+    checkpoint = get_job_checkpoint(CHECKPOINT_NAME)
+    return checkpoint.data if checkpoint else None
@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(ValueError):
+    """Raised instead of calling an upstream service the breaker considers down."""
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker driven by a rolling failure rate.
+
+    While closed, outcomes from the last ``window`` seconds are tracked and the
+    breaker opens once at least ``minimum_calls`` were made and the failure
+    rate reaches ``failure_rate``. While open, calls fail immediately with
+    CircuitOpenError. After ``reset_timeout`` seconds a single trial call is
+    let through (half-open): success closes the breaker, failure reopens it.
+
+    Exceptions listed in ``ignored`` mean the upstream answered (e.g. a 404)
+    and count as successes. State is kept per process.
+    """
+
+    def __init__(self, name, failure_rate=0.5, minimum_calls=5, window=60, reset_timeout=30, ignored=()):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.minimum_calls = minimum_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.ignored = tuple(ignored)
+        self._state = CLOSED
+        self._outcomes = deque()
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        """State with an expired open period promoted to half-open (lock held)."""
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+            logger.info(f"Circuit '{self.name}' half-open, allowing a trial call")
+        return self._state
+
+    def _prune(self, now):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        logger.warning(f"Circuit '{self.name}' opened: {self._last_error}")
+
+    def allow(self):
+        """Reserve permission for one call, or raise CircuitOpenError."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            retry_in = max(0, int(self.reset_timeout - (time.monotonic() - (self._opened_at or 0))))
+        raise CircuitOpenError(
+            f"{self.name} is temporarily unavailable. Please try again in a few minutes."
+            + (f" (retrying in {retry_in}s)" if state == OPEN else "")
+        )
+
+    def record_success(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._state == HALF_OPEN:
+                self._state = CLOSED
+                self._outcomes.clear()
+                self._last_error = None
+                logger.info(f"Circuit '{self.name}' closed after a successful trial call")
+                return
+            self._outcomes.append((now, True))
+            self._prune(now)
+
+    def record_failure(self, error):
+        with self._lock:
+            now = time.monotonic()
+            self._last_error = str(error)
+            if self._state == HALF_OPEN:
+                self._open(now)
+                return
+            if self._state == OPEN:
+                return
+            self._outcomes.append((now, False))
+            self._prune(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if len(self._outcomes) >= self.minimum_calls and failures / len(self._outcomes) >= self.failure_rate:
+                self._open(now)
+
+    @contextmanager
+    def guard(self):
+        """Run a with block as one call through the breaker."""
+        self.allow()
+        try:
+            yield
+        except self.ignored:
+            self.record_success()
+            raise
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        else:
+            self.record_success()
+
+    def stats(self):
+        """Current state and rolling-window counts for the dashboard."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state()
+            self._prune(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            return {
+                'name': self.name,
+                'state': state,
+                'calls': len(self._outcomes),
+                'failures': failures,
+                'retry_in': max(0, int(self.reset_timeout - (now - self._opened_at))) if state == OPEN else 0,
+                'last_error': self._last_error
+            }
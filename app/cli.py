@@ -0,0 +1,208 @@
+import re
+from datetime import datetime, timedelta
+import click
+
+def parse_since(value):
+    """Parse a relative age like '6h', '2d', '30m' or an ISO timestamp (UTC)."""
+    match = re.fullmatch(r'(\d+)([mhd])', value.strip())
+    if match:
+        amount, unit = int(match.group(1)), match.group(2)
+        delta = {'m': timedelta(minutes=amount), 'h': timedelta(hours=amount), 'd': timedelta(days=amount)}[unit]
+        return datetime.utcnow() - delta
+    try:
+        return datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise click.BadParameter(f"Expected an age like 6h/2d or an ISO timestamp, got '{value}'")
+
+def register_cli(app):
+    """Register management commands on the Flask CLI."""
+
+    @app.cli.command('stripe-backfill')
+    @click.option('--since', required=True,
+                  help="Replay events created after this time: an age like 6h/2d or an ISO timestamp (UTC).")
+    def stripe_backfill(since):
+        """Replay missed Stripe webhook events through the webhook handlers."""
+        from app.stripe_backfill import backfill_stripe_events
+
+        def echo_progress(progress):
+            click.echo(
+                f"[{progress['status']}] {progress['done'] + progress['failed']}/{progress['total']} replayed "
+                f"({progress['failed']} failed, {progress['already_processed']} already processed) "
+                f"- {progress['events_per_second']} events/s"
+            )
+
+        try:
+            progress = backfill_stripe_events(parse_since(since), on_progress=echo_progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        click.echo(
+            f"Backfill complete: {progress['done']} replayed, {progress['skipped']} skipped, "
+            f"{progress['failed']} failed out of {progress['listed']} listed events."
+        )
+
+    @app.cli.command('grandfather-users')
+    @click.option('--chunk-size', default=1000, show_default=True, help="Invites migrated per transaction.")
+    def grandfather_users(chunk_size):
+        """Create permanent subscriptions for existing successful invites (resumable)."""
+        from app.grandfather import grandfather_existing_users
+
+        def echo_progress(progress):
+            click.echo(
+                f"[{progress['status']}] {progress['done']}/{progress['total']} invites migrated "
+                f"- {progress['invites_per_second']} invites/s"
+            )
+
+        try:
+            progress = grandfather_existing_users(chunk_size=chunk_size, on_progress=echo_progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        click.echo(f"Grandfathering complete: {progress['done']} invites migrated"
+                   f"{' (resumed)' if progress['resumed'] else ''}.")
+
+    @app.cli.command('prune-invites')
+    @click.option('--days', type=int, default=None,
+                  help="Archive requests older than this many days (default: INVITE_RETENTION_DAYS).")
+    @click.option('--batch-size', type=int, default=None,
+                  help="Requests archived per transaction (default: INVITE_RETENTION_BATCH_SIZE).")
+    def prune_invites(days, batch_size):
+        """Roll up, archive and delete old invite requests."""
+        from app.invite_retention import prune_invite_requests
+
+        def echo_progress(progress):
+            click.echo(f"[{progress['status']}] {progress['archived']} requests archived "
+                       f"in {progress['batches']} batches")
+
+        try:
+            progress = prune_invite_requests(retention_days=days, batch_size=batch_size, on_progress=echo_progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        click.echo(f"Retention complete: {progress['archived']} requests older than {progress['cutoff']} archived.")
+
+    @app.cli.command('export-invite-archive')
+    @click.argument('output', type=click.Path(dir_okay=False, writable=True))
+    def export_invite_archive(output):
+        """Write every archived invite request to OUTPUT as gzip-compressed JSON lines."""
+        from app.models import InviteRequestArchive, db
+
+        rows = 0
+        with open(output, 'wb') as f:
+            # Concatenated gzip members are themselves a valid gzip file, so batches are copied as is
+            for archive in (db.session.query(InviteRequestArchive.payload, InviteRequestArchive.row_count)
+                            .order_by(InviteRequestArchive.first_timestamp, InviteRequestArchive.id)
+                            .yield_per(100)):
+                f.write(archive.payload)
+                rows += archive.row_count
+        click.echo(f"Exported {rows} archived invite requests to {output}.")
+
+    @app.cli.command('export')
+    @click.argument('dataset', type=click.Choice(['subscriptions', 'invites']))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+    @click.option('--status', default=None, help="Only rows with this status.")
+    @click.option('--output', '-o', type=click.File('w'), default='-', help="File to write (default: stdout).")
+    def export(dataset, fmt, status, output):
+        """Stream subscriptions (with tier name and price) or invite requests as CSV/NDJSON."""
+        from app.exports import export_chunks
+
+        try:
+            chunks = export_chunks(dataset, fmt, status=status)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        for chunk in chunks:
+            output.write(chunk)
+
+    @app.cli.command('snapshot-subscriptions')
+    @click.option('--day', default=None, help="Day to record as YYYY-MM-DD (default: yesterday, UTC). "
+                                              "Active, past-due and MRR figures are always as of now.")
+    def snapshot_subscriptions(day):
+        """Record the daily per-tier subscription snapshot used by the analytics page."""
+        from app.analytics import snapshot_subscriptions as run_snapshot
+
+        try:
+            day = datetime.strptime(day, '%Y-%m-%d').date() if day else None
+        except ValueError:
+            raise click.BadParameter(f"Expected YYYY-MM-DD, got '{day}'", param_hint='--day')
+        recorded = run_snapshot(day)
+        click.echo(f"Recorded snapshot for {recorded} tiers.")
+
+    @app.cli.command('backfill-identities')
+    @click.option('--batch-size', type=int, default=None,
+                  help="Rows per transaction (default: IDENTITY_BACKFILL_BATCH_SIZE).")
+    def backfill_identities(batch_size):
+        """Fill casefolded email/username columns of existing rows and add the unique identity index."""
+        from app.identity_backfill import backfill_identities as run_backfill
+
+        def echo_progress(progress):
+            if progress['status'] == 'running':
+                click.echo(', '.join(f"{table}: {count} filled" for table, count in progress['filled'].items()))
+
+        try:
+            progress = run_backfill(batch_size=batch_size, on_progress=echo_progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Backfill complete: {sum(progress['filled'].values())} rows filled.")
+        if progress['unique_index']:
+            click.echo("Unique identity index is in place.")
+        else:
+            click.echo("Unique identity index not created; resolve these duplicate entitled subscriptions first:")
+            for duplicate in progress['duplicates']:
+                kind = 'grandfathered' if duplicate['grandfathered'] else 'paid'
+                click.echo(f"  {duplicate['identity']}: {duplicate['count']} {kind}")
+
+    @app.cli.command('seed-subscription-events')
+    @click.option('--chunk-size', default=1000, show_default=True, help="Subscriptions seeded per transaction.")
+    def seed_subscription_events(chunk_size):
+        """Give subscriptions created before subscription_events existed a starting history."""
+        from app.models import seed_subscription_event_chunk
+
+        seeded, cursor = 0, 0
+        while True:
+            count, cursor = seed_subscription_event_chunk(after_id=cursor, chunk_size=chunk_size)
+            if not count:
+                break
+            seeded += count
+            click.echo(f"{seeded} subscriptions seeded (through id {cursor})")
+        click.echo(f"Seeding complete: {seeded} subscriptions given a starting history.")
+
+    @app.cli.command('subscriptions-at')
+    @click.argument('moment')
+    def subscriptions_at(moment):
+        """Show subscription counts as of MOMENT (an age like 30d or an ISO timestamp) and changes since."""
+        from app.models import count_status_transitions, get_status_counts_at
+
+        moment = parse_since(moment)
+        counts = get_status_counts_at(moment)
+        click.echo(f"As of {moment:%Y-%m-%d %H:%M:%S}: " +
+                   (', '.join(f"{status} {count}" for status, count in sorted(counts.items())) or 'no subscriptions'))
+        transitions = count_status_transitions(moment, datetime.utcnow())
+        for (from_status, status), count in sorted(transitions.items(), key=lambda item: -item[1]):
+            click.echo(f"  {from_status or 'new'} -> {status}: {count}")
+
+    @app.cli.command('plex-reconcile')
+    @click.option('--dry-run', is_flag=True, help="Only report what would be granted or revoked.")
+    def plex_reconcile(dry_run):
+        """Invite missing subscribers and remove lapsed ones from Plex."""
+        from app.plex_sync import reconcile_plex_access
+
+        try:
+            report = reconcile_plex_access(dry_run=dry_run)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        click.echo(f"{report['entitled']} entitled subscribers")
+        for server_name, server in report['servers'].items():
+            if server.get('error'):
+                click.echo(f"  {server_name}: skipped ({server['error']})")
+            else:
+                click.echo(f"  {server_name}: {server['friends']} friends, {server['pending']} pending invites")
+        click.echo(f"To grant ({report['to_grant']}): {', '.join(report['planned_grants']) or '-'}")
+        click.echo(f"To revoke ({report['to_revoke']}): {', '.join(report['planned_revokes']) or '-'}")
+        if not dry_run:
+            click.echo(
+                f"Granted {report['granted_count']}, revoked {report['revoked_count']}, "
+                f"failed {report['failed_count']} in {report['duration_seconds']}s"
+            )
+            for failure in report['failed']:
+                click.echo(f"  failed: {failure['user']}: {failure['error']}")
@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class EventBus:
+    """In-process publish/subscribe feed of dashboard events for one worker.
+
+    Events are kept in a bounded ring buffer with increasing ids; readers wait
+    on a condition for ids past the last one they saw, so any number of SSE
+    connections share one copy of each event. A ``key`` makes publishing
+    idempotent: the same row reported by a model write and by the producer's
+    database poll is only delivered once.
+    """
+
+    def __init__(self, max_events=500, max_keys=5000):
+        # Event ids are only meaningful within this process; a reconnect that lands on another
+        # worker (or after a restart) sees a different epoch and starts from the newest event
+        self.epoch = uuid.uuid4().hex[:8]
+        self._events = deque(maxlen=max_events)
+        self._keys = deque(maxlen=max_keys)
+        self._key_set = set()
+        self._next_id = 1
+        self._changed = set()
+        self._condition = threading.Condition()
+
+    @property
+    def last_id(self):
+        with self._condition:
+            return self._next_id - 1
+
+    def publish(self, event_type, data, key=None):
+        """Append an event and wake readers; returns its id, or None if key was already published."""
+        with self._condition:
+            if key is not None:
+                if key in self._key_set:
+                    return None
+                if len(self._keys) == self._keys.maxlen:
+                    self._key_set.discard(self._keys[0])
+                self._keys.append(key)
+                self._key_set.add(key)
+            event_id = self._next_id
+            self._next_id += 1
+            self._events.append((event_id, event_type, data))
+            self._changed.add(event_type)
+            self._condition.notify_all()
+            return event_id
+
+    def wait(self, after_id, timeout):
+        """Return events newer than after_id, waiting up to timeout seconds for the first one."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._next_id - 1 > after_id, timeout=timeout)
+            return [event for event in self._events if event[0] > after_id]
+
+    def pop_changed(self):
+        """Event types published since the last call (the producer refreshes stats for these)."""
+        with self._condition:
+            changed, self._changed = self._changed, set()
+            return changed
+
+def publish_event(event_type, data, key=None):
+    """Publish to this worker's bus without letting a dashboard problem break the write path."""
+    try:
+        event_bus.publish(event_type, data, key=key)
+    except Exception as e:
+        logger.warning(f"Could not publish {event_type} event: {str(e)}")
+
+class DashboardEventProducer:
+    """One thread per worker that feeds the bus with what model writes can't see.
+
+    Writes made in this worker are published directly by the model helpers.
+    Writes made by other gunicorn workers (webhooks, jobs) are picked up by
+    polling recently changed rows, which the bus de-duplicates. Whenever
+    invites or subscriptions changed, the producer recomputes the stats once
+    and publishes the snapshot, so viewers never run queries themselves.
+    The thread only polls while at least one dashboard stream is open.
+    """
+
+    # Re-read rows this far behind the last poll so slow commits from other workers aren't missed
+    LOOKBACK = timedelta(seconds=10)
+
+    def __init__(self, bus, poll_interval=2):
+        self.bus = bus
+        self.poll_interval = poll_interval
+        self._app = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._viewers = 0
+        self._since = None
+
+    def start(self, app):
+        """Start the producer thread for this worker if it isn't running yet."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._app = app
+            self._since = datetime.utcnow()
+            self._thread = threading.Thread(target=self._run, name='dashboard-events', daemon=True)
+            self._thread.start()
+
+    def add_viewer(self, limit):
+        """Register an open stream unless limit streams are already open; returns True if added."""
+        with self._lock:
+            if self._viewers >= limit:
+                return False
+            self._viewers += 1
+            return True
+
+    def remove_viewer(self):
+        with self._lock:
+            self._viewers = max(0, self._viewers - 1)
+
+    @property
+    def viewers(self):
+        with self._lock:
+            return self._viewers
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            if not self.viewers:
+                # Nothing is watching; skip ahead so reconnecting viewers don't get a backlog
+                self._since = datetime.utcnow()
+                self.bus.pop_changed()
+                continue
+            with self._app.app_context():
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error(f"Error polling dashboard events: {str(e)}")
+
+    def poll(self):
+        """Publish rows changed since the last poll, then fresh stats for whatever changed."""
+        from app.models import (InviteRequest, InviteRow, JobCheckpoint, Subscription, Tier, db, fetch_rows,
+                                get_invite_stats, get_subscription_stats, select_invite_rows)
+
+        started = datetime.utcnow()
+        since = self._since - self.LOOKBACK
+        try:
+            # Column rows with the tier name joined in: a bulk change touching thousands of
+            # rows costs one query per table, not an ORM object and tier load per row
+            invites = fetch_rows(InviteRow, select_invite_rows()
+                                 .where(InviteRequest.timestamp >= since).order_by(InviteRequest.id))
+            for invite in invites:
+                self.bus.publish('invite', invite.to_dict(), key=('invite', invite.id))
+            subscriptions = db.session.execute(
+                db.select(Subscription.id, Subscription.email, Subscription.plex_username,
+                          Tier.name.label('tier_name'), Subscription.status, Subscription.updated_at)
+                .outerjoin(Tier, Tier.id == Subscription.tier_id)
+                .where(Subscription.updated_at >= since)
+            )
+            for subscription in subscriptions:
+                self.bus.publish('subscription', subscription_event(subscription),
+                                 key=('subscription', subscription.id, subscription.updated_at.isoformat()))
+            for checkpoint in JobCheckpoint.query.filter(JobCheckpoint.updated_at >= since):
+                if checkpoint.data is not None:
+                    self.bus.publish('job', job_event(checkpoint),
+                                     key=('job', checkpoint.name, checkpoint.updated_at.isoformat()))
+
+            changed = self.bus.pop_changed()
+            if 'invite' in changed:
+                self.bus.publish('invite_stats', get_invite_stats())
+            if 'subscription' in changed:
+                self.bus.publish('subscription_stats', get_subscription_stats())
+            self._since = started
+        finally:
+            db.session.remove()
+
+def subscription_event(subscription):
+    """The fields of a subscription (model or row with tier_name) the dashboard shows in its activity feed."""
+    return {
+        'id': subscription.id,
+        'email': subscription.email,
+        'plex_username': subscription.plex_username,
+        'tier_name': subscription.tier_name,
+        'status': subscription.status.value if hasattr(subscription.status, 'value') else subscription.status,
+        'updated_at': subscription.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+def job_event(checkpoint):
+    return {
+        'name': checkpoint.name,
+        'data': checkpoint.data,
+        'updated_at': checkpoint.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+event_bus = EventBus()
+dashboard_events = DashboardEventProducer(event_bus, poll_interval=Config.DASHBOARD_EVENT_POLL_INTERVAL)
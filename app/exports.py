@@ -0,0 +1,103 @@
+import csv
+import enum
+import io
+import json
+from datetime import datetime
+from app.models import InviteRequest, Subscription, SubscriptionStatus, Tier, db
+
+# Rows fetched from the database per round trip (a server-side cursor on PostgreSQL)
+FETCH_SIZE = 1000
+
+# Rows encoded per chunk written to the response/file
+CHUNK_ROWS = 500
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def _subscription_query(status=None):
+    query = (
+        db.select(Subscription.id, Subscription.email, Subscription.plex_username, Subscription.plex_server,
+                  Subscription.tier_id, Tier.name.label('tier_name'), Tier.price_monthly.label('tier_price_monthly'),
+                  Subscription.status, Subscription.grandfathered, Subscription.cancel_at_period_end,
+                  Subscription.stripe_customer_id, Subscription.stripe_subscription_id,
+                  Subscription.current_period_start, Subscription.current_period_end,
+                  Subscription.created_at, Subscription.updated_at)
+        .outerjoin(Tier, Tier.id == Subscription.tier_id)
+        .order_by(Subscription.id)
+    )
+    if status:
+        query = query.where(Subscription.status == SubscriptionStatus[status])
+    return query
+
+def _invite_query(status=None):
+    query = (
+        db.select(InviteRequest.id, InviteRequest.email_or_username, InviteRequest.timestamp, InviteRequest.status,
+                  InviteRequest.error_message, InviteRequest.subscription_id, InviteRequest.free_tier)
+        .order_by(InviteRequest.id)
+    )
+    if status:
+        query = query.where(InviteRequest.status == status)
+    return query
+
+# Exportable datasets: name -> (query builder, statuses accepted by its status filter)
+DATASETS = {
+    'subscriptions': (_subscription_query, [status.name for status in SubscriptionStatus]),
+    'invites': (_invite_query, ['success', 'failed']),
+}
+
+def _plain(value):
+    """Convert a column value to something CSV and JSON can both write."""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+def _rows(dataset, status=None):
+    """Yield (column names, then) plain row tuples, streamed with yield_per."""
+    build_query = DATASETS[dataset][0]
+    result = db.session.execute(build_query(status).execution_options(yield_per=FETCH_SIZE))
+    yield tuple(result.keys())
+    for row in result:
+        yield tuple(_plain(value) for value in row)
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for count, row in enumerate(rows):
+        writer.writerow(row)
+        # Send the header on its own so the download starts before the first fetch finishes
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def _ndjson_chunks(rows):
+    columns = next(rows)
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(columns, row))))
+        if len(lines) == CHUNK_ROWS:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+def export_chunks(dataset, fmt, status=None):
+    """Stream a dataset as CSV or NDJSON text chunks, in constant memory.
+
+    Validates its arguments before returning (raising ValueError), then
+    fetches FETCH_SIZE rows per round trip and encodes CHUNK_ROWS rows per
+    chunk, so the caller can write to a response or file as it goes.
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown export: {dataset}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    if status and status not in DATASETS[dataset][1]:
+        raise ValueError(f"Unknown {dataset} status: {status}")
+    rows = _rows(dataset, status)
+    return _csv_chunks(rows) if fmt == 'csv' else _ndjson_chunks(rows)
@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from app.models import (count_ungrandfathered_invites, get_grandfathered_tier_id, get_job_checkpoint,
+                        grandfather_invite_chunk, save_job_checkpoint)
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'grandfather_migration'
+
+# Statuses of a run that has not finished (the next run resumes from its cursor)
+UNFINISHED_STATUSES = ('running', 'failed')
+
+_run_lock = threading.Lock()
+
+def _save_progress(progress):
+    """Persist progress so an interrupted run can resume and the admin UI can show it."""
+    try:
+        save_job_checkpoint(CHECKPOINT_NAME, data=dict(progress))
+    except Exception as e:
+        logger.warning(f"Could not save grandfathering progress: {str(e)}")
+
+def grandfather_existing_users(chunk_size=1000, on_progress=None):
+    """Create permanent subscriptions for existing successful invites, a chunk at a time.
+
+    Each chunk commits on its own and the checkpoint records the last invite
+    id handled, so a run that was interrupted (crash, deploy) continues from
+    there instead of rescanning. Returns the final progress dict.
+    """
+    if not _run_lock.acquire(blocking=False):
+        raise ValueError("Grandfathering is already running")
+
+    try:
+        previous = get_grandfather_progress()
+        resuming = bool(previous and previous.get('status') in UNFINISHED_STATUSES)
+        after_id = previous['last_invite_id'] if resuming else 0
+        progress = {
+            'status': 'running',
+            'started_at': previous['started_at'] if resuming else datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'finished_at': None,
+            'resumed': resuming,
+            'done': previous['done'] if resuming else 0,
+            'total': 0,
+            'last_invite_id': after_id,
+            'invites_per_second': 0.0,
+            'error': None,
+        }
+        progress['total'] = progress['done'] + count_ungrandfathered_invites(after_id)
+        started = time.monotonic()
+        done_at_start = progress['done']
+
+        def report():
+            elapsed = max(time.monotonic() - started, 0.001)
+            progress['invites_per_second'] = round((progress['done'] - done_at_start) / elapsed, 1)
+            _save_progress(progress)
+            if on_progress:
+                on_progress(progress)
+
+        try:
+            report()
+            tier_id = get_grandfathered_tier_id()
+            while True:
+                handled, after_id = grandfather_invite_chunk(tier_id, after_id=after_id, chunk_size=chunk_size)
+                if not handled:
+                    break
+                progress['done'] += handled
+                progress['last_invite_id'] = after_id
+                report()
+                logger.info(f"Grandfathering: {progress['done']}/{progress['total']} invites migrated")
+
+            progress['status'] = 'complete'
+            progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            report()
+            return progress
+
+        except Exception as e:
+            progress['status'] = 'failed'
+            progress['error'] = str(e)
+            progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            _save_progress(progress)
+            logger.error(f"Grandfathering failed after {progress['done']} invites: {str(e)}")
+            raise
+
+    finally:
+        _run_lock.release()
+
+def start_grandfathering(app):
+    """Run grandfathering in a background thread (used by the admin action)."""
+    if _run_lock.locked():
+        raise ValueError("Grandfathering is already running")
+
+    def run():
+        with app.app_context():
+            try:
+                grandfather_existing_users()
+            except Exception:
+                pass  # Already logged and saved to the checkpoint
+
+    thread = threading.Thread(target=run, name='grandfather-migration', daemon=True)
+    thread.start()
+    return thread
+
+def get_grandfather_progress():
+    """Return the progress of the current or most recent grandfathering run, or None."""
+    checkpoint = get_job_checkpoint(CHECKPOINT_NAME)
+    return checkpoint.data if checkpoint else None
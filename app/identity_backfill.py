@@ -0,0 +1,83 @@
+import logging
+import threading
+from datetime import datetime
+from app.models import (IDENTITY_COLUMNS, backfill_identity_chunk, ensure_identity_unique_index,
+                        find_duplicate_identities, get_job_checkpoint, save_job_checkpoint)
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'identity_backfill'
+
+_run_lock = threading.Lock()
+
+def _save_progress(progress):
+    """Persist progress so the admin UI (and other workers) can see it."""
+    try:
+        save_job_checkpoint(CHECKPOINT_NAME, data=dict(progress))
+    except Exception as e:
+        logger.warning(f"Could not save identity backfill progress: {str(e)}")
+
+def backfill_identities(batch_size=None, on_progress=None):
+    """Fill the normalized identity columns of existing rows, then add the unique identity index.
+
+    Each batch commits on its own and only rows still missing a value are
+    read, so an interrupted run simply continues next time. The unique index
+    is created only when no Plex user holds two entitled subscriptions of the
+    same kind; otherwise the duplicates are listed in the progress for an
+    admin to resolve. Returns the final progress dict.
+    """
+    batch_size = batch_size or Config.IDENTITY_BACKFILL_BATCH_SIZE
+    if not _run_lock.acquire(blocking=False):
+        raise ValueError("Identity backfill is already running")
+
+    progress = {
+        'status': 'running',
+        'started_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        'finished_at': None,
+        'filled': {model.__tablename__: 0 for model in IDENTITY_COLUMNS},
+        'unique_index': False,
+        'duplicates': [],
+        'error': None,
+    }
+
+    def report():
+        _save_progress(progress)
+        if on_progress:
+            on_progress(progress)
+
+    try:
+        for model in IDENTITY_COLUMNS:
+            cursor = 0
+            while True:
+                filled, cursor = backfill_identity_chunk(model, after_id=cursor, chunk_size=batch_size)
+                if not filled:
+                    break
+                progress['filled'][model.__tablename__] += filled
+                report()
+
+        progress['unique_index'] = ensure_identity_unique_index()
+        if not progress['unique_index']:
+            progress['duplicates'] = find_duplicate_identities()
+            logger.warning(f"Unique identity index not created: {len(progress['duplicates'])} "
+                           f"Plex users have duplicate entitled subscriptions")
+        progress['status'] = 'complete'
+        progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        report()
+        return progress
+
+    except Exception as e:
+        progress['status'] = 'failed'
+        progress['error'] = str(e)
+        progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        _save_progress(progress)
+        logger.error(f"Identity backfill failed: {str(e)}")
+        raise
+
+    finally:
+        _run_lock.release()
+
+def get_backfill_progress():
+    """Return the progress of the current or most recent identity backfill, or None."""
+    checkpoint = get_job_checkpoint(CHECKPOINT_NAME)
+    return checkpoint.data if checkpoint else None
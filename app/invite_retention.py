@@ -0,0 +1,83 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from app.models import archive_invite_chunk, get_job_checkpoint, save_job_checkpoint
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'invite_retention'
+
+_run_lock = threading.Lock()
+
+def _save_progress(progress):
+    """Persist progress so the admin UI (and other workers) can see it."""
+    try:
+        save_job_checkpoint(CHECKPOINT_NAME, data=dict(progress))
+    except Exception as e:
+        logger.warning(f"Could not save invite retention progress: {str(e)}")
+
+def prune_invite_requests(retention_days=None, batch_size=None, on_progress=None):
+    """Archive invite requests older than retention_days, a small batch per transaction.
+
+    Each batch is rolled up into daily counts, stored as a compressed archive
+    record and deleted together (see archive_invite_chunk), so row locks are
+    held only briefly and an interrupted run loses nothing; the next run just
+    continues with what is left. Returns the final progress dict.
+    """
+    retention_days = Config.INVITE_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or Config.INVITE_RETENTION_BATCH_SIZE
+    if retention_days < 1:
+        raise ValueError("Invite retention is disabled (INVITE_RETENTION_DAYS is 0)")
+
+    if not _run_lock.acquire(blocking=False):
+        raise ValueError("Invite retention is already running")
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    progress = {
+        'status': 'running',
+        'started_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        'finished_at': None,
+        'cutoff': cutoff.strftime('%Y-%m-%d %H:%M:%S'),
+        'archived': 0,
+        'batches': 0,
+        'error': None,
+    }
+
+    def report():
+        _save_progress(progress)
+        if on_progress:
+            on_progress(progress)
+
+    try:
+        report()
+        cursor = None
+        while True:
+            archived, cursor = archive_invite_chunk(cutoff, after=cursor, batch_size=batch_size)
+            if not archived:
+                break
+            progress['archived'] += archived
+            progress['batches'] += 1
+            report()
+
+        progress['status'] = 'complete'
+        progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        report()
+        logger.info(f"Invite retention archived {progress['archived']} requests older than {progress['cutoff']}")
+        return progress
+
+    except Exception as e:
+        progress['status'] = 'failed'
+        progress['error'] = str(e)
+        progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        _save_progress(progress)
+        logger.error(f"Invite retention failed after {progress['archived']} requests: {str(e)}")
+        raise
+
+    finally:
+        _run_lock.release()
+
+def get_retention_progress():
+    """Return the progress of the current or most recent retention run, or None."""
+    checkpoint = get_job_checkpoint(CHECKPOINT_NAME)
+    return checkpoint.data if checkpoint else None
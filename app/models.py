@@ -1,10 +1,19 @@
+import gzip
+import json
 import os
-from datetime import datetime
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import create_engine, text, Enum
+from sqlalchemy import create_engine, text, Enum, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import validates
 from sqlalchemy.pool import NullPool
 from config import Config
+from app.events import publish_event, subscription_event, job_event
+from app.utils import normalize_identity
 import enum
 
 # Initialize SQLAlchemy
@@ -17,6 +26,15 @@ class SubscriptionStatus(enum.Enum):
     cancelled = "cancelled"
     expired = "expired"
 
+# Statuses that entitle a subscriber to Plex access
+ENTITLED_STATUSES = (SubscriptionStatus.active, SubscriptionStatus.past_due)
+
+def _normalized(column):
+    """Column default filling a *_normalized column from the value inserted (ORM and bulk inserts alike)."""
+    def default(context):
+        return normalize_identity(context.get_current_parameters().get(column))
+    return default
+
 class AdminUser(UserMixin):
     """Admin user class for Flask-Login."""
     
@@ -57,6 +75,7 @@ class Tier(db.Model):
     stripe_price_id = db.Column(db.String(255), nullable=True)
     allow_downloads = db.Column(db.Boolean, default=False, nullable=False)
     library_names = db.Column(db.JSON, nullable=True)  # List of library names
+    server_names = db.Column(db.JSON, nullable=True)  # Plex servers this tier may use (None = any)
     active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -74,6 +93,7 @@ class Tier(db.Model):
             'stripe_price_id': self.stripe_price_id,
             'allow_downloads': self.allow_downloads,
             'library_names': self.library_names or [],
+            'server_names': self.server_names or [],
             'active': self.active,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S')
@@ -86,6 +106,10 @@ class Subscription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(255), nullable=False, index=True)
     plex_username = db.Column(db.String(255), nullable=False, index=True)
+    # Casefolded, trimmed copies used for identity lookups (NULL only until backfilled)
+    email_normalized = db.Column(db.String(255), nullable=True, index=True, default=_normalized('email'))
+    plex_username_normalized = db.Column(db.String(255), nullable=True, index=True,
+                                         default=_normalized('plex_username'))
     tier_id = db.Column(db.Integer, db.ForeignKey('tiers.id'), nullable=False)
     status = db.Column(Enum(SubscriptionStatus), default=SubscriptionStatus.active, nullable=False)
     stripe_customer_id = db.Column(db.String(255), nullable=True, index=True)
@@ -94,12 +118,24 @@ class Subscription(db.Model):
     current_period_end = db.Column(db.DateTime, nullable=True, index=True)
     cancel_at_period_end = db.Column(db.Boolean, default=False, nullable=False)
     grandfathered = db.Column(db.Boolean, default=False, nullable=False)
+    last_event_at = db.Column(db.DateTime, nullable=True)  # created time of the last applied Stripe event
+    plex_server = db.Column(db.String(255), nullable=True)  # server the user was invited to (None = primary)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
     # Relationships
     invite_requests = db.relationship('InviteRequest', backref='subscription', lazy=True)
     
+    @property
+    def tier_name(self):
+        """Name of the tier, matching the tier_name column of row queries."""
+        return self.tier.name if self.tier else None
+    
+    @validates('email', 'plex_username')
+    def _keep_normalized(self, key, value):
+        setattr(self, f'{key}_normalized', normalize_identity(value))
+        return value
+    
     def to_dict(self):
         """Convert to dictionary."""
         return {
@@ -115,6 +151,7 @@ class Subscription(db.Model):
             'current_period_end': self.current_period_end.strftime('%Y-%m-%d %H:%M:%S') if self.current_period_end else None,
             'cancel_at_period_end': self.cancel_at_period_end,
             'grandfathered': self.grandfathered,
+            'plex_server': self.plex_server,
             'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S'),
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S')
         }
@@ -122,15 +159,28 @@ class Subscription(db.Model):
 class InviteRequest(db.Model):
     """Invite request model for database storage."""
     __tablename__ = 'invite_requests'
+    __table_args__ = (
+        # Back the admin invite log: newest-first keyset pages, optionally for one status
+        db.Index('ix_invite_requests_status_timestamp', 'status', 'timestamp', 'id'),
+        db.Index('ix_invite_requests_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_invite_requests_identity', 'email_or_username_normalized', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     email_or_username = db.Column(db.String(255), nullable=False)
+    email_or_username_normalized = db.Column(db.String(255), nullable=True,
+                                             default=_normalized('email_or_username'))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     status = db.Column(db.String(50), nullable=False)
     error_message = db.Column(db.Text, nullable=True)
     subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=True)
     free_tier = db.Column(db.Boolean, default=False, nullable=False)
     
+    @validates('email_or_username')
+    def _keep_normalized(self, key, value):
+        self.email_or_username_normalized = normalize_identity(value)
+        return value
+    
     def to_dict(self):
         """Convert to dictionary."""
         return {
@@ -143,6 +193,212 @@ class InviteRequest(db.Model):
             'free_tier': self.free_tier
         }
 
+# One entitled subscription per Plex identity and kind (paid or grandfathered). Marked deferred:
+# ensure_schema_indexes leaves it to the identity backfill, which creates it once the
+# normalized columns are filled and no duplicates remain (create_all makes it on new databases).
+entitled_identity_index = db.Index(
+    'uq_subscriptions_entitled_identity',
+    Subscription.plex_username_normalized, Subscription.grandfathered,
+    unique=True,
+    postgresql_where=text("status IN ('active', 'past_due')"),
+    sqlite_where=text("status IN ('active', 'past_due')"),
+    info={'deferred': True}
+)
+
+class InviteRequestDailyRollup(db.Model):
+    """Invite request counts per day, status and free tier, kept after the raw rows are archived."""
+    __tablename__ = 'invite_request_daily_rollups'
+    __table_args__ = (db.UniqueConstraint('day', 'status', 'free_tier', name='uq_invite_request_daily_rollup'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    status = db.Column(db.String(50), nullable=False)
+    free_tier = db.Column(db.Boolean, default=False, nullable=False)
+    total = db.Column(db.Integer, default=0, nullable=False)
+
+class InviteRequestArchive(db.Model):
+    """One batch of archived invite requests, stored as gzip-compressed JSON lines."""
+    __tablename__ = 'invite_request_archives'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    first_invite_id = db.Column(db.Integer, nullable=False)
+    last_invite_id = db.Column(db.Integer, nullable=False)
+    first_timestamp = db.Column(db.DateTime, nullable=False, index=True)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    payload = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class SubscriptionEvent(db.Model):
+    """Append-only history of a subscription's status and billing period (state after each change)."""
+    __tablename__ = 'subscription_events'
+    __table_args__ = (
+        db.Index('ix_subscription_events_subscription_occurred', 'subscription_id', 'occurred_at'),
+        db.Index('ix_subscription_events_occurred_at', 'occurred_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=False)
+    occurred_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    from_status = db.Column(Enum(SubscriptionStatus), nullable=True)  # None when the subscription was created
+    status = db.Column(Enum(SubscriptionStatus), nullable=False)
+    current_period_start = db.Column(db.DateTime, nullable=True)
+    current_period_end = db.Column(db.DateTime, nullable=True)
+    cancel_at_period_end = db.Column(db.Boolean, nullable=True)
+    source = db.Column(db.String(30), nullable=False)  # webhook, admin, scheduler, stripe_sync, bulk_action, ...
+    
+    def to_dict(self):
+        """Convert to dictionary."""
+        return {
+            'id': self.id,
+            'subscription_id': self.subscription_id,
+            'occurred_at': self.occurred_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'from_status': self.from_status.value if self.from_status else None,
+            'status': self.status.value,
+            'current_period_start': self.current_period_start.strftime('%Y-%m-%d %H:%M:%S') if self.current_period_start else None,
+            'current_period_end': self.current_period_end.strftime('%Y-%m-%d %H:%M:%S') if self.current_period_end else None,
+            'cancel_at_period_end': self.cancel_at_period_end,
+            'source': self.source
+        }
+
+class SubscriptionSnapshot(db.Model):
+    """End-of-day subscription counts and MRR for one tier (the analytics time series)."""
+    __tablename__ = 'subscription_snapshots'
+    __table_args__ = (db.UniqueConstraint('day', 'tier_id', name='uq_subscription_snapshot_day_tier'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, index=True)
+    tier_id = db.Column(db.Integer, db.ForeignKey('tiers.id'), nullable=False)
+    active = db.Column(db.Integer, default=0, nullable=False)
+    past_due = db.Column(db.Integer, default=0, nullable=False)
+    grandfathered = db.Column(db.Integer, default=0, nullable=False)
+    new = db.Column(db.Integer, default=0, nullable=False)  # created that day
+    churned = db.Column(db.Integer, default=0, nullable=False)  # cancelled or expired that day
+    mrr = db.Column(db.Float, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class JobCheckpoint(db.Model):
+    """Progress marker for incremental and resumable background jobs."""
+    __tablename__ = 'job_checkpoints'
+    
+    name = db.Column(db.String(100), primary_key=True)
+    last_run_at = db.Column(db.DateTime, nullable=True)
+    data = db.Column(db.JSON, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+class InFlightRequest(db.Model):
+    """The current or latest single-flight call for one key, shared by every worker (see app/single_flight.py)."""
+    __tablename__ = 'in_flight_requests'
+    
+    key = db.Column(db.String(300), primary_key=True)
+    flight_id = db.Column(db.String(32), nullable=False)  # identifies the call that owns the row
+    status = db.Column(db.String(20), nullable=False)  # pending, success, rejected (ValueError), failed
+    result = db.Column(db.JSON, nullable=True)  # {'value': ...} or {'error': message}
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class ProcessedStripeEvent(db.Model):
+    """Stripe events that have been handled, so redeliveries and replays are skipped."""
+    __tablename__ = 'processed_stripe_events'
+    
+    event_id = db.Column(db.String(255), primary_key=True)
+    event_type = db.Column(db.String(100), nullable=False)
+    created = db.Column(db.DateTime, nullable=False, index=True)
+    processed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class DeferredPlexAction(db.Model):
+    """Plex invite/revoke queued while the Plex circuit breaker was open."""
+    __tablename__ = 'deferred_plex_actions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    action = db.Column(db.String(20), nullable=False)  # 'invite' or 'revoke'
+    email_or_username = db.Column(db.String(255), nullable=False)
+    tier_id = db.Column(db.Integer, db.ForeignKey('tiers.id'), nullable=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=True)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class TierPermissionSync(db.Model):
+    """Per-subscriber progress of pushing a tier's library/download settings to Plex."""
+    __tablename__ = 'tier_permission_syncs'
+    __table_args__ = (db.UniqueConstraint('tier_id', 'subscription_id', name='uq_tier_permission_sync'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    tier_id = db.Column(db.Integer, db.ForeignKey('tiers.id'), nullable=False, index=True)
+    subscription_id = db.Column(db.Integer, db.ForeignKey('subscriptions.id'), nullable=False)
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # 'pending', 'running', 'done' or 'failed'
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    claimed_by = db.Column(db.String(32), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+# Read-only row types for list views. Each holds just the columns its page
+# shows, straight from a column query (no ORM identity tracking or lazy
+# loads), with datetimes left for the template's |datetime filter to format.
+
+class InviteRow(NamedTuple):
+    id: int
+    email_or_username: str
+    timestamp: datetime
+    status: str
+    error_message: Optional[str]
+    subscription_id: Optional[int]
+    free_tier: bool
+    
+    def to_dict(self):
+        """Same shape as InviteRequest.to_dict(), for JSON responses."""
+        return {**self._asdict(), 'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S')}
+
+class SubscriptionRow(NamedTuple):
+    id: int
+    email: str
+    plex_username: str
+    tier_id: int
+    tier_name: Optional[str]
+    status: SubscriptionStatus
+    grandfathered: bool
+    plex_server: Optional[str]
+    current_period_end: Optional[datetime]
+    cancel_at_period_end: bool
+    created_at: datetime
+
+class TierRow(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+    price_monthly: float
+    stripe_price_id: Optional[str]
+    allow_downloads: bool
+    library_names: Optional[list]
+    server_names: Optional[list]
+    active: bool
+
+def select_invite_rows():
+    """Column query for InviteRow; add filters and ordering, then pass to fetch_rows."""
+    return db.select(InviteRequest.id, InviteRequest.email_or_username, InviteRequest.timestamp,
+                     InviteRequest.status, InviteRequest.error_message, InviteRequest.subscription_id,
+                     InviteRequest.free_tier)
+
+def select_subscription_rows():
+    """Column query for SubscriptionRow (tier name joined in rather than lazy-loaded per row)."""
+    return (
+        db.select(Subscription.id, Subscription.email, Subscription.plex_username, Subscription.tier_id,
+                  Tier.name, Subscription.status, Subscription.grandfathered, Subscription.plex_server,
+                  Subscription.current_period_end, Subscription.cancel_at_period_end, Subscription.created_at)
+        .outerjoin(Tier, Tier.id == Subscription.tier_id)
+    )
+
+def select_tier_rows():
+    """Column query for TierRow."""
+    return db.select(Tier.id, Tier.name, Tier.description, Tier.price_monthly, Tier.stripe_price_id,
+                     Tier.allow_downloads, Tier.library_names, Tier.server_names, Tier.active)
+
+def fetch_rows(row_type, query):
+    """Run a select_*_rows() query and return its rows as row_type tuples."""
+    return [row_type._make(row) for row in db.session.execute(query)]
+
 def get_database_uri():
     """Get database URI from environment or config."""
     # Check for Azure PostgreSQL connection string
@@ -158,25 +414,58 @@ def get_database_uri():
     # Fall back to SQLite for local development
     return f'sqlite:///{Config.DATABASE_PATH}'
 
+def ensure_schema_columns():
+    """Add nullable columns introduced after a table was first created."""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+            print(f"Added column {table.name}.{column.name}")
+
+def ensure_schema_indexes():
+    """Create indexes added to a model after its table was first created."""
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing or index.info.get('deferred'):
+                continue
+            index.create(db.engine, checkfirst=True)
+            print(f"Added index {index.name}")
+
 def init_db():
     """Initialize the database schema."""
     try:
         db.create_all()
+        ensure_schema_columns()
+        ensure_schema_indexes()
         print(f"✅ Database initialized successfully")
     except Exception as e:
         print(f"❌ Error initializing database: {str(e)}")
         raise
 
-def create_invite_request(email_or_username, status, error_message=None):
+def create_invite_request(email_or_username, status, error_message=None, subscription_id=None, free_tier=False):
     """Create a new invite request record."""
     try:
         invite = InviteRequest(
             email_or_username=email_or_username,
             status=status,
-            error_message=error_message
+            error_message=error_message,
+            subscription_id=subscription_id,
+            free_tier=free_tier
         )
         db.session.add(invite)
         db.session.commit()
+        publish_event('invite', invite.to_dict(), key=('invite', invite.id))
         return invite.id
     except Exception as e:
         db.session.rollback()
@@ -186,23 +475,77 @@ def create_invite_request(email_or_username, status, error_message=None):
 def get_recent_invites(limit=50):
     """Get recent invite requests."""
     try:
-        invites = InviteRequest.query.order_by(InviteRequest.timestamp.desc()).limit(limit).all()
-        return [invite.to_dict() for invite in invites]
+        return fetch_rows(InviteRow, select_invite_rows().order_by(InviteRequest.timestamp.desc()).limit(limit))
     except Exception as e:
         print(f"Error fetching recent invites: {str(e)}")
         return []
 
+def encode_invite_cursor(invite):
+    """Opaque keyset cursor for an invite row: its exact timestamp and id."""
+    return f"{invite.timestamp.isoformat()}_{invite.id}"
+
+def decode_invite_cursor(cursor):
+    """Return (timestamp, id) from encode_invite_cursor; raises ValueError if malformed."""
+    timestamp, _, invite_id = cursor.rpartition('_')
+    return datetime.fromisoformat(timestamp), int(invite_id)
+
+def get_invite_page(status=None, free_tier=None, since=None, until=None, before=None, after=None, limit=50):
+    """Get one newest-first page of invite requests, filtered and keyset-paginated.
+
+    Pages are addressed by (timestamp, id) cursors rather than offsets, so
+    each page is a single index range scan no matter how deep it is.
+    before returns the page of rows older than that cursor, after the page
+    newer than it. Returns {'invites': [InviteRow], 'older_cursor',
+    'newer_cursor'}, with a cursor of None when there is nothing further that way.
+    """
+    key = db.tuple_(InviteRequest.timestamp, InviteRequest.id)
+    query = select_invite_rows()
+    if status:
+        query = query.where(InviteRequest.status == status)
+    if free_tier is not None:
+        query = query.where(InviteRequest.free_tier == free_tier)
+    if since:
+        query = query.where(InviteRequest.timestamp >= since)
+    if until:
+        query = query.where(InviteRequest.timestamp < until)
+
+    if after:
+        # Walk forward from the cursor, then flip back to newest-first
+        rows = fetch_rows(InviteRow, query.where(key > after)
+                          .order_by(InviteRequest.timestamp.asc(), InviteRequest.id.asc())
+                          .limit(limit + 1))
+        has_newer = len(rows) > limit
+        rows = rows[:limit][::-1]
+        has_older = True
+    else:
+        if before:
+            query = query.where(key < before)
+        rows = fetch_rows(InviteRow, query.order_by(InviteRequest.timestamp.desc(), InviteRequest.id.desc())
+                          .limit(limit + 1))
+        has_older = len(rows) > limit
+        rows = rows[:limit]
+        has_newer = before is not None
+
+    return {
+        'invites': rows,
+        'older_cursor': encode_invite_cursor(rows[-1]) if rows and has_older else None,
+        'newer_cursor': encode_invite_cursor(rows[0]) if rows and has_newer else None,
+    }
+
 def get_invite_stats():
     """Get invite statistics."""
     try:
-        total = InviteRequest.query.count()
-        successful = InviteRequest.query.filter_by(status='success').count()
-        failed = InviteRequest.query.filter_by(status='failed').count()
+        counts = Counter(dict(db.session.query(InviteRequest.status, db.func.count(InviteRequest.id))
+                              .group_by(InviteRequest.status).all()))
+        # Requests already archived by the retention job are counted from their daily rollups
+        counts.update(dict(db.session.query(InviteRequestDailyRollup.status,
+                                            db.func.sum(InviteRequestDailyRollup.total))
+                           .group_by(InviteRequestDailyRollup.status).all()))
         
         return {
-            'total': total,
-            'successful': successful,
-            'failed': failed
+            'total': sum(counts.values()),
+            'successful': counts.get('success', 0),
+            'failed': counts.get('failed', 0)
         }
     except Exception as e:
         print(f"Error fetching invite stats: {str(e)}")
@@ -211,38 +554,211 @@ def get_invite_stats():
 def get_subscription_stats():
     """Get subscription statistics."""
     try:
-        total = Subscription.query.count()
-        active = Subscription.query.filter_by(status=SubscriptionStatus.active).count()
+        counts = dict(db.session.query(Subscription.status, db.func.count(Subscription.id))
+                      .group_by(Subscription.status).all())
         grandfathered = Subscription.query.filter_by(grandfathered=True).count()
-        past_due = Subscription.query.filter_by(status=SubscriptionStatus.past_due).count()
-        cancelled = Subscription.query.filter_by(status=SubscriptionStatus.cancelled).count()
-        expired = Subscription.query.filter_by(status=SubscriptionStatus.expired).count()
         
-        # Calculate MRR (Monthly Recurring Revenue)
-        active_subs = Subscription.query.filter_by(status=SubscriptionStatus.active, grandfathered=False).all()
-        mrr = sum([sub.tier.price_monthly for sub in active_subs if sub.tier])
+        # Calculate MRR (Monthly Recurring Revenue) in the database
+        mrr = db.session.query(db.func.sum(Tier.price_monthly)).join(
+            Subscription, Subscription.tier_id == Tier.id
+        ).filter(
+            Subscription.status == SubscriptionStatus.active,
+            Subscription.grandfathered == False
+        ).scalar() or 0
         
         return {
-            'total': total,
-            'active': active,
+            'total': sum(counts.values()),
+            'active': counts.get(SubscriptionStatus.active, 0),
             'grandfathered': grandfathered,
-            'past_due': past_due,
-            'cancelled': cancelled,
-            'expired': expired,
+            'past_due': counts.get(SubscriptionStatus.past_due, 0),
+            'cancelled': counts.get(SubscriptionStatus.cancelled, 0),
+            'expired': counts.get(SubscriptionStatus.expired, 0),
             'mrr': round(mrr, 2)
         }
     except Exception as e:
         print(f"Error fetching subscription stats: {str(e)}")
         return {'total': 0, 'active': 0, 'grandfathered': 0, 'past_due': 0, 'cancelled': 0, 'expired': 0, 'mrr': 0}
 
+def take_subscription_snapshot(day):
+    """Write (or overwrite) day's per-tier snapshot row; returns the number of tiers recorded.
+    
+    One grouped query counts every tier at once. Active, past due and MRR are
+    as of now, so this is meant to run just after the day ends; new comes
+    from created_at and churned from the day's subscription_events.
+    """
+    start = datetime.combine(day, datetime.min.time())
+    end = start + timedelta(days=1)
+    
+    def count_if(*conditions):
+        return db.func.coalesce(db.func.sum(db.case((db.and_(*conditions), 1), else_=0)), 0)
+    
+    entitled = Subscription.status.in_([SubscriptionStatus.active, SubscriptionStatus.past_due])
+    # Churn comes from the day's transitions out of an entitled status (an occurred_at range scan)
+    churned_by_tier = dict(db.session.query(Subscription.tier_id, db.func.count(SubscriptionEvent.id)).join(
+        Subscription, Subscription.id == SubscriptionEvent.subscription_id
+    ).filter(
+        SubscriptionEvent.occurred_at >= start,
+        SubscriptionEvent.occurred_at < end,
+        SubscriptionEvent.from_status.in_([SubscriptionStatus.active, SubscriptionStatus.past_due]),
+        SubscriptionEvent.status.in_([SubscriptionStatus.cancelled, SubscriptionStatus.expired])
+    ).group_by(Subscription.tier_id).all())
+    rows = db.session.query(
+        Subscription.tier_id,
+        count_if(Subscription.status == SubscriptionStatus.active),
+        count_if(Subscription.status == SubscriptionStatus.past_due),
+        count_if(entitled, Subscription.grandfathered == True),
+        count_if(Subscription.created_at >= start, Subscription.created_at < end),
+        db.func.coalesce(db.func.sum(db.case(
+            (db.and_(Subscription.status == SubscriptionStatus.active, Subscription.grandfathered == False),
+             Tier.price_monthly), else_=0
+        )), 0)
+    ).join(Tier, Tier.id == Subscription.tier_id).group_by(Subscription.tier_id).all()
+    
+    try:
+        if rows:
+            upsert = _dialect_insert(SubscriptionSnapshot)
+            upsert = upsert.on_conflict_do_update(
+                index_elements=['day', 'tier_id'],
+                set_={column: getattr(upsert.excluded, column)
+                      for column in ('active', 'past_due', 'grandfathered', 'new', 'churned', 'mrr', 'created_at')}
+            )
+            now = datetime.utcnow()
+            db.session.execute(upsert, [
+                {'day': day, 'tier_id': tier_id, 'active': active, 'past_due': past_due,
+                 'grandfathered': grandfathered, 'new': new, 'churned': churned_by_tier.get(tier_id, 0),
+                 'mrr': round(mrr, 2), 'created_at': now}
+                for tier_id, active, past_due, grandfathered, new, mrr in rows
+            ])
+        db.session.commit()
+        return len(rows)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving subscription snapshot: {str(e)}")
+        raise
+
+def get_subscription_history(subscription_id):
+    """One subscription's events, oldest first (a range scan of its (subscription_id, occurred_at) index)."""
+    return SubscriptionEvent.query.filter_by(subscription_id=subscription_id).order_by(
+        SubscriptionEvent.occurred_at, SubscriptionEvent.id
+    ).all()
+
+def _status_as_of(moment):
+    """Subquery of (subscription_id, status) from each subscription's latest event at or before moment."""
+    ranked = db.select(
+        SubscriptionEvent.subscription_id,
+        SubscriptionEvent.status,
+        db.func.row_number().over(
+            partition_by=SubscriptionEvent.subscription_id,
+            order_by=(SubscriptionEvent.occurred_at.desc(), SubscriptionEvent.id.desc())
+        ).label('position')
+    ).where(SubscriptionEvent.occurred_at <= moment).subquery()
+    return db.select(ranked.c.subscription_id, ranked.c.status).where(ranked.c.position == 1).subquery()
+
+def get_status_counts_at(moment):
+    """Count subscriptions per status as they stood at moment (statuses with none are omitted)."""
+    state = _status_as_of(moment)
+    rows = db.session.execute(db.select(state.c.status, db.func.count()).group_by(state.c.status))
+    return {status.value: count for status, count in rows}
+
+def get_subscription_ids_at(moment, statuses=(SubscriptionStatus.active, SubscriptionStatus.past_due)):
+    """IDs of the subscriptions that were in one of statuses at moment."""
+    state = _status_as_of(moment)
+    return db.session.execute(
+        db.select(state.c.subscription_id).where(state.c.status.in_(statuses)).order_by(state.c.subscription_id)
+    ).scalars().all()
+
+def count_status_transitions(start, end):
+    """Count status changes in [start, end) as {(from_status, status): n}; from_status None is a creation."""
+    rows = db.session.query(
+        SubscriptionEvent.from_status, SubscriptionEvent.status, db.func.count(SubscriptionEvent.id)
+    ).filter(
+        SubscriptionEvent.occurred_at >= start,
+        SubscriptionEvent.occurred_at < end,
+        db.or_(SubscriptionEvent.from_status.is_(None), SubscriptionEvent.from_status != SubscriptionEvent.status)
+    ).group_by(SubscriptionEvent.from_status, SubscriptionEvent.status)
+    return {(from_status.value if from_status else None, status.value): count
+            for from_status, status, count in rows}
+
+def seed_subscription_event_chunk(after_id=0, chunk_size=1000):
+    """Give the next chunk of subscriptions that have no history a best-effort starting history.
+    
+    Each gets a creation event at created_at and, unless it is still active,
+    an event into its current status at updated_at (the only record of when
+    that change happened). Returns (subscriptions seeded, last id seen).
+    """
+    try:
+        has_events = db.select(SubscriptionEvent.id).where(
+            SubscriptionEvent.subscription_id == Subscription.id
+        ).exists()
+        rows = db.session.execute(
+            db.select(Subscription.id, Subscription.created_at, Subscription.updated_at,
+                      *(getattr(Subscription, field) for field in TRACKED_SUBSCRIPTION_FIELDS))
+            .where(Subscription.id > after_id)
+            .where(~has_events)
+            .order_by(Subscription.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return 0, after_id
+        
+        events = []
+        for row in rows:
+            state = {field: getattr(row, field) for field in TRACKED_SUBSCRIPTION_FIELDS}
+            created_at = row.created_at or datetime.utcnow()
+            if row.status == SubscriptionStatus.active:
+                events.append(dict(state, subscription_id=row.id, occurred_at=created_at, from_status=None, source='seed'))
+                continue
+            events.append(dict(state, subscription_id=row.id, occurred_at=created_at, from_status=None,
+                               status=SubscriptionStatus.active, source='seed'))
+            events.append(dict(state, subscription_id=row.id, occurred_at=max(row.updated_at or created_at, created_at),
+                               from_status=SubscriptionStatus.active, source='seed'))
+        db.session.execute(db.insert(SubscriptionEvent), events)
+        db.session.commit()
+        return len(rows), rows[-1].id
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error seeding subscription events after {after_id}: {str(e)}")
+        raise
+
+def get_server_loads():
+    """Count subscriptions with access per Plex server (key None = placed before multi-server)."""
+    try:
+        rows = db.session.query(Subscription.plex_server, db.func.count(Subscription.id)).filter(
+            Subscription.status.in_([SubscriptionStatus.active, SubscriptionStatus.past_due])
+        ).group_by(Subscription.plex_server).all()
+        return dict(rows)
+    except Exception as e:
+        print(f"Error counting subscriptions per server: {str(e)}")
+        return {}
+
+def set_subscription_server(subscription_id, server_name):
+    """Record which Plex server a subscription was invited to."""
+    try:
+        db.session.execute(
+            db.update(Subscription).where(Subscription.id == subscription_id).values(plex_server=server_name)
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error recording Plex server for subscription {subscription_id}: {str(e)}")
+        raise
+
+def get_subscription_rows(status=None, search=None, limit=None):
+    """Subscriptions for list views as SubscriptionRow tuples, newest first."""
+    query = select_subscription_rows().order_by(Subscription.created_at.desc())
+    if status:
+        query = query.where(Subscription.status == status)
+    if search:
+        query = query.where(db.or_(Subscription.email.ilike(f'%{search}%'),
+                                   Subscription.plex_username.ilike(f'%{search}%')))
+    if limit:
+        query = query.limit(limit)
+    return fetch_rows(SubscriptionRow, query)
+
 def get_active_subscriptions(limit=None):
     """Get active subscriptions."""
     try:
-        query = Subscription.query.filter_by(status=SubscriptionStatus.active).order_by(Subscription.created_at.desc())
-        if limit:
-            query = query.limit(limit)
-        subscriptions = query.all()
-        return [sub.to_dict() for sub in subscriptions]
+        return get_subscription_rows(status=SubscriptionStatus.active, limit=limit)
     except Exception as e:
         print(f"Error fetching active subscriptions: {str(e)}")
         return []
@@ -250,11 +766,7 @@ def get_active_subscriptions(limit=None):
 def get_subscriptions_by_status(status, limit=None):
     """Get subscriptions by status."""
     try:
-        query = Subscription.query.filter_by(status=status).order_by(Subscription.created_at.desc())
-        if limit:
-            query = query.limit(limit)
-        subscriptions = query.all()
-        return [sub.to_dict() for sub in subscriptions]
+        return get_subscription_rows(status=status, limit=limit)
     except Exception as e:
         print(f"Error fetching subscriptions by status: {str(e)}")
         return []
@@ -268,9 +780,101 @@ def get_subscription_by_stripe_id(stripe_subscription_id):
         print(f"Error fetching subscription by Stripe ID: {str(e)}")
         return None
 
+def find_entitled_subscription(*identities, grandfathered=None):
+    """Return the active or past-due subscription for any of the given emails/Plex usernames, or None.
+    
+    Matching is on the casefolded, trimmed identity columns, so it is an
+    index seek and case variants are found. ``grandfathered`` limits the
+    match to free (True) or paid (False) subscriptions.
+    """
+    normalized = {normalize_identity(identity) for identity in identities if identity}
+    if not normalized:
+        return None
+    query = Subscription.query.filter(
+        Subscription.status.in_(ENTITLED_STATUSES),
+        db.or_(Subscription.plex_username_normalized.in_(normalized), Subscription.email_normalized.in_(normalized))
+    )
+    if grandfathered is not None:
+        query = query.filter(Subscription.grandfathered == grandfathered)
+    return query.order_by(Subscription.id).first()
+
+# Normalized identity columns per model: (source column, normalized column)
+IDENTITY_COLUMNS = {
+    Subscription: (('email', 'email_normalized'), ('plex_username', 'plex_username_normalized')),
+    InviteRequest: (('email_or_username', 'email_or_username_normalized'),),
+}
+
+def backfill_identity_chunk(model, after_id=0, chunk_size=1000):
+    """Fill the normalized identity columns of the next chunk of rows that lack them.
+    
+    Reads only ids and source columns and writes one executemany UPDATE per
+    chunk, committed on its own. Returns (rows filled, last id seen).
+    """
+    columns = IDENTITY_COLUMNS[model]
+    try:
+        rows = db.session.execute(
+            db.select(model.id, *(getattr(model, source) for source, _ in columns))
+            .where(model.id > after_id)
+            .where(db.or_(*(getattr(model, target).is_(None) for _, target in columns)))
+            .order_by(model.id)
+            .limit(chunk_size)
+        ).all()
+        if not rows:
+            return 0, after_id
+        db.session.execute(db.update(model), [
+            dict({target: normalize_identity(getattr(row, source)) for source, target in columns}, id=row.id)
+            for row in rows
+        ])
+        db.session.commit()
+        return len(rows), rows[-1].id
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error backfilling {model.__tablename__} identities after {after_id}: {str(e)}")
+        raise
+
+def find_duplicate_identities(limit=50):
+    """Plex identities with more than one entitled subscription of the same kind.
+    
+    Returns dicts of identity, grandfathered and count; these block
+    uq_subscriptions_entitled_identity until an admin resolves them.
+    """
+    rows = db.session.query(
+        Subscription.plex_username_normalized, Subscription.grandfathered, db.func.count(Subscription.id)
+    ).filter(
+        Subscription.status.in_(ENTITLED_STATUSES),
+        Subscription.plex_username_normalized.isnot(None)
+    ).group_by(
+        Subscription.plex_username_normalized, Subscription.grandfathered
+    ).having(db.func.count(Subscription.id) > 1).order_by(Subscription.plex_username_normalized).limit(limit)
+    return [{'identity': identity, 'grandfathered': grandfathered, 'count': count}
+            for identity, grandfathered, count in rows]
+
+def ensure_identity_unique_index():
+    """Create uq_subscriptions_entitled_identity if no duplicates block it; returns True if it exists."""
+    if find_duplicate_identities(limit=1):
+        return False
+    entitled_identity_index.create(db.engine, checkfirst=True)
+    return True
+
+# Subscription columns whose changes are recorded in subscription_events
+TRACKED_SUBSCRIPTION_FIELDS = ('status', 'current_period_start', 'current_period_end', 'cancel_at_period_end')
+
+def record_subscription_event(subscription, from_status, source, occurred_at=None):
+    """Add a history row with subscription's current state to the session (committed by the caller)."""
+    db.session.add(SubscriptionEvent(
+        subscription_id=subscription.id,
+        occurred_at=occurred_at or subscription.updated_at or datetime.utcnow(),
+        from_status=from_status,
+        status=subscription.status,
+        current_period_start=subscription.current_period_start,
+        current_period_end=subscription.current_period_end,
+        cancel_at_period_end=subscription.cancel_at_period_end,
+        source=source
+    ))
+
 def create_subscription(email, plex_username, tier_id, stripe_customer_id=None, stripe_subscription_id=None, 
-                       current_period_start=None, current_period_end=None, grandfathered=False):
-    """Create a new subscription record."""
+                       current_period_start=None, current_period_end=None, grandfathered=False, source='app'):
+    """Create a new subscription record (and its first history event)."""
     try:
         subscription = Subscription(
             email=email,
@@ -284,18 +888,66 @@ def create_subscription(email, plex_username, tier_id, stripe_customer_id=None,
             grandfathered=grandfathered
         )
         db.session.add(subscription)
+        db.session.flush()
+        record_subscription_event(subscription, None, source)
         db.session.commit()
+        publish_event('subscription', subscription_event(subscription),
+                      key=('subscription', subscription.id, subscription.updated_at.isoformat()))
         return subscription
+    except IntegrityError as e:
+        # Lost a race with another request for the same identity (or Stripe subscription)
+        db.session.rollback()
+        print(f"Error creating subscription: {str(e)}")
+        raise ValueError(f"A subscription for {plex_username} already exists")
     except Exception as e:
         db.session.rollback()
         print(f"Error creating subscription: {str(e)}")
         raise
 
-def update_subscription_status(subscription_id, status, current_period_end=None, cancel_at_period_end=None):
-    """Update subscription status and billing period."""
+# Every Stripe subscription status; only active/trialing (and past_due, in its grace period) are entitled
+STRIPE_STATUSES = {
+    'active': SubscriptionStatus.active,
+    'trialing': SubscriptionStatus.active,
+    'past_due': SubscriptionStatus.past_due,
+    'canceled': SubscriptionStatus.cancelled,
+    'incomplete_expired': SubscriptionStatus.cancelled,  # first payment never completed
+    'incomplete': SubscriptionStatus.expired,  # first payment still pending
+    'unpaid': SubscriptionStatus.expired,
+    'paused': SubscriptionStatus.expired,
+}
+
+def status_from_stripe(stripe_status):
+    """Map a Stripe subscription status to our SubscriptionStatus (unknown statuses are not entitled)."""
+    status = STRIPE_STATUSES.get(stripe_status)
+    if status is None:
+        print(f"Unknown Stripe subscription status '{stripe_status}', treating as expired")
+        return SubscriptionStatus.expired
+    return status
+
+def update_subscription_status(subscription_id, status, current_period_end=None, cancel_at_period_end=None,
+                               event_created=None, source='app'):
+    """Update subscription status and billing period.
+    
+    When ``event_created`` (the Stripe event timestamp) is given, the update is
+    skipped if a newer event has already been applied, and None is returned.
+    Rows no event has touched yet are compared against ``updated_at``, so a
+    replayed old event can't overwrite state written since.
+    A change is recorded in subscription_events in the same transaction,
+    attributed to ``source``.
+    """
     try:
-        subscription = Subscription.query.get(subscription_id)
+        subscription = Subscription.query.filter_by(id=subscription_id).with_for_update().first()
         if subscription:
+            if event_created:
+                floor = subscription.last_event_at or subscription.updated_at
+                if floor and event_created < floor:
+                    db.session.rollback()
+                    print(f"Skipping stale event for subscription {subscription_id} "
+                          f"({event_created} < {floor})")
+                    return None
+                subscription.last_event_at = event_created
+            
+            before = tuple(getattr(subscription, field) for field in TRACKED_SUBSCRIPTION_FIELDS)
             if isinstance(status, str):
                 subscription.status = SubscriptionStatus[status]
             else:
@@ -307,7 +959,11 @@ def update_subscription_status(subscription_id, status, current_period_end=None,
                 subscription.cancel_at_period_end = cancel_at_period_end
             
             subscription.updated_at = datetime.utcnow()
+            if tuple(getattr(subscription, field) for field in TRACKED_SUBSCRIPTION_FIELDS) != before:
+                record_subscription_event(subscription, before[0], source)
             db.session.commit()
+            publish_event('subscription', subscription_event(subscription),
+                          key=('subscription', subscription.id, subscription.updated_at.isoformat()))
             return subscription
         return None
     except Exception as e:
@@ -315,18 +971,12 @@ def update_subscription_status(subscription_id, status, current_period_end=None,
         print(f"Error updating subscription status: {str(e)}")
         raise
 
-def grandfather_existing_users():
-    """Create permanent subscriptions for existing successful invites."""
+def get_grandfathered_tier_id():
+    """Return the id of the free "Grandfathered" tier, creating it if needed."""
     try:
-        # Get all successful invites that don't have a subscription
-        invites = InviteRequest.query.filter_by(status='success').filter(
-            InviteRequest.subscription_id.is_(None)
-        ).all()
-        
-        # Get or create a default tier for grandfathered users
-        default_tier = Tier.query.filter_by(name="Grandfathered").first()
-        if not default_tier:
-            default_tier = Tier(
+        tier = Tier.query.filter_by(name="Grandfathered").first()
+        if not tier:
+            tier = Tier(
                 name="Grandfathered",
                 description="Legacy users with permanent free access",
                 price_monthly=0.0,
@@ -334,32 +984,518 @@ def grandfather_existing_users():
                 library_names=[],
                 active=True
             )
-            db.session.add(default_tier)
-            db.session.flush()
+            db.session.add(tier)
+            db.session.commit()
+        return tier.id
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error creating grandfathered tier: {str(e)}")
+        raise
+
+def count_ungrandfathered_invites(after_id=0):
+    """Count successful invites after after_id that have no subscription yet."""
+    return InviteRequest.query.filter(
+        InviteRequest.status == 'success',
+        InviteRequest.subscription_id.is_(None),
+        InviteRequest.id > after_id
+    ).count()
+
+def grandfather_invite_chunk(tier_id, after_id=0, chunk_size=1000):
+    """Turn the next chunk of unlinked successful invites into grandfathered subscriptions.
+    
+    Reads only the columns it needs (no ORM objects build up in the session),
+    inserts the subscriptions in one statement with RETURNING ids, links each
+    invite with one executemany UPDATE and commits, so every chunk is all or
+    nothing. Invites locked by a concurrent run are skipped. A user invited
+    more than once (in any letter case) gets one subscription: repeat invites
+    are linked to it, or to the grandfathered subscription they already have.
+    Returns (invites handled, last invite id seen); 0 means no invites remain.
+    """
+    try:
+        invites = db.session.execute(
+            db.select(InviteRequest.id, InviteRequest.email_or_username, InviteRequest.timestamp)
+            .where(InviteRequest.status == 'success')
+            .where(InviteRequest.subscription_id.is_(None))
+            .where(InviteRequest.id > after_id)
+            .order_by(InviteRequest.id)
+            .limit(chunk_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not invites:
+            db.session.rollback()
+            return 0, after_id
         
-        count = 0
+        # First invite per identity in this chunk, skipping users already grandfathered
+        first_invites = {}
         for invite in invites:
-            subscription = Subscription(
-                email=invite.email_or_username,
-                plex_username=invite.email_or_username,
-                tier_id=default_tier.id,
-                status=SubscriptionStatus.active,
-                grandfathered=True,
-                current_period_start=invite.timestamp,
-                current_period_end=None,  # No expiry for grandfathered users
-                stripe_customer_id=None,
-                stripe_subscription_id=None
-            )
-            db.session.add(subscription)
+            first_invites.setdefault(normalize_identity(invite.email_or_username), invite)
+        subscription_ids = dict(db.session.execute(
+            db.select(Subscription.plex_username_normalized, Subscription.id)
+            .where(Subscription.plex_username_normalized.in_(first_invites))
+            .where(Subscription.grandfathered == True)
+            .where(Subscription.status.in_(ENTITLED_STATUSES))
+        ).all())
+        new_invites = [invite for identity, invite in first_invites.items() if identity not in subscription_ids]
+        
+        now = datetime.utcnow()
+        if new_invites:
+            created_ids = db.session.execute(
+                db.insert(Subscription).returning(Subscription.id, sort_by_parameter_order=True),
+                [{
+                    'email': invite.email_or_username,
+                    'plex_username': invite.email_or_username,
+                    'tier_id': tier_id,
+                    'status': SubscriptionStatus.active,
+                    'grandfathered': True,
+                    'cancel_at_period_end': False,
+                    'current_period_start': invite.timestamp,
+                    'current_period_end': None,  # No expiry for grandfathered users
+                    'created_at': now,
+                    'updated_at': now
+                } for invite in new_invites]
+            ).scalars().all()
             
-            # Link the invite to the subscription
-            invite.subscription_id = subscription.id
-            invite.free_tier = True
-            count += 1
+            db.session.execute(db.insert(SubscriptionEvent), [{
+                'subscription_id': subscription_id,
+                'occurred_at': now,
+                'from_status': None,
+                'status': SubscriptionStatus.active,
+                'current_period_start': invite.timestamp,
+                'current_period_end': None,
+                'cancel_at_period_end': False,
+                'source': 'grandfather'
+            } for invite, subscription_id in zip(new_invites, created_ids)])
+            subscription_ids.update(
+                (normalize_identity(invite.email_or_username), subscription_id)
+                for invite, subscription_id in zip(new_invites, created_ids)
+            )
+        
+        # Link each invite to its user's subscription
+        db.session.execute(db.update(InviteRequest), [
+            {'id': invite.id, 'subscription_id': subscription_ids[normalize_identity(invite.email_or_username)],
+             'free_tier': True}
+            for invite in invites
+        ])
+        db.session.commit()
+        return len(invites), invites[-1].id
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error grandfathering invites after {after_id}: {str(e)}")
+        raise
+
+def get_job_checkpoint(name):
+    """Get the checkpoint row for a background job, or None."""
+    return db.session.get(JobCheckpoint, name)
+
+def save_job_checkpoint(name, last_run_at=None, data=None):
+    """Create or update the checkpoint row for a background job."""
+    try:
+        checkpoint = db.session.get(JobCheckpoint, name)
+        if not checkpoint:
+            checkpoint = JobCheckpoint(name=name)
+            db.session.add(checkpoint)
+        if last_run_at is not None:
+            checkpoint.last_run_at = last_run_at
+        if data is not None:
+            checkpoint.data = data
+        checkpoint.updated_at = datetime.utcnow()
+        db.session.commit()
+        if checkpoint.data is not None:
+            publish_event('job', job_event(checkpoint), key=('job', name, checkpoint.updated_at.isoformat()))
+        return checkpoint
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving job checkpoint {name}: {str(e)}")
+        raise
+
+def archive_invite_chunk(cutoff, after=None, batch_size=1000):
+    """Roll up, archive and delete the next batch of invite requests older than cutoff.
+    
+    The batch's counts are added to the daily rollups, its rows are written
+    as one compressed archive record and then deleted, all in one short
+    transaction, so a batch is either fully archived or untouched. Successful
+    invites without a subscription are kept: they are the only record of
+    that user's access and grandfathering reads them. Rows locked by a
+    concurrent run are skipped. after is the (timestamp, id) cursor returned
+    by the previous call. Returns (rows archived, cursor); 0 means done.
+    """
+    key = db.tuple_(InviteRequest.timestamp, InviteRequest.id)
+    query = (
+        db.select(InviteRequest.id, InviteRequest.email_or_username, InviteRequest.timestamp,
+                  InviteRequest.status, InviteRequest.error_message, InviteRequest.subscription_id,
+                  InviteRequest.free_tier)
+        .where(InviteRequest.timestamp < cutoff)
+        .where(db.not_(db.and_(InviteRequest.status == 'success', InviteRequest.subscription_id.is_(None))))
+        .order_by(InviteRequest.timestamp, InviteRequest.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    if after:
+        query = query.where(key > after)
+    
+    try:
+        rows = db.session.execute(query).all()
+        if not rows:
+            db.session.rollback()
+            return 0, after
         
+        rollups = Counter((row.timestamp.date(), row.status, row.free_tier) for row in rows)
+        upsert = _dialect_insert(InviteRequestDailyRollup)
+        upsert = upsert.on_conflict_do_update(
+            index_elements=['day', 'status', 'free_tier'],
+            set_={'total': InviteRequestDailyRollup.__table__.c.total + upsert.excluded.total}
+        )
+        db.session.execute(upsert, [
+            {'day': day, 'status': status, 'free_tier': free_tier, 'total': total}
+            for (day, status, free_tier), total in rollups.items()
+        ])
+        
+        lines = (json.dumps({**row._asdict(), 'timestamp': row.timestamp.isoformat()}) for row in rows)
+        db.session.add(InviteRequestArchive(
+            first_invite_id=min(row.id for row in rows),
+            last_invite_id=max(row.id for row in rows),
+            first_timestamp=rows[0].timestamp,
+            last_timestamp=rows[-1].timestamp,
+            row_count=len(rows),
+            payload=gzip.compress('\n'.join(lines).encode() + b'\n')
+        ))
+        db.session.execute(db.delete(InviteRequest).where(InviteRequest.id.in_([row.id for row in rows])))
+        db.session.commit()
+        return len(rows), (rows[-1].timestamp, rows[-1].id)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error archiving invite requests: {str(e)}")
+        raise
+
+def _dialect_insert(model):
+    """Return an INSERT construct supporting ON CONFLICT for the current database."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model.__table__)
+
+def claim_job_run(name, min_interval):
+    """Atomically claim a job run unless one started within min_interval (a timedelta).
+    
+    Every gunicorn worker runs the scheduler, so jobs that must run once use
+    this to let exactly one worker proceed.
+    """
+    try:
+        now = datetime.utcnow()
+        db.session.execute(
+            _dialect_insert(JobCheckpoint).values(name=name, updated_at=now).on_conflict_do_nothing()
+        )
+        result = db.session.execute(
+            db.update(JobCheckpoint)
+            .where(JobCheckpoint.name == name)
+            .where(db.or_(JobCheckpoint.last_run_at.is_(None), JobCheckpoint.last_run_at < now - min_interval))
+            .values(last_run_at=now, updated_at=now)
+        )
+        db.session.commit()
+        return result.rowcount == 1
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error claiming job run {name}: {str(e)}")
+        raise
+
+def claim_flight(key, flight_id, lease):
+    """Make flight_id the owner of key unless another call holds it; returns the key's row afterwards.
+    
+    A pending row is taken over only once its lease (a timedelta) has
+    expired; a finished one is taken over right away. Callers already
+    waiting on a call poll with ``get_flight`` instead, so they see its
+    outcome rather than taking the finished row over. Runs on its own
+    connection, independent of the caller's session.
+    """
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(
+            _dialect_insert(InFlightRequest)
+            .values(key=key, flight_id=flight_id, status='pending', started_at=now)
+            .on_conflict_do_nothing()
+        )
+        conn.execute(
+            db.update(InFlightRequest)
+            .where(InFlightRequest.key == key)
+            .where(InFlightRequest.flight_id != flight_id)
+            .where(db.or_(
+                db.and_(InFlightRequest.status == 'pending', InFlightRequest.started_at < now - lease),
+                InFlightRequest.status != 'pending'
+            ))
+            .values(flight_id=flight_id, status='pending', result=None, started_at=now, finished_at=None)
+        )
+        return conn.execute(
+            db.select(InFlightRequest.flight_id, InFlightRequest.status, InFlightRequest.result,
+                      InFlightRequest.started_at)
+            .where(InFlightRequest.key == key)
+        ).one()
+
+def get_flight(key):
+    """Read the key's row (flight_id, status, result, started_at) without claiming it, or None."""
+    with db.engine.connect() as conn:
+        return conn.execute(
+            db.select(InFlightRequest.flight_id, InFlightRequest.status, InFlightRequest.result,
+                      InFlightRequest.started_at)
+            .where(InFlightRequest.key == key)
+        ).one_or_none()
+
+def finish_flight(key, flight_id, status, result):
+    """Record the outcome of flight_id (if it still owns key) for callers waiting on it."""
+    with db.engine.begin() as conn:
+        conn.execute(
+            db.update(InFlightRequest)
+            .where(InFlightRequest.key == key)
+            .where(InFlightRequest.flight_id == flight_id)
+            .values(status=status, result=result, finished_at=datetime.utcnow())
+        )
+
+def bulk_update_subscriptions(rows, source='app'):
+    """Apply a list of column dicts (each with 'id') as one executemany UPDATE.
+    
+    Rows that change a tracked field get a subscription_events row in the
+    same transaction (the caller commits); the previous values are read
+    with one query per call.
+    """
+    if not rows:
+        return 0
+    for row in rows:
+        for source, target in IDENTITY_COLUMNS[Subscription]:
+            if source in row:
+                row[target] = normalize_identity(row[source])
+    tracked = [row for row in rows if any(field in row for field in TRACKED_SUBSCRIPTION_FIELDS)]
+    current = {}
+    if tracked:
+        current = {row.id: row for row in db.session.execute(
+            db.select(Subscription.id, *(getattr(Subscription, field) for field in TRACKED_SUBSCRIPTION_FIELDS))
+            .where(Subscription.id.in_([row['id'] for row in tracked]))
+        )}
+    db.session.execute(db.update(Subscription), rows)
+    
+    events = []
+    now = datetime.utcnow()
+    for row in tracked:
+        before = current.get(row['id'])
+        if before is None:
+            continue
+        after = {field: row.get(field, getattr(before, field)) for field in TRACKED_SUBSCRIPTION_FIELDS}
+        if all(after[field] == getattr(before, field) for field in TRACKED_SUBSCRIPTION_FIELDS):
+            continue
+        events.append(dict(after, subscription_id=row['id'], from_status=before.status,
+                           occurred_at=row.get('updated_at', now), source=source))
+    if events:
+        db.session.execute(db.insert(SubscriptionEvent), events)
+    return len(rows)
+
+def bulk_insert_subscriptions(rows, source='app'):
+    """Insert subscription rows, skipping any that conflict with an existing one.
+    
+    A conflict is an existing stripe_subscription_id or, once the unique
+    identity index exists, a second paid subscription for the same Plex user.
+    
+    Each inserted row gets its creating subscription_events row in the same
+    transaction (the caller commits).
+    """
+    if not rows:
+        return 0
+    stmt = _dialect_insert(Subscription).on_conflict_do_nothing()
+    inserted = db.session.execute(
+        stmt.returning(Subscription.id, Subscription.created_at,
+                       *(getattr(Subscription, field) for field in TRACKED_SUBSCRIPTION_FIELDS)),
+        rows
+    ).all()
+    if inserted:
+        db.session.execute(db.insert(SubscriptionEvent), [
+            {'subscription_id': row.id, 'occurred_at': row.created_at, 'from_status': None, 'source': source,
+             **{field: getattr(row, field) for field in TRACKED_SUBSCRIPTION_FIELDS}}
+            for row in inserted
+        ])
+    return len(inserted)
+
+def is_event_processed(event_id):
+    """Check whether a Stripe event has already been handled."""
+    return db.session.get(ProcessedStripeEvent, event_id) is not None
+
+def get_processed_event_ids(event_ids):
+    """Return the subset of event IDs that have already been handled."""
+    if not event_ids:
+        return set()
+    rows = db.session.query(ProcessedStripeEvent.event_id).filter(
+        ProcessedStripeEvent.event_id.in_(list(event_ids))
+    )
+    return {event_id for (event_id,) in rows}
+
+def mark_event_processed(event_id, event_type, created):
+    """Record a handled Stripe event (no-op if another worker already recorded it)."""
+    try:
+        stmt = _dialect_insert(ProcessedStripeEvent).on_conflict_do_nothing(index_elements=['event_id'])
+        db.session.execute(stmt, {
+            'event_id': event_id,
+            'event_type': event_type,
+            'created': created,
+            'processed_at': datetime.utcnow()
+        })
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error recording processed event {event_id}: {str(e)}")
+        raise
+
+# Deferred actions that failed this many times are left for an admin to look at
+MAX_DEFERRED_ATTEMPTS = 10
+
+def defer_plex_action(action, email_or_username, tier_id=None, subscription_id=None):
+    """Queue a Plex invite or revoke to be retried once Plex is reachable again."""
+    try:
+        deferred = DeferredPlexAction(
+            action=action,
+            email_or_username=email_or_username,
+            tier_id=tier_id,
+            subscription_id=subscription_id
+        )
+        db.session.add(deferred)
+        db.session.commit()
+        return deferred.id
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error deferring Plex action: {str(e)}")
+        raise
+
+def claim_deferred_plex_action(after_id=0):
+    """Lock and return the oldest retryable deferred action after after_id, skipping ones other workers hold."""
+    return DeferredPlexAction.query.filter(
+        DeferredPlexAction.id > after_id,
+        DeferredPlexAction.attempts < MAX_DEFERRED_ATTEMPTS
+    ).order_by(DeferredPlexAction.id).with_for_update(skip_locked=True).first()
+
+def get_deferred_plex_action_counts():
+    """Counts of queued deferred Plex actions (pending retry and given up)."""
+    try:
+        pending = DeferredPlexAction.query.filter(DeferredPlexAction.attempts < MAX_DEFERRED_ATTEMPTS).count()
+        stuck = DeferredPlexAction.query.filter(DeferredPlexAction.attempts >= MAX_DEFERRED_ATTEMPTS).count()
+        return {'pending': pending, 'stuck': stuck}
+    except Exception as e:
+        print(f"Error counting deferred Plex actions: {str(e)}")
+        return {'pending': 0, 'stuck': 0}
+
+# Tier permission updates that failed this many times are marked 'failed'
+MAX_TIER_SYNC_ATTEMPTS = 5
+
+def enqueue_tier_permission_sync(tier_id, chunk_size=500):
+    """Queue every entitled subscriber of a tier for a Plex permission update.
+    
+    Replaces any earlier queue for the tier, so a second edit restarts the
+    rollout with the newest settings. Subscriptions are read in id order a
+    chunk at a time and inserted in bulk. Returns the number queued.
+    """
+    try:
+        db.session.execute(db.delete(TierPermissionSync).where(TierPermissionSync.tier_id == tier_id))
+        now = datetime.utcnow()
+        count = 0
+        last_id = 0
+        while True:
+            ids = db.session.execute(
+                db.select(Subscription.id)
+                .where(Subscription.tier_id == tier_id)
+                .where(Subscription.status.in_([SubscriptionStatus.active, SubscriptionStatus.past_due]))
+                .where(Subscription.id > last_id)
+                .order_by(Subscription.id)
+                .limit(chunk_size)
+            ).scalars().all()
+            if not ids:
+                break
+            db.session.execute(
+                db.insert(TierPermissionSync),
+                [{'tier_id': tier_id, 'subscription_id': subscription_id, 'status': 'pending',
+                  'attempts': 0, 'updated_at': now} for subscription_id in ids]
+            )
+            count += len(ids)
+            last_id = ids[-1]
         db.session.commit()
         return count
     except Exception as e:
         db.session.rollback()
-        print(f"Error grandfathering existing users: {str(e)}")
+        print(f"Error queueing tier permission sync for tier {tier_id}: {str(e)}")
         raise
+
+def claim_tier_permission_syncs(limit, lease, after_id=0):
+    """Claim up to limit queued updates after after_id (and ones whose claim is older than lease, a timedelta).
+    
+    Returns [(sync id, subscription id, tier id, attempts)]. The conditional
+    UPDATE means two workers never both win the same row.
+    """
+    try:
+        now = datetime.utcnow()
+        claimable = db.or_(
+            TierPermissionSync.status == 'pending',
+            db.and_(TierPermissionSync.status == 'running', TierPermissionSync.claimed_at < now - lease)
+        )
+        ids = db.session.execute(
+            db.select(TierPermissionSync.id)
+            .where(claimable)
+            .where(TierPermissionSync.id > after_id)
+            .order_by(TierPermissionSync.id)
+            .limit(limit)
+        ).scalars().all()
+        if not ids:
+            return []
+        token = uuid.uuid4().hex
+        db.session.execute(
+            db.update(TierPermissionSync)
+            .where(TierPermissionSync.id.in_(ids))
+            .where(claimable)
+            .values(status='running', claimed_by=token, claimed_at=now, updated_at=now)
+        )
+        db.session.commit()
+        return db.session.execute(
+            db.select(TierPermissionSync.id, TierPermissionSync.subscription_id,
+                      TierPermissionSync.tier_id, TierPermissionSync.attempts)
+            .where(TierPermissionSync.claimed_by == token)
+            .order_by(TierPermissionSync.id)
+        ).all()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error claiming tier permission syncs: {str(e)}")
+        raise
+
+def finish_tier_permission_syncs(done_ids, failures=(), released_ids=()):
+    """Record a processed chunk: done ids, (id, attempts, error) failures and ids to hand back untouched."""
+    try:
+        now = datetime.utcnow()
+        if done_ids:
+            db.session.execute(
+                db.update(TierPermissionSync).where(TierPermissionSync.id.in_(done_ids))
+                .values(status='done', last_error=None, claimed_by=None, updated_at=now)
+            )
+        if released_ids:
+            db.session.execute(
+                db.update(TierPermissionSync).where(TierPermissionSync.id.in_(released_ids))
+                .values(status='pending', claimed_by=None, updated_at=now)
+            )
+        if failures:
+            db.session.execute(db.update(TierPermissionSync), [
+                {'id': sync_id, 'attempts': attempts + 1, 'last_error': error, 'claimed_by': None,
+                 'status': 'failed' if attempts + 1 >= MAX_TIER_SYNC_ATTEMPTS else 'pending', 'updated_at': now}
+                for sync_id, attempts, error in failures
+            ])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error saving tier permission sync progress: {str(e)}")
+        raise
+
+def get_tier_permission_sync_progress():
+    """Return {tier_id: {'pending', 'running', 'done', 'failed', 'total'}} for tiers with a rollout."""
+    try:
+        rows = db.session.query(
+            TierPermissionSync.tier_id, TierPermissionSync.status, db.func.count(TierPermissionSync.id)
+        ).group_by(TierPermissionSync.tier_id, TierPermissionSync.status).all()
+        progress = {}
+        for tier_id, status, count in rows:
+            counts = progress.setdefault(tier_id, {'pending': 0, 'running': 0, 'done': 0, 'failed': 0, 'total': 0})
+            counts[status] = count
+            counts['total'] += count
+        return progress
+    except Exception as e:
+        print(f"Error reading tier permission sync progress: {str(e)}")
+        return {}
@@ -0,0 +1,117 @@
+import threading
+import time
+
+FRIEND = 'friend'
+PENDING = 'pending'
+
+class FriendRoster:
+    """In-memory snapshot of the account's friends and sent pending invites.
+
+    Friends and invites belong to the Plex account, not to a server, so one
+    roster is shared by every configured server. Each entry remembers which
+    servers it is shared on (``MyPlexUser.servers`` / ``MyPlexInvite.servers``)
+    and lookups can be limited to one server. Entries are indexed by
+    lowercase username, email and title so access checks are dictionary
+    lookups. The snapshot is replaced wholesale by ``replace`` (from
+    ``account.users()`` / ``pendingInvites()``) and patched after each invite
+    or removal. Lookups only answer while the snapshot is younger than
+    ``max_age`` seconds; callers fall back to asking Plex.
+    """
+
+    def __init__(self, max_age=900):
+        self.max_age = max_age
+        self._entries = {}
+        self._refreshed_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(*values):
+        return {value.strip().lower() for value in values if value and value.strip()}
+
+    @staticmethod
+    def _server_names(obj):
+        return frozenset(share.name for share in getattr(obj, 'servers', None) or [] if share.name)
+
+    def replace(self, users, invites):
+        """Swap in a fresh snapshot built from MyPlexUser and MyPlexInvite objects."""
+        entries = {}
+        for invite in invites:
+            for key in self._keys(invite.username, invite.email, invite.friendlyName):
+                entries[key] = (PENDING, invite, self._server_names(invite))
+        # Friends win over a stale pending invite for the same person
+        for user in users:
+            for key in self._keys(user.username, user.email, user.title):
+                entries[key] = (FRIEND, user, self._server_names(user))
+        with self._lock:
+            self._entries = entries
+            self._refreshed_at = time.monotonic()
+
+    def is_fresh(self):
+        with self._lock:
+            return self._is_fresh()
+
+    def _is_fresh(self):
+        return self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.max_age
+
+    def lookup(self, identity, server_name=None):
+        """Return (FRIEND|PENDING, plexapi object or None), or (None, None) if absent or unknown.
+
+        With ``server_name`` only a friend/invite shared on that server counts.
+        """
+        key = (identity or '').strip().lower()
+        with self._lock:
+            if not self._is_fresh():
+                return None, None
+            status, entry, servers = self._entries.get(key, (None, None, frozenset()))
+            if server_name is not None and server_name not in servers:
+                return None, None
+            return status, entry
+
+    def servers(self, identity):
+        """Names of the servers an identity is shared on (None if the snapshot is stale)."""
+        key = (identity or '').strip().lower()
+        with self._lock:
+            if not self._is_fresh():
+                return None
+            return self._entries.get(key, (None, None, frozenset()))[2]
+
+    def add_pending(self, identity, server_name):
+        """Record an invite we just sent (the invite object is fetched on the next refresh)."""
+        key = (identity or '').strip().lower()
+        if not key:
+            return
+        with self._lock:
+            status, entry, servers = self._entries.get(key, (PENDING, None, frozenset()))
+            self._entries[key] = (status, entry, servers | {server_name})
+
+    def remove(self, identity):
+        """Drop a user and every other key pointing at the same friend/invite (on every server)."""
+        key = (identity or '').strip().lower()
+        with self._lock:
+            _, entry, _ = self._entries.pop(key, (None, None, None))
+            if entry is not None:
+                for other in [k for k, (_, obj, _) in self._entries.items() if obj is entry]:
+                    del self._entries[other]
+
+    def identities(self, status=FRIEND, server_name=None):
+        """All lowercase keys with the given status (None if the snapshot is stale)."""
+        with self._lock:
+            if not self._is_fresh():
+                return None
+            return {key for key, (entry_status, _, servers) in self._entries.items()
+                    if entry_status == status and (server_name is None or server_name in servers)}
+
+    def stats(self, server_name=None):
+        """Friend and pending-invite counts for the account, or for one server."""
+        with self._lock:
+            entries = [(key, status, obj) for key, (status, obj, servers) in self._entries.items()
+                       if server_name is None or server_name in servers]
+            friends = {id(obj) for _, status, obj in entries if status == FRIEND}
+            pending = {id(obj) if obj is not None else key
+                       for key, status, obj in entries if status == PENDING}
+            return {
+                'friends': len(friends),
+                'pending': len(pending),
+                'age_seconds': int(time.monotonic() - self._refreshed_at) if self._refreshed_at else None,
+                'fresh': self._is_fresh()
+            }
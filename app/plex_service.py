@@ -1,82 +1,370 @@
 from plexapi.myplex import MyPlexAccount
 from plexapi.exceptions import BadRequest, Unauthorized, NotFound
+from contextlib import contextmanager
 import logging
+import queue
+import random
+import threading
+import time
+import requests
+from app.circuit_breaker import CircuitBreaker
+from app.rate_limiter import TokenBucket
+from app.plex_roster import FriendRoster, FRIEND, PENDING
+from app.circuit_breaker import CircuitOpenError, OPEN
+from app.cache import TTLCache
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 
 logger = logging.getLogger(__name__)
 
+class PlexClient:
+    """A connected MyPlexAccount/PlexServer pair with its own HTTP session."""
+    
+    def __init__(self, account, server):
+        self.account = account
+        self.server = server
+        self.last_checked = time.monotonic()
+        self.broken = False
+    
+    def is_healthy(self):
+        """Lightweight liveness probe against the server's identity endpoint."""
+        try:
+            self.server.query('/identity')
+            self.last_checked = time.monotonic()
+            return True
+        except Exception as e:
+            logger.warning(f"Plex health check failed: {str(e)}")
+            return False
+
+class PlexClientPool:
+    """Fixed-size pool of connected Plex clients, each used by one thread at a time.
+    
+    ``start_keeper`` runs a background thread that warms the pool at startup,
+    probes idle clients and reconnects with exponential backoff, so request
+    threads normally never pay connection latency.
+    """
+    
+    # Reconnect backoff bounds for the keeper thread (seconds)
+    MIN_BACKOFF = 2
+    MAX_BACKOFF = 300
+    
+    def __init__(self, connect, size=4, health_check_interval=60, checkout_timeout=30):
+        self._connect = connect
+        self.size = max(1, size)
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._keeper = None
+        self._stop = threading.Event()
+        self.consecutive_failures = 0
+        self.last_error = None
+    
+    def _reserve_slot_below(self, target):
+        """Claim capacity for a new connection if fewer than target exist."""
+        with self._lock:
+            if self._created < min(target, self.size):
+                self._created += 1
+                return True
+            return False
+    
+    def _reserve_slot(self):
+        """Claim capacity for a new connection if the pool is not full."""
+        return self._reserve_slot_below(self.size)
+    
+    def _release_slot(self):
+        with self._lock:
+            self._created -= 1
+    
+    def _new_client(self):
+        """Connect a new client in a reserved slot (the slot is released on failure)."""
+        try:
+            return self._connect()
+        except Exception:
+            self._release_slot()
+            raise
+    
+    def _acquire(self):
+        """Check out an idle client, connecting a new one if the pool has room."""
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve_slot():
+                return self._new_client()
+            try:
+                client = self._idle.get(timeout=self.checkout_timeout)
+            except queue.Empty:
+                raise ValueError("Timed out waiting for a Plex connection. Please try again.")
+        
+        # Idle connections may have gone stale; probe before handing them out
+        if time.monotonic() - client.last_checked > self.health_check_interval and not client.is_healthy():
+            logger.info("Replacing stale Plex connection")
+            return self._new_client()
+        return client
+    
+    def _release(self, client):
+        """Return a client to the pool, or drop it if it is broken."""
+        if client.broken:
+            self._release_slot()
+        else:
+            self._idle.put(client)
+    
+    @contextmanager
+    def client(self):
+        """Check out a client for the duration of a with block."""
+        client = self._acquire()
+        try:
+            yield client
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            # The connection itself failed; don't hand it to the next caller
+            client.broken = True
+            raise
+        finally:
+            self._release(client)
+    
+    def stats(self):
+        """Current pool occupancy and keeper health."""
+        with self._lock:
+            created = self._created
+        idle = self._idle.qsize()
+        return {
+            'size': self.size,
+            'connected': created,
+            'idle': idle,
+            'in_use': created - idle,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error
+        }
+    
+    def _probe_idle(self):
+        """Health-check idle clients, dropping any that fail.
+        
+        Clients are probed at half the request-path interval so a checkout
+        normally finds them freshly verified and never probes inline.
+        """
+        max_age = self.health_check_interval / 2
+        due = []
+        kept = []
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if time.monotonic() - client.last_checked >= max_age:
+                due.append(client)
+            else:
+                kept.append(client)
+        
+        # Hand fresh clients straight back so requests aren't starved while probing
+        for client in kept:
+            self._idle.put(client)
+        
+        for client in due:
+            if client.is_healthy():
+                self._idle.put(client)
+            else:
+                logger.info("Dropping unhealthy idle Plex connection")
+                self._release_slot()
+    
+    def _fill(self, target):
+        """Connect new clients until target connections exist (raises on failure)."""
+        while self._reserve_slot_below(target):
+            self._idle.put(self._new_client())
+    
+    def maintain(self, target=None):
+        """One keeper pass: probe idle clients, then top the pool back up to target."""
+        self._probe_idle()
+        self._fill(self.size if target is None else target)
+    
+    def _backoff_delay(self):
+        """Exponential backoff with jitter based on consecutive failures."""
+        delay = min(self.MIN_BACKOFF * (2 ** (self.consecutive_failures - 1)), self.MAX_BACKOFF)
+        return delay * random.uniform(0.5, 1.0)
+    
+    def _keeper_loop(self, interval, target):
+        while not self._stop.is_set():
+            try:
+                self.maintain(target)
+                if self.consecutive_failures:
+                    logger.info("Plex connections restored")
+                self.consecutive_failures = 0
+                self.last_error = None
+                wait = interval
+            except Exception as e:
+                self.consecutive_failures += 1
+                self.last_error = str(e)
+                wait = self._backoff_delay()
+                logger.warning(f"Plex keeper could not connect (attempt {self.consecutive_failures}): "
+                               f"{str(e)}; retrying in {wait:.0f}s")
+            self._stop.wait(wait)
+    
+    def start_keeper(self, interval=30, target=None):
+        """Warm the pool and keep it healthy from a daemon thread (once per process)."""
+        with self._lock:
+            if self._keeper and self._keeper.is_alive():
+                return
+            self._stop.clear()
+            self._keeper = threading.Thread(
+                target=self._keeper_loop,
+                args=(interval, target),
+                name='plex-pool-keeper',
+                daemon=True
+            )
+            self._keeper.start()
+    
+    def stop_keeper(self):
+        """Stop the keeper thread after its current pass."""
+        self._stop.set()
+
 class PlexService:
     """Service class for Plex API operations."""
     
-    def __init__(self):
-        self.account = None
-        self.server = None
+    def __init__(self, server_name=None, pool_size=None, capacity=None, roster=None):
+        self.server_name = server_name or Config.PLEX_SERVER_NAME
+        self.capacity = capacity
+        self.pool = PlexClientPool(
+            self.connect_to_plex,
+            size=pool_size or Config.PLEX_POOL_SIZE,
+            health_check_interval=Config.PLEX_HEALTH_CHECK_INTERVAL,
+            checkout_timeout=Config.PLEX_POOL_TIMEOUT
+        )
+        # Fail fast while plex.tv is down instead of tying up request threads on timeouts.
+        # BadRequest/NotFound are answers from Plex, not outages.
+        self.breaker = CircuitBreaker(
+            'Plex',
+            failure_rate=Config.PLEX_BREAKER_FAILURE_RATE,
+            minimum_calls=Config.PLEX_BREAKER_MIN_CALLS,
+            window=Config.PLEX_BREAKER_WINDOW,
+            reset_timeout=Config.PLEX_BREAKER_RESET_TIMEOUT,
+            ignored=(BadRequest, NotFound)
+        )
+        # Outbound calls are throttled across all threads and workers on this host;
+        # library reads and friend changes (invite/remove/update) have separate budgets
+        self.read_bucket = TokenBucket(
+            'plex_read', Config.PLEX_READ_RATE, Config.PLEX_READ_BURST,
+            Config.PLEX_RATE_LIMIT_STORE, max_wait=Config.PLEX_RATE_LIMIT_MAX_WAIT
+        )
+        self.write_bucket = TokenBucket(
+            'plex_write', Config.PLEX_WRITE_RATE, Config.PLEX_WRITE_BURST,
+            Config.PLEX_RATE_LIMIT_STORE, max_wait=Config.PLEX_RATE_LIMIT_MAX_WAIT
+        )
+        # Snapshot of the account's friends and pending invites so redundant invites/removals
+        # are skipped (shared by every server of a PlexServers registry)
+        self.roster = roster or FriendRoster(max_age=Config.PLEX_ROSTER_MAX_AGE)
+        # This server's library sections, shared by invites and the admin views
+        self.catalog = TTLCache(ttl=Config.PLEX_LIBRARY_CACHE_TTL, max_entries=1)
     
-    def _ensure_connected(self):
-        """Ensure connection is established, reconnect only if necessary."""
-        if self.account is None or self.server is None:
-            self.connect_to_plex()
+    def start_background_maintenance(self):
+        """Warm connections now and keep them alive in the background."""
+        self.pool.start_keeper(
+            interval=Config.PLEX_KEEPALIVE_INTERVAL,
+            target=Config.PLEX_WARM_CONNECTIONS or None
+        )
     
     def connect_to_plex(self):
-        """Establish connection to Plex server using token and server name."""
+        """Establish a new connection to the Plex server using token and server name."""
         try:
-            self.account = MyPlexAccount(token=Config.PLEX_TOKEN)
-            self.server = self.account.resource(Config.PLEX_SERVER_NAME).connect()
-            logger.info(f"Successfully connected to Plex server: {Config.PLEX_SERVER_NAME}")
-            return True
+            account = MyPlexAccount(token=Config.PLEX_TOKEN, session=requests.Session())
+            server = account.resource(self.server_name).connect()
+            logger.info(f"Successfully connected to Plex server: {self.server_name}")
+            return PlexClient(account, server)
         except Unauthorized:
             logger.error("Invalid Plex token")
             raise ValueError("Invalid Plex token. Please check your PLEX_TOKEN configuration.")
         except NotFound:
-            logger.error(f"Plex server not found: {Config.PLEX_SERVER_NAME}")
-            raise ValueError(f"Plex server '{Config.PLEX_SERVER_NAME}' not found. Please check your PLEX_SERVER_NAME configuration.")
+            logger.error(f"Plex server not found: {self.server_name}")
+            raise ValueError(f"Plex server '{self.server_name}' not found. Please check your PLEX_SERVER_NAME configuration.")
         except Exception as e:
             logger.error(f"Error connecting to Plex: {str(e)}")
             raise ValueError(f"Error connecting to Plex: {str(e)}")
     
+    def refresh_roster(self):
+        """Reload the account's friend/pending-invite snapshot from plex.tv (two calls); returns account stats."""
+        try:
+            self.read_bucket.acquire(2)
+            with self.breaker.guard(), self.pool.client() as client:
+                users = client.account.users()
+                invites = client.account.pendingInvites(includeSent=True, includeReceived=False)
+            self.roster.replace(users, invites)
+            logger.info(f"Refreshed Plex roster: {len(users)} friends, {len(invites)} pending invites")
+            return self.roster.stats()
+        except ValueError:
+            raise
+        except Exception as e:
+            logger.error(f"Error refreshing Plex roster: {str(e)}")
+            raise ValueError(f"Error refreshing Plex roster: {str(e)}")
+    
+    def _library_sections(self, client):
+        """All library sections on this server, from the catalog cache when fresh."""
+        sections = self.catalog.get('sections')
+        if sections is None:
+            sections = client.server.library.sections()
+            self.catalog.set('sections', sections)
+        return sections
+    
+    def _get_sections(self, client, library_names):
+        """Resolve library names to the server's section objects."""
+        if not library_names:
+            return []
+        return [section for section in self._library_sections(client) if section.title in library_names]
+    
+    def _acquire_catalog_read(self):
+        """Take a read token only if the library catalog has to be fetched."""
+        if self.catalog.get('sections') is None:
+            self.read_bucket.acquire()
+    
     def get_libraries(self):
         """Fetch available library sections from the Plex server."""
-        self._ensure_connected()
-        
         try:
-            sections = self.server.library.sections()
+            self._acquire_catalog_read()
+            with self.breaker.guard(), self.pool.client() as client:
+                sections = self._library_sections(client)
             libraries = [{'title': section.title, 'type': section.type} for section in sections]
             logger.info(f"Retrieved {len(libraries)} libraries from Plex")
             return libraries
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error fetching libraries: {str(e)}")
             raise ValueError(f"Error fetching libraries: {str(e)}")
     
     def send_invite(self, email_or_username, library_names, allow_downloads=False):
         """Send a Plex invite to the specified user with selected libraries."""
-        self._ensure_connected()
-        
         try:
-            # Get library sections to share
-            sections = []
-            if library_names:
-                all_sections = self.server.library.sections()
-                sections = [section for section in all_sections if section.title in library_names]
-            
-            # Set sections to None if empty to avoid API issues
-            sections_arg = sections if sections else None
+            # Skip the round trip when the snapshot already shows a share or invite
+            status, _ = self.roster.lookup(email_or_username, self.server_name)
+            if status:
+                logger.warning(f"User {email_or_username} already has access or is already invited (roster)")
+                raise ValueError(f"User '{email_or_username}' already has access or has already been invited.")
             
-            # Send the invite
-            self.account.inviteFriend(
-                user=email_or_username,
-                server=self.server,
-                sections=sections_arg,
-                allowSync=allow_downloads,
-                allowCameraUpload=False,
-                allowChannels=False,
-                filterMovies=None,
-                filterTelevision=None,
-                filterMusic=None
-            )
+            if library_names:
+                self._acquire_catalog_read()
+            self.write_bucket.acquire()
+            with self.breaker.guard(), self.pool.client() as client:
+                # Get library sections to share
+                sections = self._get_sections(client, library_names)
+                
+                # Set sections to None if empty to avoid API issues
+                sections_arg = sections if sections else None
+                
+                # Send the invite
+                client.account.inviteFriend(
+                    user=email_or_username,
+                    server=client.server,
+                    sections=sections_arg,
+                    allowSync=allow_downloads,
+                    allowCameraUpload=False,
+                    allowChannels=False,
+                    filterMovies=None,
+                    filterTelevision=None,
+                    filterMusic=None
+                )
+            self.roster.add_pending(email_or_username, self.server_name)
             
             logger.info(f"Successfully sent invite to {email_or_username} with {len(sections)} libraries (downloads: {allow_downloads})")
             return True
-            
+        
         except BadRequest as e:
             error_msg = str(e)
             if "already has access" in error_msg.lower() or "already invited" in error_msg.lower():
@@ -88,6 +376,8 @@ class PlexService:
         except NotFound:
             logger.error(f"User not found: {email_or_username}")
             raise ValueError(f"Plex user '{email_or_username}' not found. Please ensure the username or email is correct.")
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error sending invite to {email_or_username}: {str(e)}")
             raise ValueError(f"Error sending invite: {str(e)}")
@@ -99,52 +389,72 @@ class PlexService:
         return self.send_invite(email_or_username, library_names, allow_downloads)
     
     def revoke_access(self, email_or_username):
-        """Revoke a user's access to the Plex server."""
-        self._ensure_connected()
+        """Revoke a user's access to the Plex server.
         
+        Always asks Plex: the roster is a per-worker snapshot, so a user
+        invited by another worker or shared by hand since the last refresh
+        would be missing from it. The roster only supplies the friend/invite
+        object when it has one.
+        """
         try:
-            # Remove the user as a friend, which revokes their access
-            self.account.removeFriend(user=email_or_username)
+            status, entry = self.roster.lookup(email_or_username)
+            self.write_bucket.acquire()
+            with self.breaker.guard(), self.pool.client() as client:
+                if status == PENDING:
+                    # Not accepted yet; cancel the invite so it can't be accepted later
+                    client.account.cancelInvite(entry or email_or_username)
+                elif status == FRIEND:
+                    # Passing the snapshot's user object avoids plexapi re-listing every friend
+                    client.account.removeFriend(user=entry or email_or_username)
+                else:
+                    # Unknown to this worker's snapshot: remove a friend, else cancel an open invite
+                    try:
+                        client.account.removeFriend(user=email_or_username)
+                    except NotFound:
+                        client.account.cancelInvite(email_or_username)
+            self.roster.remove(email_or_username)
             logger.info(f"Successfully revoked access for {email_or_username}")
             return True
         except NotFound:
             logger.warning(f"User {email_or_username} not found when trying to revoke access")
+            self.roster.remove(email_or_username)
             # User doesn't exist, so technically access is "revoked"
             return True
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error revoking access for {email_or_username}: {str(e)}")
             raise ValueError(f"Error revoking access: {str(e)}")
     
     def update_user_permissions(self, email_or_username, library_names, allow_downloads):
         """Update an existing user's permissions (requires remove and re-invite)."""
-        self._ensure_connected()
-        
         try:
             # First, try to update (may not be supported by PlexAPI directly)
             # If not possible, we need to remove and re-invite
             logger.info(f"Updating permissions for {email_or_username}")
             
-            # Get library sections to share
-            sections = []
             if library_names:
-                all_sections = self.server.library.sections()
-                sections = [section for section in all_sections if section.title in library_names]
-            
-            sections_arg = sections if sections else None
-            
-            # Try to update friend permissions
-            # Note: PlexAPI may require removing and re-inviting
-            self.account.updateFriend(
-                user=email_or_username,
-                server=self.server,
-                sections=sections_arg,
-                allowSync=allow_downloads
-            )
+                self._acquire_catalog_read()
+            self.write_bucket.acquire()
+            with self.breaker.guard(), self.pool.client() as client:
+                # Get library sections to share
+                sections = self._get_sections(client, library_names)
+                sections_arg = sections if sections else None
+                
+                # Try to update friend permissions
+                # Note: PlexAPI may require removing and re-inviting
+                client.account.updateFriend(
+                    user=email_or_username,
+                    server=client.server,
+                    sections=sections_arg,
+                    allowSync=allow_downloads
+                )
             
             logger.info(f"Successfully updated permissions for {email_or_username}")
             return True
         except AttributeError:
             # updateFriend may not exist, fall back to remove and re-invite
+            # (the pooled client has been returned, so these can check out their own)
             logger.warning(f"updateFriend not available, removing and re-inviting {email_or_username}")
             try:
                 self.revoke_access(email_or_username)
@@ -153,28 +463,208 @@ class PlexService:
             except Exception as e:
                 logger.error(f"Error updating permissions via remove/re-invite: {str(e)}")
                 raise ValueError(f"Error updating permissions: {str(e)}")
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error updating permissions for {email_or_username}: {str(e)}")
             raise ValueError(f"Error updating permissions: {str(e)}")
     
-    def test_connection(self):
-        """Test the Plex connection and return status."""
+    def test_connection(self, refresh=True):
+        """Test the Plex connection and return status (refresh=False reuses the library catalog)."""
         try:
-            self._ensure_connected()
+            if refresh:
+                self.catalog.clear()
             libraries = self.get_libraries()
             return {
                 'success': True,
-                'server_name': Config.PLEX_SERVER_NAME,
+                'server_name': self.server_name,
                 'library_count': len(libraries),
-                'message': f"Successfully connected to {Config.PLEX_SERVER_NAME}"
+                'libraries': libraries,
+                'pool': self.pool.stats(),
+                'breaker': self.breaker.stats(),
+                'roster': self.roster.stats(self.server_name),
+                'message': f"Successfully connected to {self.server_name}"
             }
         except Exception as e:
             return {
                 'success': False,
+                'server_name': self.server_name,
                 'error': str(e),
+                'libraries': [],
+                'breaker': self.breaker.stats(),
                 'message': f"Connection failed: {str(e)}"
             }
 
-# Global instance
-plex_service = PlexService()
+class PlexServers:
+    """Every configured Plex server, each with its own PlexService (pool, breaker, catalog).
+    
+    Places new subscribers on a server allowed by their tier with the most
+    spare capacity, fans revocations out to all servers in parallel and
+    sends permission updates to the servers a user is shared on. Friends
+    belong to the Plex account, so the services share one roster.
+    """
+    
+    def __init__(self, servers):
+        self.roster = FriendRoster(max_age=Config.PLEX_ROSTER_MAX_AGE)
+        self.services = {name: PlexService(name, capacity=capacity, roster=self.roster)
+                         for name, capacity in servers}
+        self.primary = next(iter(self.services.values()))
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(2, len(self.services) * 2),
+            thread_name_prefix='plex-fanout'
+        )
+    
+    def __iter__(self):
+        return iter(self.services.values())
+    
+    def __len__(self):
+        return len(self.services)
+    
+    def get(self, server_name):
+        """Service for a server name; None (placed before multi-server) or unknown means primary."""
+        return self.services.get(server_name) or self.primary
+    
+    def _candidates(self, tier):
+        allowed = getattr(tier, 'server_names', None)
+        if allowed:
+            names = [name for name in allowed if name in self.services]
+            if names:
+                return [self.services[name] for name in names]
+            logger.warning(f"Tier {tier.name} lists no configured Plex servers, using all servers")
+        return list(self.services.values())
+    
+    def choose_server(self, tier, loads):
+        """Pick the server for a new subscriber.
+        
+        Candidates are the tier's servers (all servers if none are set), minus
+        any at capacity or with an open circuit breaker. The lowest utilisation
+        wins; servers without a capacity count as empty and ties go to the
+        lighter load. ``loads`` maps server name to current subscribers (see
+        get_server_loads; key None is the primary server).
+        """
+        def load(service):
+            count = loads.get(service.server_name, 0)
+            if service is self.primary:
+                count += loads.get(None, 0)
+            return count
+        
+        candidates = self._candidates(tier)
+        available = [service for service in candidates if service.breaker.state != OPEN]
+        if not available:
+            raise CircuitOpenError("Plex is temporarily unavailable. Please try again in a few minutes.")
+        
+        open_seats = [service for service in available
+                      if service.capacity is None or load(service) < service.capacity]
+        if not open_seats:
+            raise ValueError("All Plex servers are full. Please contact the administrator.")
+        
+        return min(open_seats, key=lambda service: (
+            load(service) / service.capacity if service.capacity else 0, load(service)
+        ))
+    
+    def send_invite_with_tier(self, email_or_username, tier, loads):
+        """Invite a new subscriber to the best server for their tier; returns the server name."""
+        service = self.choose_server(tier, loads)
+        service.send_invite_with_tier(email_or_username, tier)
+        return service.server_name
+    
+    def _fan_out(self, services, method, *args):
+        """Call method on each service in parallel; return {server name: result or exception}."""
+        futures = {
+            service.server_name: self._executor.submit(getattr(service, method), *args)
+            for service in services
+        }
+        results = {}
+        for server_name, future in futures.items():
+            try:
+                results[server_name] = future.result()
+            except Exception as e:
+                results[server_name] = e
+        return results
+    
+    @staticmethod
+    def _raise_first_error(results):
+        """Re-raise a failure from a fan-out, preferring CircuitOpenError so callers can defer."""
+        errors = [result for result in results.values() if isinstance(result, Exception)]
+        for error in errors:
+            if isinstance(error, CircuitOpenError):
+                raise error
+        if errors:
+            raise errors[0]
+    
+    def revoke_access(self, email_or_username):
+        """Revoke a user's access on every server (a server they aren't on answers NotFound, which counts as done)."""
+        results = self._fan_out(self.services.values(), 'revoke_access', email_or_username)
+        self._raise_first_error(results)
+        return True
+    
+    def update_user_permissions(self, email_or_username, library_names, allow_downloads, server_names=None):
+        """Update a user's libraries/downloads on the given servers, or every server they are shared on.
+        
+        Without server_names, only servers the roster lists the user as a
+        friend on are updated (updateFriend would otherwise add a share on a
+        server they were never placed on); returns False when there are none.
+        """
+        if server_names:
+            services = [self.get(name) for name in server_names]
+        else:
+            if not self.roster.is_fresh():
+                self.refresh_roster()
+            services = [service for service in self
+                        if self.roster.lookup(email_or_username, service.server_name)[0] == FRIEND]
+            if not services:
+                logger.warning(f"Not updating permissions for {email_or_username}: not shared on any Plex server")
+                return False
+        results = self._fan_out(services, 'update_user_permissions', email_or_username, library_names, allow_downloads)
+        self._raise_first_error(results)
+        return True
+    
+    def status(self, refresh=False):
+        """Connection and library status for every server, checked in parallel."""
+        results = self._fan_out(self.services.values(), 'test_connection', refresh)
+        statuses = []
+        for service in self:
+            result = results[service.server_name]
+            if isinstance(result, Exception):
+                result = {'success': False, 'server_name': service.server_name, 'error': str(result),
+                          'libraries': [], 'message': f"Connection failed: {str(result)}"}
+            result['capacity'] = service.capacity
+            statuses.append(result)
+        return statuses
+    
+    def all_libraries(self):
+        """Library list across all reachable servers, de-duplicated by title."""
+        libraries = {}
+        for result in self.status():
+            for library in result['libraries']:
+                libraries.setdefault(library['title'], library)
+        return list(libraries.values())
+    
+    def all_open(self):
+        """True when every server's circuit breaker is open."""
+        return all(service.breaker.state == OPEN for service in self)
+    
+    def start_background_maintenance(self):
+        for service in self:
+            service.start_background_maintenance()
+    
+    def refresh_roster(self):
+        """Refresh the shared friend roster with one fetch, through the first server that answers.
+        
+        Returns account-wide stats; raises the last ValueError if no server could fetch it.
+        """
+        error = None
+        for service in self:
+            if service.breaker.state == OPEN:
+                continue
+            try:
+                return service.refresh_roster()
+            except ValueError as e:
+                error = e
+        raise error or CircuitOpenError("Plex is temporarily unavailable. Please try again in a few minutes.")
+
+# Global registry of configured servers (each service pools its own clients; safe to share across threads)
+plex_servers = PlexServers(Config.get_plex_servers())
 
+# The primary server (PLEX_SERVER_NAME), for flows that are not tied to a subscription
+plex_service = plex_servers.primary
@@ -0,0 +1,180 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from app.models import Subscription, SubscriptionStatus, Tier, db, save_job_checkpoint
+from app.plex_service import plex_servers
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'plex_access_reconciliation'
+
+# Subscription statuses that should have Plex access
+ENTITLED_STATUSES = (SubscriptionStatus.active, SubscriptionStatus.past_due)
+
+# Keep the stored report small; counts cover the rest
+MAX_REPORTED_USERS = 200
+
+def _roster_token(service, identity):
+    """Identify the roster entry (friend or invite) an identity resolves to on a server, or None."""
+    status, entry = service.roster.lookup(identity, service.server_name)
+    if status is None:
+        return None
+    return id(entry) if entry is not None else identity.strip().lower()
+
+def _load_subscriptions(report):
+    """Return ({identity: (identity, tier_id, server)}, lapsed identities) from the DB."""
+    rows = db.session.query(
+        Subscription.plex_username,
+        Subscription.status,
+        Subscription.tier_id,
+        Subscription.plex_server
+    ).filter(Subscription.plex_username.isnot(None)).all()
+
+    entitled = {}
+    lapsed = set()
+    for plex_username, status, tier_id, plex_server in rows:
+        identity = plex_username.strip()
+        if not identity:
+            continue
+        if status in ENTITLED_STATUSES:
+            entitled.setdefault(identity.lower(), (identity, tier_id, plex_server))
+        else:
+            lapsed.add(identity.lower())
+    report['entitled'] = len(entitled)
+    return entitled, lapsed - set(entitled)
+
+def _plan(service, entitled, lapsed, tiers):
+    """Diff one server's shares against the DB; return (grants, revokes) lists."""
+    # Anyone with a current subscription keeps the friend/invite it resolves to on this
+    # server, even when a lapsed subscription names the same person by email instead of
+    # username; a share on another server doesn't count, so a missing one here is granted
+    kept_tokens = set()
+    grants = []
+    for identity, tier_id, plex_server in entitled.values():
+        token = _roster_token(service, identity)
+        if token is not None:
+            kept_tokens.add(token)
+        elif plex_servers.get(plex_server) is service:
+            library_names, allow_downloads = tiers.get(tier_id, (Config.get_library_config(), False))
+            grants.append((identity, library_names, allow_downloads))
+
+    # Only users we know from lapsed subscriptions are revoked; other friends of
+    # the account (family, manual shares) are never touched
+    revokes = []
+    revoked_tokens = set()
+    for identity in lapsed:
+        token = _roster_token(service, identity)
+        if token is None or token in kept_tokens or token in revoked_tokens:
+            continue
+        revoked_tokens.add(token)
+        revokes.append(identity)
+
+    return grants, revokes
+
+def _record(report, key, identity, error=None):
+    report[f'{key}_count'] += 1
+    if len(report[key]) < MAX_REPORTED_USERS:
+        report[key].append({'user': identity, 'error': error} if error else identity)
+
+def _apply(executor, tasks, report, key):
+    """Run (identity, func, args) tasks in parallel batches and record outcomes."""
+    batch_size = Config.PLEX_SYNC_BATCH_SIZE
+    for start in range(0, len(tasks), batch_size):
+        batch = tasks[start:start + batch_size]
+        futures = [(identity, executor.submit(func, *args)) for identity, func, args in batch]
+        for identity, future in futures:
+            try:
+                future.result()
+                _record(report, key, identity)
+            except Exception as e:
+                _record(report, 'failed', identity, error=str(e))
+        logger.info(f"Plex reconciliation: {key} {report[f'{key}_count']}/{len(tasks)} "
+                    f"({report['failed_count']} failed so far)")
+
+def reconcile_plex_access(dry_run=False):
+    """Make Plex access match the subscription table and return a diff report.
+
+    Fetches the account's friends and pending invites once, diffs each
+    server's shares against every subscription in memory, then invites entitled users who are missing
+    and removes lapsed subscribers who still have access or an open invite.
+    Changes run in parallel batches; the Plex token buckets set the pace.
+    """
+    started_at = datetime.utcnow()
+    report = {
+        'dry_run': dry_run,
+        'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'entitled': 0,
+        'to_grant': 0,
+        'to_revoke': 0,
+        'granted_count': 0,
+        'granted': [],
+        'revoked_count': 0,
+        'revoked': [],
+        'failed_count': 0,
+        'failed': [],
+        'planned_grants': [],
+        'planned_revokes': [],
+        'servers': {},
+    }
+
+    entitled, lapsed = _load_subscriptions(report)
+    tiers = {
+        tier.id: (tier.library_names or Config.get_library_config(), tier.allow_downloads)
+        for tier in Tier.query.all()
+    }
+
+    # One account roster records which servers each friend/invite is shared on; each
+    # server is diffed against its own shares, entitled users are granted on the
+    # server they were placed on (unplaced ones on the primary) and lapsed users
+    # are revoked wherever they still appear
+    try:
+        plex_servers.refresh_roster()
+        roster_error = None
+    except ValueError as e:
+        roster_error = str(e)
+        logger.error(f"Skipping Plex reconciliation: {roster_error}")
+
+    with ThreadPoolExecutor(max_workers=Config.PLEX_SYNC_WORKERS,
+                            thread_name_prefix='plex-reconcile') as executor:
+        for service in plex_servers:
+            server_report = {'friends': 0, 'pending': 0, 'to_grant': 0, 'to_revoke': 0}
+            report['servers'][service.server_name] = server_report
+            if roster_error:
+                server_report['error'] = roster_error
+                continue
+            roster = service.roster.stats(service.server_name)
+            server_report['friends'] = roster['friends']
+            server_report['pending'] = roster['pending']
+
+            grants, revokes = _plan(service, entitled, lapsed, tiers)
+            server_report['to_grant'] = len(grants)
+            server_report['to_revoke'] = len(revokes)
+            report['to_grant'] += len(grants)
+            report['to_revoke'] += len(revokes)
+            for identity, _, _ in grants:
+                if len(report['planned_grants']) < MAX_REPORTED_USERS:
+                    report['planned_grants'].append(f"{identity} ({service.server_name})")
+            for identity in revokes:
+                if len(report['planned_revokes']) < MAX_REPORTED_USERS:
+                    report['planned_revokes'].append(f"{identity} ({service.server_name})")
+
+            if dry_run:
+                continue
+            # Revoke first so lapsed users lose access even if invites back up
+            _apply(executor, [(identity, service.revoke_access, (identity,)) for identity in revokes],
+                   report, 'revoked')
+            _apply(executor, [(identity, service.send_invite, (identity, library_names, allow_downloads))
+                              for identity, library_names, allow_downloads in grants],
+                   report, 'granted')
+
+    report['duration_seconds'] = round((datetime.utcnow() - started_at).total_seconds(), 2)
+    save_job_checkpoint(CHECKPOINT_NAME, last_run_at=started_at, data=report)
+
+    logger.info(
+        f"Plex access reconciliation{' (dry run)' if dry_run else ''} complete: "
+        f"{report['entitled']} entitled, {report['to_grant']} to grant, {report['to_revoke']} to revoke, "
+        f"{report['granted_count']} granted, {report['revoked_count']} revoked, "
+        f"{report['failed_count']} failed in {report['duration_seconds']}s"
+    )
+    return report
@@ -0,0 +1,85 @@
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Token bucket shared by every thread and worker process on this host.
+
+    Bucket state lives in a small SQLite file; ``BEGIN IMMEDIATE`` serialises
+    refill-and-take across processes. If the file can't be used the bucket
+    falls back to per-process state rather than blocking outbound calls.
+
+    ``acquire`` reserves tokens up front, letting the balance go negative,
+    and sleeps until the reservation is covered. Callers are therefore served
+    in arrival order instead of failing or retrying in a herd. A caller whose
+    wait would exceed ``max_wait`` seconds gets a ValueError instead.
+    """
+
+    def __init__(self, name, rate, capacity, store_path, max_wait=60):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.store_path = store_path
+        self.max_wait = max_wait
+        self._local_tokens = self.capacity
+        self._local_updated = time.time()
+        self._local_lock = threading.Lock()
+        self._shared = True
+
+    def _refill(self, tokens, updated, now):
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+
+    def _reserve(self, tokens, count):
+        """Return (new balance, seconds to wait), or (tokens, None) if the wait is too long."""
+        remaining = tokens - count
+        wait = max(0.0, -remaining / self.rate)
+        if wait > self.max_wait:
+            return tokens, None
+        return remaining, wait
+
+    def _take_shared(self, count):
+        """Reserve tokens in the shared store; returns seconds to wait or None."""
+        conn = sqlite3.connect(self.store_path, timeout=5, isolation_level=None)
+        try:
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+            conn.execute('BEGIN IMMEDIATE')
+            now = time.time()
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE name = ?', (self.name,)).fetchone()
+            tokens = self._refill(row[0], row[1], now) if row else self.capacity
+            tokens, wait = self._reserve(tokens, count)
+            conn.execute('INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                         (self.name, tokens, now))
+            conn.execute('COMMIT')
+            return wait
+        finally:
+            conn.close()
+
+    def _take_local(self, count):
+        with self._local_lock:
+            now = time.time()
+            tokens = self._refill(self._local_tokens, self._local_updated, now)
+            self._local_tokens, wait = self._reserve(tokens, count)
+            self._local_updated = now
+            return wait
+
+    def _take(self, count):
+        if self._shared:
+            try:
+                return self._take_shared(count)
+            except sqlite3.Error as e:
+                logger.warning(f"Rate limit store {self.store_path} unavailable, "
+                               f"limiting '{self.name}' per process: {str(e)}")
+                self._shared = False
+        return self._take_local(count)
+
+    def acquire(self, count=1):
+        """Wait for count tokens; raise ValueError if that would take over max_wait seconds."""
+        wait = self._take(count)
+        if wait is None:
+            raise ValueError("Plex is busy processing other requests. Please try again shortly.")
+        if wait > 0:
+            logger.debug(f"Rate limit '{self.name}' reached, waiting {wait:.2f}s")
+            time.sleep(wait)
@@ -1,19 +1,36 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import (Blueprint, render_template, request, flash, redirect, url_for, jsonify, current_app, Response,
+                   stream_with_context)
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash
-from app.plex_service import plex_service
-from app.models import (AdminUser, get_recent_invites, get_invite_stats,
+from app.plex_service import plex_servers
+from app.models import (AdminUser, get_recent_invites, get_invite_stats, get_invite_page,
+                        decode_invite_cursor, get_subscription_rows, fetch_rows, select_tier_rows, TierRow,
                         get_subscription_stats, Subscription, Tier, 
-                        SubscriptionStatus, grandfather_existing_users,
-                        update_subscription_status, db)
+                        SubscriptionStatus,
+                        update_subscription_status, get_deferred_plex_action_counts, get_subscription_history,
+                        get_server_loads, enqueue_tier_permission_sync,
+                        get_tier_permission_sync_progress, db)
 from app.stripe_service import stripe_service
+from app.stripe_backfill import start_backfill, get_backfill_progress
+from app.tier_sync import start_tier_permission_sync
+from app.grandfather import start_grandfathering, get_grandfather_progress
+from app.bulk_actions import ACTIONS as BULK_ACTIONS, start_bulk_action, get_bulk_action_progress
+from app.events import event_bus, dashboard_events
+from app.exports import FORMATS as EXPORT_FORMATS, export_chunks
+from app.analytics import get_analytics
 from app.utils import is_safe_url
 from config import Config
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+import json
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+# Runs the independent lookups behind a dashboard panel in parallel
+_dashboard_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='dashboard')
+
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
 @admin_bp.route('/login', methods=['GET', 'POST'])
@@ -51,51 +68,145 @@ def logout():
     flash('You have been logged out successfully.', 'success')
     return redirect(url_for('main.index'))
 
+def _run_concurrently(lookups):
+    """Run {key: (func, args)} on the dashboard pool, each in its own app context.
+    
+    Returns {key: result}; a lookup that raised is returned as the exception
+    so one failing panel section doesn't take down the others.
+    """
+    app = current_app._get_current_object()
+    
+    def call(func, args):
+        with app.app_context():
+            return func(*args)
+    
+    futures = {key: _dashboard_executor.submit(call, func, args) for key, (func, args) in lookups.items()}
+    results = {}
+    for key, future in futures.items():
+        try:
+            results[key] = future.result()
+        except Exception as e:
+            logger.error(f"Dashboard lookup {key} failed: {str(e)}")
+            results[key] = e
+    return results
+
+def _plex_panel():
+    """Connection status and library settings (the only panels that wait on Plex)."""
+    # Plex servers are checked in parallel (each fails fast while its circuit breaker is
+    # open) alongside the local lookups
+    results = _run_concurrently({
+        'status': (plex_servers.status, ()),
+        'loads': (get_server_loads, ()),
+        'deferred': (get_deferred_plex_action_counts, ()),
+        'configured': (Config.get_library_config, ()),
+    })
+    plex_status = results['status']
+    if isinstance(plex_status, Exception):
+        plex_status = [{
+            'server_name': service.server_name, 'success': False, 'error': str(plex_status),
+            'message': f'Connection failed: {str(plex_status)}', 'breaker': service.breaker.stats(),
+            'capacity': service.capacity, 'libraries': []
+        } for service in plex_servers]
+    loads = results['loads'] if not isinstance(results['loads'], Exception) else {}
+    for server in plex_status:
+        server['load'] = loads.get(server['server_name'], 0)
+    plex_status[0]['load'] += loads.get(None, 0)
+    
+    # Library settings choose from every server's libraries
+    libraries = {}
+    for server in plex_status:
+        for library in server['libraries']:
+            libraries.setdefault(library['title'], library)
+    
+    deferred = results['deferred']
+    configured = results['configured']
+    return {
+        'panel-plex-connection': render_template(
+            'admin/panels/plex_connection.html',
+            plex_status=plex_status,
+            deferred_plex_actions=deferred if not isinstance(deferred, Exception) else {'pending': 0, 'stuck': 0}
+        ),
+        'panel-library-settings': render_template(
+            'admin/panels/library_settings.html',
+            libraries=list(libraries.values()),
+            configured_libraries=configured if not isinstance(configured, Exception) else []
+        )
+    }
+
+def _invite_stats_panel():
+    return {'panel-invite-stats': render_template('admin/panels/invite_stats.html', stats=get_invite_stats())}
+
+def _subscription_stats_panel():
+    return {'panel-subscription-stats': render_template('admin/panels/subscription_stats.html',
+                                                        subscription_stats=get_subscription_stats())}
+
+def _recent_invites_panel():
+    return {'panel-recent-invites': render_template('admin/panels/recent_invites.html',
+                                                    recent_invites=get_recent_invites(limit=20))}
+
+# Dashboard panels, each loaded from its own fragment endpoint
+DASHBOARD_PANELS = {
+    'plex': _plex_panel,
+    'invite_stats': _invite_stats_panel,
+    'subscription_stats': _subscription_stats_panel,
+    'recent_invites': _recent_invites_panel,
+}
+
 @admin_bp.route('/dashboard')
 @login_required
 def dashboard():
-    """Admin dashboard."""
+    """Admin dashboard shell; the panels load from dashboard_panel so Plex never blocks the page."""
+    return render_template('admin/dashboard.html', panels=list(DASHBOARD_PANELS))
+
+@admin_bp.route('/dashboard/panel/<name>')
+@login_required
+def dashboard_panel(name):
+    """Render one dashboard panel as {"panels": {element id: html}}."""
+    if name not in DASHBOARD_PANELS:
+        return jsonify({'error': f'Unknown panel: {name}'}), 404
     try:
-        # Get Plex libraries (this also ensures connection)
-        libraries = plex_service.get_libraries()
-        
-        # Get currently configured libraries
-        configured_libraries = Config.get_library_config()
-        
-        # Get recent invite requests (reduced from 50 to 20 for better performance)
-        recent_invites = get_recent_invites(limit=20)
+        return jsonify({'panels': DASHBOARD_PANELS[name]()})
+    except Exception as e:
+        logger.error(f"Error loading dashboard panel {name}: {str(e)}")
+        return jsonify({'error': str(e), 'panels': {}}), 500
+
+@admin_bp.route('/dashboard/events')
+@login_required
+def dashboard_event_stream():
+    """Server-sent events feed of invites, subscription changes, job progress and stats."""
+    if not dashboard_events.add_viewer(Config.DASHBOARD_MAX_STREAMS):
+        return jsonify({'error': 'Too many live dashboards are open; falling back to refresh'}), 503
+    try:
+        dashboard_events.start(current_app._get_current_object())
         
-        # Get statistics
-        stats = get_invite_stats()
-        subscription_stats = get_subscription_stats()
+        # Resume after a reconnect when the browser's Last-Event-ID came from this worker's bus
+        last_id = event_bus.last_id
+        epoch, _, event_id = request.headers.get('Last-Event-ID', '').partition('-')
+        if epoch == event_bus.epoch and event_id.isdigit():
+            last_id = min(int(event_id), last_id)
         
-        # Build connection status from successful library fetch (no redundant API call)
-        connection_status = {
-            'success': True,
-            'server_name': Config.PLEX_SERVER_NAME,
-            'library_count': len(libraries),
-            'message': f"Successfully connected to {Config.PLEX_SERVER_NAME}"
-        }
+        def stream(last_id):
+            # Streams end after a while so gunicorn threads are recycled; EventSource reconnects
+            deadline = time.monotonic() + Config.DASHBOARD_STREAM_SECONDS
+            yield 'retry: 3000\n\n'
+            while time.monotonic() < deadline:
+                events = event_bus.wait(last_id, timeout=min(15, max(deadline - time.monotonic(), 0.1)))
+                if not events:
+                    yield ': keepalive\n\n'
+                    continue
+                for event_id, event_type, data in events:
+                    yield f"id: {event_bus.epoch}-{event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n"
+                    last_id = event_id
         
-        return render_template(
-            'admin/dashboard.html',
-            libraries=libraries,
-            configured_libraries=configured_libraries,
-            recent_invites=recent_invites,
-            stats=stats,
-            subscription_stats=subscription_stats,
-            connection_status=connection_status
-        )
-    except Exception as e:
-        logger.error(f"Error loading dashboard: {str(e)}")
-        flash(f'Error loading dashboard: {str(e)}', 'error')
-        return render_template('admin/dashboard.html', 
-                             libraries=[], 
-                             configured_libraries=[], 
-                             recent_invites=[],
-                             stats={'total': 0, 'successful': 0, 'failed': 0},
-                             subscription_stats={'total': 0, 'active': 0, 'grandfathered': 0, 'mrr': 0},
-                             connection_status={'success': False, 'error': str(e), 'message': f'Connection failed: {str(e)}'})
+        response = Response(stream(last_id), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception:
+        dashboard_events.remove_viewer()
+        raise
+    # The server closes the response however the stream ends, even if the client left
+    # before the generator started (when a finally block in it would never run)
+    response.call_on_close(dashboard_events.remove_viewer)
+    return response
 
 @admin_bp.route('/settings', methods=['POST'])
 @login_required
@@ -120,10 +231,14 @@ def update_settings():
 @admin_bp.route('/test-connection')
 @login_required
 def test_connection():
-    """Test Plex connection."""
+    """Test the connection to every Plex server."""
     try:
-        result = plex_service.test_connection()
-        return jsonify(result)
+        servers = plex_servers.status(refresh=True)
+        return jsonify({
+            'success': all(server['success'] for server in servers),
+            'servers': servers,
+            'message': '\n'.join(f"{server['server_name']}: {server['message']}" for server in servers)
+        })
     except Exception as e:
         logger.error(f"Error testing connection: {str(e)}")
         return jsonify({
@@ -140,72 +255,176 @@ def subscriptions():
     status_filter = request.args.get('status', 'all')
     search = request.args.get('search', '').strip()
     
-    # Build query
-    query = Subscription.query
-    
-    # Apply status filter
-    if status_filter != 'all':
-        try:
-            status_enum = SubscriptionStatus[status_filter]
-            query = query.filter_by(status=status_enum)
-        except KeyError:
-            pass
-    
-    # Apply search filter
-    if search:
-        query = query.filter(
-            db.or_(
-                Subscription.email.ilike(f'%{search}%'),
-                Subscription.plex_username.ilike(f'%{search}%')
-            )
-        )
-    
-    # Order by most recent first
-    subscriptions = query.order_by(Subscription.created_at.desc()).all()
+    # Only the columns the list shows, newest first
+    subscriptions = get_subscription_rows(status=SubscriptionStatus.__members__.get(status_filter), search=search)
     
     # Get subscription stats
     stats = get_subscription_stats()
     
     return render_template('admin/subscriptions.html',
-                         subscriptions=[s.to_dict() for s in subscriptions],
+                         subscriptions=subscriptions,
                          stats=stats,
                          status_filter=status_filter,
-                         search=search)
+                         search=search,
+                         backfill=get_backfill_progress(),
+                         grandfathering=get_grandfather_progress(),
+                         bulk_actions=BULK_ACTIONS,
+                         bulk=get_bulk_action_progress())
+
+@admin_bp.route('/subscriptions/bulk', methods=['POST'])
+@login_required
+def bulk_subscriptions():
+    """Run revoke/extend/cancel/re-invite on the selected subscriptions in the background."""
+    try:
+        action = request.form.get('action', '')
+        if action not in BULK_ACTIONS:
+            raise ValueError("Choose a bulk action")
+        subscription_ids = [int(value) for value in request.form.getlist('subscription_ids')]
+        if not subscription_ids:
+            raise ValueError("Select at least one subscription")
+        days = None
+        if action == 'extend':
+            days = int(request.form.get('days', 30))
+            if days < 1 or days > 365:
+                raise ValueError("Days must be between 1 and 365")
+        
+        start_bulk_action(current_app._get_current_object(), action, subscription_ids, days=days)
+        flash(f'Started "{BULK_ACTIONS[action]}" for {len(subscription_ids)} subscriptions', 'success')
+        logger.info(f"Admin started bulk {action} for {len(subscription_ids)} subscriptions")
+    
+    except Exception as e:
+        flash(f'Error starting bulk action: {str(e)}', 'error')
+        logger.error(f"Error starting bulk action: {str(e)}")
+    
+    return redirect(url_for('admin.subscriptions', status=request.args.get('status', 'all'),
+                            search=request.args.get('search', '')))
+
+@admin_bp.route('/subscriptions/bulk/status')
+@login_required
+def bulk_subscriptions_status():
+    """Progress and per-subscription errors of the current or most recent bulk action."""
+    return jsonify(get_bulk_action_progress() or {'status': 'never_run'})
+
+# Invite log page size (default and the most the JSON API will return at once)
+INVITE_PAGE_SIZE = 50
+MAX_INVITE_PAGE_SIZE = 200
+
+def _invite_log_filters(args):
+    """Parse invite log filters and cursors from query args; raises ValueError on bad input."""
+    filters = {
+        'status': args.get('status') if args.get('status') in ('success', 'failed') else None,
+        'free_tier': {'yes': True, 'no': False}.get(args.get('free_tier')),
+        'limit': min(max(int(args.get('limit', INVITE_PAGE_SIZE)), 1), MAX_INVITE_PAGE_SIZE),
+    }
+    for name in ('since', 'until'):
+        value = args.get(name, '').strip()
+        if not value:
+            filters[name] = None
+            continue
+        try:
+            filters[name] = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Invalid {name} date: {value}")
+        if name == 'until' and len(value) == 10:
+            filters[name] += timedelta(days=1)  # A date on its own includes that whole day
+    for name in ('before', 'after'):
+        try:
+            filters[name] = decode_invite_cursor(args[name]) if args.get(name) else None
+        except ValueError:
+            raise ValueError("Invalid page cursor")
+    return filters
+
+@admin_bp.route('/invites')
+@login_required
+def invites():
+    """Browse the full invite request history with filters."""
+    try:
+        page = get_invite_page(**_invite_log_filters(request.args))
+    except ValueError as e:
+        flash(str(e), 'error')
+        page = {'invites': [], 'older_cursor': None, 'newer_cursor': None}
+    # Filter values to carry over in the pagination links
+    filters = {name: request.args[name] for name in ('status', 'free_tier', 'since', 'until', 'limit')
+               if request.args.get(name)}
+    return render_template('admin/invites.html', page=page, filters=filters)
+
+@admin_bp.route('/api/invites')
+@login_required
+def invites_api():
+    """JSON page of the invite request history (same filters and cursors as /admin/invites)."""
+    try:
+        page = get_invite_page(**_invite_log_filters(request.args))
+        return jsonify({**page, 'invites': [invite.to_dict() for invite in page['invites']]})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+@admin_bp.route('/export/<dataset>.<fmt>')
+@login_required
+def export(dataset, fmt):
+    """Download subscriptions or invite requests as CSV or NDJSON, streamed as rows are read."""
+    status = request.args.get('status')
+    try:
+        chunks = export_chunks(dataset, fmt, status=None if status == 'all' else status)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    filename = f"{dataset}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
+
+# Periods offered on the analytics page, in days
+ANALYTICS_PERIODS = (30, 90, 365)
+
+@admin_bp.route('/analytics')
+@login_required
+def analytics():
+    """Revenue, churn and retention trends from the daily subscription snapshots."""
+    days = request.args.get('days', 90, type=int)
+    if days not in ANALYTICS_PERIODS:
+        days = 90
+    return render_template('admin/analytics.html', analytics=get_analytics(days), periods=ANALYTICS_PERIODS)
 
 @admin_bp.route('/subscription/<int:subscription_id>')
 @login_required
 def subscription_detail(subscription_id):
-    """View single subscription details."""
+    """View single subscription details (rendered from local data, no Stripe calls)."""
     subscription = Subscription.query.get_or_404(subscription_id)
     
-    # Get Stripe subscription details if available
+    # Show Stripe details only if they are already cached; webhooks keep the DB current
     stripe_data = None
-    if subscription.stripe_subscription_id:
-        try:
-            stripe_sub = stripe_service.get_subscription(subscription.stripe_subscription_id)
-            stripe_data = {
-                'status': stripe_sub.status,
-                'current_period_end': datetime.fromtimestamp(stripe_sub.current_period_end),
-                'cancel_at_period_end': stripe_sub.cancel_at_period_end,
-                'billing_url': None
-            }
-            
-            # Create billing portal session
-            if subscription.stripe_customer_id:
-                try:
-                    portal = stripe_service.create_billing_portal_session(
-                        subscription.stripe_customer_id,
-                        url_for('admin.subscriptions', _external=True)
-                    )
-                    stripe_data['billing_url'] = portal.url
-                except Exception as e:
-                    logger.warning(f"Could not create billing portal: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error fetching Stripe data: {str(e)}")
+    stripe_sub = stripe_service.get_cached_object(subscription.stripe_subscription_id)
+    if stripe_sub is not None:
+        stripe_data = {
+            'status': stripe_sub.status,
+            'current_period_end': datetime.fromtimestamp(stripe_sub.current_period_end),
+            'cancel_at_period_end': stripe_sub.cancel_at_period_end
+        }
     
     return render_template('admin/subscription_detail.html',
                          subscription=subscription.to_dict(),
-                         stripe_data=stripe_data)
+                         stripe_data=stripe_data,
+                         history=[event.to_dict() for event in get_subscription_history(subscription_id)])
+
+@admin_bp.route('/subscription/<int:subscription_id>/billing-portal', methods=['POST'])
+@login_required
+def billing_portal(subscription_id):
+    """Create a Stripe billing portal session on demand and redirect to it."""
+    subscription = Subscription.query.get_or_404(subscription_id)
+    
+    if not subscription.stripe_customer_id:
+        flash('This subscription has no Stripe customer.', 'error')
+        return redirect(url_for('admin.subscription_detail', subscription_id=subscription_id))
+    
+    try:
+        portal = stripe_service.create_billing_portal_session(
+            subscription.stripe_customer_id,
+            url_for('admin.subscription_detail', subscription_id=subscription_id, _external=True)
+        )
+        return redirect(portal.url, code=303)
+    except Exception as e:
+        logger.warning(f"Could not create billing portal: {str(e)}")
+        flash(f'Could not open billing portal: {str(e)}', 'error')
+        return redirect(url_for('admin.subscription_detail', subscription_id=subscription_id))
 
 @admin_bp.route('/subscription/<int:subscription_id>/revoke', methods=['POST'])
 @login_required
@@ -214,13 +433,14 @@ def revoke_subscription(subscription_id):
     try:
         subscription = Subscription.query.get_or_404(subscription_id)
         
-        # Revoke Plex access
-        plex_service.revoke_access(subscription.plex_username)
+        # Revoke Plex access on every server
+        plex_servers.revoke_access(subscription.plex_username)
         
         # Update subscription status
         update_subscription_status(
             subscription_id,
-            status=SubscriptionStatus.cancelled
+            status=SubscriptionStatus.cancelled,
+            source='admin'
         )
         
         # Cancel Stripe subscription if exists
@@ -256,7 +476,8 @@ def extend_subscription(subscription_id):
         update_subscription_status(
             subscription_id,
             status=SubscriptionStatus.active,
-            current_period_end=new_end
+            current_period_end=new_end,
+            source='admin'
         )
         
         flash(f'Extended subscription for {subscription.email} by {days} days', 'success')
@@ -272,12 +493,20 @@ def extend_subscription(subscription_id):
 @login_required
 def tiers():
     """Manage subscription tiers."""
-    tiers = Tier.query.order_by(Tier.price_monthly).all()
-    libraries = plex_service.get_libraries()
+    tiers = fetch_rows(TierRow, select_tier_rows().order_by(Tier.price_monthly))
+    libraries = plex_servers.all_libraries()
     
     return render_template('admin/tiers.html',
-                         tiers=[t.to_dict() for t in tiers],
-                         libraries=libraries)
+                         tiers=tiers,
+                         libraries=libraries,
+                         servers=[service.server_name for service in plex_servers],
+                         permission_sync=get_tier_permission_sync_progress())
+
+@admin_bp.route('/tiers/permission-sync/status')
+@login_required
+def tier_permission_sync_status():
+    """Per-tier progress of pushing tier changes to existing subscribers."""
+    return jsonify({str(tier_id): counts for tier_id, counts in get_tier_permission_sync_progress().items()})
 
 @admin_bp.route('/tier/create', methods=['POST'])
 @login_required
@@ -290,6 +519,7 @@ def create_tier():
         stripe_price_id = request.form.get('stripe_price_id', '').strip()
         allow_downloads = request.form.get('allow_downloads') == 'on'
         library_names = request.form.getlist('libraries')
+        server_names = request.form.getlist('servers')
         
         tier = Tier(
             name=name,
@@ -298,6 +528,7 @@ def create_tier():
             stripe_price_id=stripe_price_id if stripe_price_id else None,
             allow_downloads=allow_downloads,
             library_names=library_names,
+            server_names=server_names or None,
             active=True
         )
         
@@ -320,6 +551,7 @@ def update_tier(tier_id):
     """Update an existing tier."""
     try:
         tier = Tier.query.get_or_404(tier_id)
+        previous_access = (sorted(tier.library_names or []), tier.allow_downloads)
         
         tier.name = request.form.get('name')
         tier.description = request.form.get('description', '')
@@ -327,12 +559,21 @@ def update_tier(tier_id):
         tier.stripe_price_id = request.form.get('stripe_price_id', '').strip() or None
         tier.allow_downloads = request.form.get('allow_downloads') == 'on'
         tier.library_names = request.form.getlist('libraries')
+        tier.server_names = request.form.getlist('servers') or None
         tier.updated_at = datetime.utcnow()
         
         db.session.commit()
         
         flash(f'Successfully updated tier: {tier.name}', 'success')
         logger.info(f"Admin updated tier {tier_id}")
+        
+        # Existing subscribers keep their old shares until the change is pushed to Plex
+        if (sorted(tier.library_names or []), tier.allow_downloads) != previous_access:
+            queued = enqueue_tier_permission_sync(tier.id)
+            if queued:
+                start_tier_permission_sync(current_app._get_current_object())
+                flash(f'Updating Plex access for {queued} existing subscribers in the background', 'info')
+                logger.info(f"Queued Plex permission updates for {queued} subscribers of tier {tier_id}")
     
     except Exception as e:
         db.session.rollback()
@@ -365,11 +606,11 @@ def toggle_tier(tier_id):
 @admin_bp.route('/grandfather-users', methods=['POST'])
 @login_required
 def grandfather_users():
-    """Grandfather existing users (migration script)."""
+    """Grandfather existing users in the background (resumes an interrupted run)."""
     try:
-        count = grandfather_existing_users()
-        flash(f'Successfully grandfathered {count} existing users', 'success')
-        logger.info(f"Admin grandfathered {count} users")
+        start_grandfathering(current_app._get_current_object())
+        flash('Started grandfathering existing users', 'success')
+        logger.info("Admin started grandfathering existing users")
     
     except Exception as e:
         flash(f'Error grandfathering users: {str(e)}', 'error')
@@ -377,3 +618,40 @@ def grandfather_users():
     
     return redirect(url_for('admin.subscriptions'))
 
+@admin_bp.route('/grandfather-users/status')
+@login_required
+def grandfather_users_status():
+    """Progress of the current or most recent grandfathering run."""
+    return jsonify(get_grandfather_progress() or {'status': 'never_run'})
+
+
+@admin_bp.route('/stripe/backfill', methods=['POST'])
+@login_required
+def stripe_backfill():
+    """Replay missed Stripe webhook events from the last N hours in the background."""
+    try:
+        hours = int(request.form.get('hours', 24))
+        if hours < 1 or hours > 720:
+            raise ValueError("Hours must be between 1 and 720 (Stripe keeps events for 30 days)")
+        
+        start_backfill(current_app._get_current_object(), datetime.utcnow() - timedelta(hours=hours))
+        flash(f'Started replaying Stripe events from the last {hours} hours', 'success')
+        logger.info(f"Admin started Stripe event backfill for the last {hours} hours")
+    
+    except Exception as e:
+        flash(f'Error starting Stripe backfill: {str(e)}', 'error')
+        logger.error(f"Error starting Stripe backfill: {str(e)}")
+    
+    return redirect(url_for('admin.subscriptions'))
+
+@admin_bp.route('/stripe/backfill/status')
+@login_required
+def stripe_backfill_status():
+    """Progress of the current or most recent Stripe event backfill."""
+    return jsonify(get_backfill_progress() or {'status': 'never_run'})
+
+@admin_bp.route('/stripe/metrics')
+@login_required
+def stripe_metrics():
+    """Stripe API latency, retry and error counters for this worker."""
+    return jsonify(stripe_service.get_metrics())
@@ -1,12 +1,15 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
-from app.plex_service import plex_service
-from app.models import (create_invite_request, Tier, create_subscription, 
-                        get_subscription_by_stripe_id, update_subscription_status,
-                        SubscriptionStatus, db)
+from app.plex_service import plex_service, plex_servers
+from app.models import (create_invite_request, Tier, create_subscription, get_server_loads, set_subscription_server,
+                        find_entitled_subscription, SubscriptionStatus)
 from app.stripe_service import stripe_service
+from app.webhook_dispatcher import webhook_dispatcher
+from app.webhook_handlers import process_webhook_event
+from app.single_flight import provision_once
 from app.utils import validate_email_or_username, sanitize_input
 from config import Config
 from datetime import datetime
+from concurrent.futures import TimeoutError as FutureTimeoutError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -77,11 +80,12 @@ def request_invite():
         # Get configured libraries
         library_names = Config.get_library_config()
         
-        # Send the invite
-        plex_service.send_invite(email_or_username, library_names)
+        def send_invite():
+            plex_service.send_invite(email_or_username, library_names)
+            create_invite_request(email_or_username, 'success')
         
-        # Log success
-        create_invite_request(email_or_username, 'success')
+        # Send and log the invite once, however many times the form was submitted concurrently
+        provision_once('request_invite', email_or_username, send_invite)
         
         logger.info(f"Successfully sent invite to {email_or_username}")
         return render_template('success.html', email_or_username=email_or_username)
@@ -125,6 +129,13 @@ def checkout():
             flash('Please provide a valid email address.', 'error')
             return redirect(url_for('main.plans'))
         
+        # Already a paying subscriber (in any letter case): don't start a second checkout. A
+        # past-due subscriber may check out again; the new subscription replaces the unpaid one
+        existing = find_entitled_subscription(email, plex_username, grandfathered=False)
+        if existing and existing.status == SubscriptionStatus.active:
+            flash('An active subscription already exists for this email or Plex username.', 'info')
+            return redirect(url_for('main.plans'))
+        
         # Get tier from database or config
         tier = Tier.query.get(int(tier_id))
         if not tier:
@@ -189,156 +200,23 @@ def stripe_webhook():
         logger.error(f"Webhook signature verification failed: {str(e)}")
         return jsonify({'error': 'Invalid signature'}), 400
     
-    # Handle the event
-    event_type = event['type']
+    # Hand the event to the dispatcher: parallel across subscriptions, ordered within one
+    future = webhook_dispatcher.dispatch(event, process_webhook_event)
     
     try:
-        if event_type == 'checkout.session.completed':
-            # Payment successful, create subscription
-            session = event['data']['object']
-            handle_checkout_completed(session)
-        
-        elif event_type == 'customer.subscription.updated':
-            # Subscription updated (renewal, cancellation scheduled, etc.)
-            subscription = event['data']['object']
-            handle_subscription_updated(subscription)
-        
-        elif event_type == 'customer.subscription.deleted':
-            # Subscription cancelled/expired
-            subscription = event['data']['object']
-            handle_subscription_deleted(subscription)
-        
-        elif event_type == 'invoice.payment_failed':
-            # Payment failed
-            invoice = event['data']['object']
-            handle_payment_failed(invoice)
-        
-        else:
-            logger.info(f"Unhandled webhook event type: {event_type}")
-        
+        future.result(timeout=Config.WEBHOOK_DISPATCH_TIMEOUT)
         return jsonify({'status': 'success'}), 200
     
-    except Exception as e:
-        logger.error(f"Error processing webhook event {event_type}: {str(e)}")
-        return jsonify({'error': str(e)}), 500
-
-def handle_checkout_completed(session):
-    """Handle successful checkout - create subscription and send Plex invite."""
-    try:
-        stripe_subscription_id = session.get('subscription')
-        customer_email = session.get('customer_email') or session.get('customer_details', {}).get('email')
-        tier_id = int(session.get('metadata', {}).get('tier_id'))
-        plex_username = session.get('metadata', {}).get('plex_username') or customer_email
-        
-        # Get subscription details from Stripe
-        stripe_sub = stripe_service.get_subscription(stripe_subscription_id)
-        sub_data = stripe_service.parse_subscription_data(stripe_sub)
-        
-        # Create subscription in database
-        subscription = create_subscription(
-            email=customer_email,
-            plex_username=plex_username,
-            tier_id=tier_id,
-            stripe_customer_id=sub_data['stripe_customer_id'],
-            stripe_subscription_id=sub_data['stripe_subscription_id'],
-            current_period_start=sub_data['current_period_start'],
-            current_period_end=sub_data['current_period_end']
-        )
-        
-        # Get tier to send Plex invite
-        tier = Tier.query.get(tier_id)
-        if tier:
-            # Send Plex invite with tier settings
-            plex_service.send_invite_with_tier(plex_username, tier)
-            
-            # Create invite request record
-            invite_request = create_invite_request(
-                email_or_username=plex_username,
-                status='success',
-                error_message=None
-            )
-            invite_request.subscription_id = subscription.id
-            db.session.commit()
-            
-            logger.info(f"Successfully created subscription and sent Plex invite for {customer_email}")
-        else:
-            logger.error(f"Tier {tier_id} not found when processing checkout")
-    
-    except Exception as e:
-        logger.error(f"Error handling checkout completion: {str(e)}")
-        raise
-
-def handle_subscription_updated(stripe_subscription):
-    """Handle subscription updates from Stripe."""
-    try:
-        subscription = get_subscription_by_stripe_id(stripe_subscription['id'])
-        if subscription:
-            # Parse updated data
-            sub_data = stripe_service.parse_subscription_data(stripe_subscription)
-            
-            # Determine status
-            stripe_status = sub_data['status']
-            if stripe_status == 'active':
-                status = SubscriptionStatus.active
-            elif stripe_status == 'past_due':
-                status = SubscriptionStatus.past_due
-            elif stripe_status == 'canceled':
-                status = SubscriptionStatus.cancelled
-            else:
-                status = SubscriptionStatus.active
-            
-            # Update subscription
-            update_subscription_status(
-                subscription.id,
-                status=status,
-                current_period_end=sub_data['current_period_end'],
-                cancel_at_period_end=sub_data['cancel_at_period_end']
-            )
-            
-            logger.info(f"Updated subscription {subscription.id} status to {status.value}")
-    
-    except Exception as e:
-        logger.error(f"Error handling subscription update: {str(e)}")
-        raise
-
-def handle_subscription_deleted(stripe_subscription):
-    """Handle subscription cancellation/deletion."""
-    try:
-        subscription = get_subscription_by_stripe_id(stripe_subscription['id'])
-        if subscription:
-            # Revoke Plex access
-            plex_service.revoke_access(subscription.plex_username)
-            
-            # Update subscription status
-            update_subscription_status(
-                subscription.id,
-                status=SubscriptionStatus.cancelled
-            )
-            
-            logger.info(f"Cancelled subscription {subscription.id} and revoked Plex access for {subscription.email}")
-    
-    except Exception as e:
-        logger.error(f"Error handling subscription deletion: {str(e)}")
-        raise
-
-def handle_payment_failed(invoice):
-    """Handle failed payment."""
-    try:
-        stripe_subscription_id = invoice.get('subscription')
-        if stripe_subscription_id:
-            subscription = get_subscription_by_stripe_id(stripe_subscription_id)
-            if subscription:
-                # Update status to past_due
-                update_subscription_status(
-                    subscription.id,
-                    status=SubscriptionStatus.past_due
-                )
-                
-                logger.warning(f"Payment failed for subscription {subscription.id} ({subscription.email})")
+    except FutureTimeoutError:
+        # Still queued or running. Don't acknowledge yet: if this worker dies before it
+        # finishes, only a redelivery brings it back. A redelivery after it finished is
+        # skipped as already processed.
+        logger.warning(f"Webhook event {event['id']} still processing after {Config.WEBHOOK_DISPATCH_TIMEOUT}s")
+        return jsonify({'status': 'processing'}), 503
     
     except Exception as e:
-        logger.error(f"Error handling payment failure: {str(e)}")
-        raise
+        logger.error(f"Error processing webhook event {event['type']}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
 @main_bp.route('/free-access', methods=['POST'])
 @limiter.limit("5 per hour")
@@ -364,6 +242,11 @@ def free_access():
             flash('Please provide a valid email address or Plex username.', 'error')
             return redirect(url_for('main.plans'))
         
+        # Already has access (in any letter case): nothing to send to Plex
+        if find_entitled_subscription(email_or_username):
+            flash('This email or Plex username already has access.', 'info')
+            return redirect(url_for('main.plans'))
+        
         # Get or create "Grandfathered" tier
         tier = Tier.query.filter_by(name="Grandfathered").first()
         if not tier:
@@ -373,29 +256,37 @@ def free_access():
                 flash('No subscription tiers available. Please contact administrator.', 'error')
                 return redirect(url_for('main.plans'))
         
-        # Create grandfathered subscription (no expiry, no Stripe)
-        subscription = create_subscription(
-            email=email_or_username,
-            plex_username=email_or_username,
-            tier_id=tier.id,
-            grandfathered=True,
-            current_period_start=datetime.utcnow(),
-            current_period_end=None  # No expiry
-        )
-        
-        # Send Plex invite
-        library_names = Config.get_library_config()  # Use default libraries
-        plex_service.send_invite(email_or_username, library_names, allow_downloads=False)
+        def grant_access():
+            # Pick the Plex server before the new subscription counts towards its load
+            server = plex_servers.choose_server(tier, get_server_loads())
+            
+            # Create grandfathered subscription (no expiry, no Stripe)
+            subscription = create_subscription(
+                email=email_or_username,
+                plex_username=email_or_username,
+                tier_id=tier.id,
+                grandfathered=True,
+                current_period_start=datetime.utcnow(),
+                current_period_end=None,  # No expiry
+                source='free_access'
+            )
+            
+            # Send Plex invite
+            library_names = Config.get_library_config()  # Use default libraries
+            server.send_invite(email_or_username, library_names, allow_downloads=False)
+            set_subscription_server(subscription.id, server.server_name)
+            
+            # Create invite request record
+            create_invite_request(
+                email_or_username=email_or_username,
+                status='success',
+                error_message=None,
+                subscription_id=subscription.id,
+                free_tier=True
+            )
         
-        # Create invite request record
-        invite_req = create_invite_request(
-            email_or_username=email_or_username,
-            status='success',
-            error_message=None
-        )
-        invite_req.subscription_id = subscription.id
-        invite_req.free_tier = True
-        db.session.commit()
+        # Concurrent duplicate submissions share this one subscription and invite
+        provision_once('free_access', email_or_username, grant_access)
         
         logger.info(f"Successfully created free tier access for {email_or_username}")
         return render_template('success.html', email_or_username=email_or_username)
@@ -1,14 +1,17 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime, timedelta
 import logging
+from config import Config
 
 logger = logging.getLogger(__name__)
 
 def check_expired_subscriptions():
     """Check for expired subscriptions and revoke access."""
-    from app.models import Subscription, SubscriptionStatus, db
-    from app.plex_service import plex_service
+    from app.models import Subscription, SubscriptionStatus, db, defer_plex_action, record_subscription_event
+    from app.plex_service import plex_servers
+    from app.circuit_breaker import CircuitOpenError
     
     try:
         logger.info("Running expired subscription check...")
@@ -25,12 +28,17 @@ def check_expired_subscriptions():
         count = 0
         for subscription in expired_subscriptions:
             try:
-                # Revoke Plex access
-                plex_service.revoke_access(subscription.plex_username)
+                # Revoke Plex access on every server (queued for later if Plex is down)
+                try:
+                    plex_servers.revoke_access(subscription.plex_username)
+                except CircuitOpenError:
+                    defer_plex_action('revoke', subscription.plex_username, subscription_id=subscription.id)
+                    logger.warning(f"Plex unavailable, queued access revocation for {subscription.plex_username}")
                 
                 # Update subscription status
                 subscription.status = SubscriptionStatus.expired
                 subscription.updated_at = datetime.utcnow()
+                record_subscription_event(subscription, SubscriptionStatus.active, 'scheduler')
                 db.session.commit()
                 
                 logger.info(f"Revoked access for expired subscription: {subscription.email} (ID: {subscription.id})")
@@ -79,28 +87,276 @@ def send_expiry_warnings():
         logger.error(f"Error in send_expiry_warnings: {str(e)}")
         return 0
 
+def reconcile_stripe_subscriptions():
+    """Correct subscription drift from missed Stripe webhooks (incremental)."""
+    from app.stripe_sync import reconcile_stripe_subscriptions as run_reconciliation, RUN_CLAIM_NAME
+    from app.models import claim_job_run
+    
+    try:
+        # Every worker schedules this job; only the first one to claim it runs
+        if not claim_job_run(RUN_CLAIM_NAME, timedelta(minutes=50)):
+            return 0
+        logger.info("Running Stripe subscription reconciliation...")
+        report = run_reconciliation()
+        return report['drifted'] + report['inserted']
+    except Exception as e:
+        logger.error(f"Error in reconcile_stripe_subscriptions: {str(e)}")
+        return 0
+
+def process_deferred_plex_actions(limit=100):
+    """Retry Plex invites/revocations that were queued while Plex was unavailable."""
+    from app.models import Tier, Subscription, InviteRequest, claim_deferred_plex_action, get_server_loads, db
+    from app.plex_service import plex_servers
+    from app.circuit_breaker import CircuitOpenError
+    
+    if plex_servers.all_open():
+        return 0
+    
+    count = 0
+    last_id = 0
+    try:
+        for _ in range(limit):
+            # One row per transaction so other workers can claim the rest; each
+            # pass moves forward so a failing action is retried on the next run
+            action = claim_deferred_plex_action(after_id=last_id)
+            if not action:
+                break
+            last_id = action.id
+            kind, username, subscription_id = action.action, action.email_or_username, action.subscription_id
+            try:
+                if kind == 'revoke':
+                    plex_servers.revoke_access(username)
+                else:
+                    tier = Tier.query.get(action.tier_id)
+                    if not tier:
+                        raise ValueError(f"Tier {action.tier_id} no longer exists")
+                    server_name = plex_servers.send_invite_with_tier(username, tier, get_server_loads())
+                    if subscription_id:
+                        db.session.execute(
+                            db.update(Subscription).where(Subscription.id == subscription_id)
+                            .values(plex_server=server_name)
+                        )
+                    db.session.add(InviteRequest(
+                        email_or_username=username,
+                        status='success',
+                        subscription_id=subscription_id
+                    ))
+                
+                # Record the invite and drop the queued action in the same transaction
+                db.session.delete(action)
+                db.session.commit()
+                count += 1
+                logger.info(f"Completed deferred Plex {kind} for {username}")
+            except CircuitOpenError:
+                db.session.rollback()
+                break
+            except Exception as e:
+                action.attempts += 1
+                action.last_error = str(e)
+                db.session.commit()
+                logger.error(f"Deferred Plex {kind} for {username} failed "
+                             f"(attempt {action.attempts}): {str(e)}")
+        
+        if count:
+            logger.info(f"Processed {count} deferred Plex actions")
+        return count
+    
+    except Exception as e:
+        logger.error(f"Error in process_deferred_plex_actions: {str(e)}")
+        db.session.rollback()
+        return count
+
+def reconcile_plex_access():
+    """Grant or revoke Plex access wherever it disagrees with the subscription table."""
+    from app.plex_sync import reconcile_plex_access as run_reconciliation, CHECKPOINT_NAME
+    from app.models import claim_job_run
+    
+    try:
+        # Every worker schedules this job; only the first one to claim it runs
+        if not claim_job_run(CHECKPOINT_NAME, timedelta(hours=1)):
+            return 0
+        logger.info("Running Plex access reconciliation...")
+        report = run_reconciliation()
+        return report['granted_count'] + report['revoked_count']
+    except Exception as e:
+        logger.error(f"Error in reconcile_plex_access: {str(e)}")
+        return 0
+
+def refresh_plex_roster():
+    """Reload this worker's snapshot of Plex friends and pending invites (one fetch for every server)."""
+    from app.plex_service import plex_servers
+    
+    try:
+        return plex_servers.refresh_roster()['friends']
+    except Exception as e:
+        logger.error(f"Error in refresh_plex_roster: {str(e)}")
+        return 0
+
+def propagate_tier_permissions():
+    """Resume pushing tier library/download changes to existing subscribers."""
+    from app.tier_sync import propagate_tier_permissions as run_propagation
+    
+    try:
+        return run_propagation()
+    except Exception as e:
+        logger.error(f"Error in propagate_tier_permissions: {str(e)}")
+        return 0
+
+def prune_invite_requests():
+    """Roll up, archive and delete invite requests past the retention period."""
+    from app.invite_retention import prune_invite_requests as run_retention, CHECKPOINT_NAME
+    from app.models import claim_job_run
+    
+    if Config.INVITE_RETENTION_DAYS < 1:
+        return 0
+    try:
+        # Every worker schedules this job; only the first one to claim it runs
+        if not claim_job_run(CHECKPOINT_NAME, timedelta(hours=12)):
+            return 0
+        logger.info("Running invite request retention...")
+        return run_retention()['archived']
+    except Exception as e:
+        logger.error(f"Error in prune_invite_requests: {str(e)}")
+        return 0
+
+def snapshot_subscriptions():
+    """Record yesterday's per-tier subscription counts and MRR for the analytics page."""
+    from app.analytics import snapshot_subscriptions as run_snapshot, CHECKPOINT_NAME
+    from app.models import claim_job_run
+    
+    try:
+        # Every worker schedules this job; only the first one to claim it runs
+        if not claim_job_run(CHECKPOINT_NAME, timedelta(hours=12)):
+            return 0
+        return run_snapshot()
+    except Exception as e:
+        logger.error(f"Error in snapshot_subscriptions: {str(e)}")
+        return 0
+
+def backfill_identities():
+    """Fill casefolded identity columns of older rows, then add the unique identity index."""
+    from app.identity_backfill import backfill_identities as run_backfill, get_backfill_progress, CHECKPOINT_NAME
+    from app.models import claim_job_run
+    
+    try:
+        # Nothing left to do once the index exists (new rows are normalized as they are written)
+        previous = get_backfill_progress()
+        if previous and previous.get('status') == 'complete' and previous.get('unique_index'):
+            return 0
+        # Every worker schedules this job; only the first one to claim it runs
+        if not claim_job_run(CHECKPOINT_NAME, timedelta(minutes=30)):
+            return 0
+        logger.info("Running identity backfill...")
+        return sum(run_backfill()['filled'].values())
+    except Exception as e:
+        logger.error(f"Error in backfill_identities: {str(e)}")
+        return 0
+
+def _with_app_context(app, func):
+    """Wrap a job so it runs inside the Flask application context."""
+    def job():
+        with app.app_context():
+            return func()
+    job.__name__ = func.__name__
+    return job
+
 def init_scheduler(app):
     """Initialize and start the background scheduler."""
     scheduler = BackgroundScheduler()
     
     # Check for expired subscriptions daily at midnight
     scheduler.add_job(
-        func=check_expired_subscriptions,
+        func=_with_app_context(app, check_expired_subscriptions),
         trigger=CronTrigger(hour=0, minute=0),  # Run at midnight
         id='check_expired_subscriptions',
         name='Check for expired subscriptions',
         replace_existing=True
     )
     
+    # Snapshot subscription counts and MRR just after the day ends (after the expiry check)
+    scheduler.add_job(
+        func=_with_app_context(app, snapshot_subscriptions),
+        trigger=CronTrigger(hour=0, minute=10),
+        id='snapshot_subscriptions',
+        name='Snapshot subscription metrics',
+        replace_existing=True
+    )
+    
     # Send expiry warnings daily at 9 AM
     scheduler.add_job(
-        func=send_expiry_warnings,
+        func=_with_app_context(app, send_expiry_warnings),
         trigger=CronTrigger(hour=9, minute=0),  # Run at 9 AM
         id='send_expiry_warnings',
         name='Send expiry warnings',
         replace_existing=True
     )
     
+    # Reconcile subscriptions with Stripe hourly (only objects changed since the last run)
+    scheduler.add_job(
+        func=_with_app_context(app, reconcile_stripe_subscriptions),
+        trigger=CronTrigger(minute=15),
+        id='reconcile_stripe_subscriptions',
+        name='Reconcile subscriptions with Stripe',
+        replace_existing=True
+    )
+    
+    # Retry Plex actions queued during outages every couple of minutes
+    scheduler.add_job(
+        func=_with_app_context(app, process_deferred_plex_actions),
+        trigger=CronTrigger(minute='*/2'),
+        id='process_deferred_plex_actions',
+        name='Retry deferred Plex actions',
+        replace_existing=True
+    )
+    
+    # Catch access the expiry job or webhooks failed to grant/revoke (after the midnight run)
+    scheduler.add_job(
+        func=_with_app_context(app, reconcile_plex_access),
+        trigger=CronTrigger(hour=1, minute=0),
+        id='reconcile_plex_access',
+        name='Reconcile Plex access with subscriptions',
+        replace_existing=True
+    )
+    
+    # Archive old invite requests nightly, after the other overnight jobs
+    scheduler.add_job(
+        func=_with_app_context(app, prune_invite_requests),
+        trigger=CronTrigger(hour=3, minute=30),
+        id='prune_invite_requests',
+        name='Archive old invite requests',
+        replace_existing=True
+    )
+    
+    # Pick up tier permission rollouts interrupted by a restart or a Plex outage
+    scheduler.add_job(
+        func=_with_app_context(app, propagate_tier_permissions),
+        trigger=CronTrigger(minute='*/5'),
+        id='propagate_tier_permissions',
+        name='Propagate tier permission changes',
+        replace_existing=True
+    )
+    
+    # Backfill normalized identities after an upgrade (first run right away, then hourly until
+    # duplicates are resolved and the unique index exists)
+    scheduler.add_job(
+        func=_with_app_context(app, backfill_identities),
+        trigger=CronTrigger(minute=45),
+        next_run_time=datetime.now(),
+        id='backfill_identities',
+        name='Backfill normalized identities',
+        replace_existing=True
+    )
+    
+    # Keep the Plex friend roster snapshot fresh (first load right away)
+    scheduler.add_job(
+        func=_with_app_context(app, refresh_plex_roster),
+        trigger=IntervalTrigger(seconds=Config.PLEX_ROSTER_REFRESH_INTERVAL),
+        next_run_time=datetime.now(),
+        id='refresh_plex_roster',
+        name='Refresh Plex friend roster',
+        replace_existing=True
+    )
+    
     # Start the scheduler
     with app.app_context():
         scheduler.start()
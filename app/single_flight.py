@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from app.models import claim_flight, finish_flight, get_flight
+from app.utils import normalize_identity
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Run one call per key at a time and share its outcome with concurrent duplicates.
+
+    Within a process, duplicates wait on the first call's Future. Across
+    gunicorn workers, the first call claims a row in ``in_flight_requests``
+    and duplicates in other workers poll that row until the outcome is
+    recorded. A claim left pending by a worker that died is taken over after
+    ``lease`` seconds. Only callers that overlap a call share its outcome;
+    one arriving after it finished runs again. If the database can't be
+    used the call still runs, coalesced within the process only.
+
+    Results must be JSON-serialisable. A duplicate in another worker gets a
+    ValueError with the first call's message if that call raised ValueError,
+    or a RuntimeError for anything else.
+    """
+
+    def __init__(self, namespace, wait_timeout=60, lease=120, poll_interval=0.2):
+        self.namespace = namespace
+        self.wait_timeout = wait_timeout
+        self.lease = timedelta(seconds=lease)
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        """Return func() for key, or the outcome of an identical call already in flight."""
+        key = f'{self.namespace}:{key}'
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            try:
+                return future.result(timeout=self.wait_timeout)
+            except FutureTimeoutError:
+                raise ValueError("A request for this user is already in progress. Please try again shortly.")
+
+        try:
+            result = self._run_shared(key, func)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def _run_shared(self, key, func):
+        """Run func as the cluster-wide owner of key, or wait for the worker that owns it."""
+        flight_id = uuid.uuid4().hex
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            row = claim_flight(key, flight_id, self.lease)
+        except Exception as e:
+            logger.warning(f"Single-flight store unavailable, coalescing '{key}' per process: {str(e)}")
+            return func()
+
+        while True:
+            if row.flight_id == flight_id:
+                return self._lead(key, flight_id, func)
+            if row.status != 'pending':
+                logger.info(f"Sharing the result of a concurrent request for '{key}'")
+                return self._shared_outcome(row)
+            if time.monotonic() >= deadline:
+                raise ValueError("A request for this user is already in progress. Please try again shortly.")
+            time.sleep(self.poll_interval)
+
+            # Poll without claiming, so the finished row's outcome is seen rather than taken over;
+            # only a vanished row or an expired lease (the owner died) is claimed again
+            try:
+                row = get_flight(key)
+                if row is None or (row.status == 'pending' and row.started_at < datetime.utcnow() - self.lease):
+                    row = claim_flight(key, flight_id, self.lease)
+            except Exception as e:
+                logger.warning(f"Single-flight store unavailable while waiting on '{key}': {str(e)}")
+                raise ValueError("A request for this user is already in progress. Please try again shortly.")
+
+    def _lead(self, key, flight_id, func):
+        try:
+            result = func()
+        except ValueError as e:
+            self._finish(key, flight_id, 'rejected', {'error': str(e)})
+            raise
+        except Exception as e:
+            self._finish(key, flight_id, 'failed', {'error': str(e)})
+            raise
+        self._finish(key, flight_id, 'success', {'value': result})
+        return result
+
+    @staticmethod
+    def _finish(key, flight_id, status, result):
+        try:
+            finish_flight(key, flight_id, status, result)
+        except Exception as e:
+            # Waiting duplicates time out instead; the call itself already happened
+            logger.warning(f"Could not record single-flight result for '{key}': {str(e)}")
+
+    @staticmethod
+    def _shared_outcome(row):
+        if row.status == 'success':
+            return (row.result or {}).get('value')
+        error = (row.result or {}).get('error', 'The request failed')
+        if row.status == 'rejected':
+            raise ValueError(error)
+        raise RuntimeError(error)
+
+# Provisioning a Plex user (invite, free access, paid checkout), keyed by operation and normalized username
+invite_flight = SingleFlight('provision', wait_timeout=Config.INVITE_FLIGHT_WAIT_SECONDS,
+                             lease=Config.INVITE_FLIGHT_LEASE_SECONDS)
+
+def provision_once(operation, username, func, scope=None):
+    """Run func (a Plex provisioning step for username) once across concurrent duplicate requests.
+    
+    Only calls of the same operation (and scope, e.g. a Stripe subscription id) are duplicates
+    of each other, so an invite request never receives a checkout's outcome.
+    """
+    key = f'{operation}:{normalize_identity(username)}'
+    return invite_flight.do(f'{key}:{scope}' if scope else key, func)
@@ -0,0 +1,143 @@
+import calendar
+import logging
+import threading
+import time
+from concurrent.futures import as_completed
+from datetime import datetime
+from app.models import get_processed_event_ids, save_job_checkpoint, get_job_checkpoint
+from app.stripe_service import stripe_service
+from app.webhook_dispatcher import webhook_dispatcher
+from app.webhook_handlers import HANDLED_EVENT_TYPES, process_webhook_event
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'stripe_event_backfill'
+
+# How often progress is logged and saved while replaying
+PROGRESS_INTERVAL_SECONDS = 2
+
+_run_lock = threading.Lock()
+
+def _save_progress(progress):
+    """Persist progress so the admin UI (and other workers) can see it."""
+    try:
+        save_job_checkpoint(CHECKPOINT_NAME, data=dict(progress))
+    except Exception as e:
+        logger.warning(f"Could not save backfill progress: {str(e)}")
+
+def _collect_unprocessed(batch, pending, progress):
+    """Append events from batch that have not been handled yet to pending."""
+    processed = get_processed_event_ids([event['id'] for event in batch])
+    pending.extend(event for event in batch if event['id'] not in processed)
+    progress['listed'] += len(batch)
+    progress['already_processed'] += len(processed)
+
+def backfill_stripe_events(since, batch_size=500, on_progress=None):
+    """Replay Stripe events created after ``since`` through the webhook handlers.
+
+    Events already recorded as processed are skipped. The rest are replayed
+    oldest first through the webhook dispatcher, so they run in parallel across
+    subscriptions and in order within each one. Returns the final progress dict.
+    """
+    created_after = calendar.timegm(since.utctimetuple())
+    progress = {
+        'status': 'listing',
+        'since': since.strftime('%Y-%m-%d %H:%M:%S'),
+        'started_at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+        'finished_at': None,
+        'listed': 0,
+        'already_processed': 0,
+        'total': 0,
+        'done': 0,
+        'skipped': 0,
+        'failed': 0,
+        'events_per_second': 0.0,
+        'error': None,
+    }
+
+    if not _run_lock.acquire(blocking=False):
+        raise ValueError("A Stripe event backfill is already running")
+
+    try:
+        started = time.monotonic()
+
+        def report():
+            elapsed = max(time.monotonic() - started, 0.001)
+            progress['events_per_second'] = round((progress['done'] + progress['failed']) / elapsed, 1)
+            _save_progress(progress)
+            if on_progress:
+                on_progress(progress)
+            logger.info(
+                f"Backfill {progress['status']}: {progress['done'] + progress['failed']}/{progress['total']} replayed, "
+                f"{progress['failed']} failed, {progress['already_processed']} already processed, "
+                f"{progress['events_per_second']} events/s"
+            )
+
+        # 1. Page through the events (newest first), keeping only unprocessed ones
+        pending = []
+        batch = []
+        for event in stripe_service.iter_events(HANDLED_EVENT_TYPES, created_after=created_after):
+            batch.append(event)
+            if len(batch) >= batch_size:
+                _collect_unprocessed(batch, pending, progress)
+                batch = []
+        if batch:
+            _collect_unprocessed(batch, pending, progress)
+
+        # 2. Replay oldest first so per-subscription queues see events in order
+        pending.reverse()
+        progress['status'] = 'replaying'
+        progress['total'] = len(pending)
+        report()
+
+        futures = [webhook_dispatcher.dispatch(event, process_webhook_event) for event in pending]
+        last_report = time.monotonic()
+        for future in as_completed(futures):
+            try:
+                if future.result() is False:
+                    progress['skipped'] += 1
+                progress['done'] += 1
+            except Exception:
+                # The dispatcher already logged the handler error
+                progress['failed'] += 1
+
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL_SECONDS:
+                report()
+                last_report = time.monotonic()
+
+        progress['status'] = 'complete'
+        progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        report()
+        return progress
+
+    except Exception as e:
+        progress['status'] = 'failed'
+        progress['error'] = str(e)
+        progress['finished_at'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        _save_progress(progress)
+        logger.error(f"Stripe event backfill failed: {str(e)}")
+        raise
+
+    finally:
+        _run_lock.release()
+
+def start_backfill(app, since):
+    """Run a backfill in a background thread (used by the admin action)."""
+    if _run_lock.locked():
+        raise ValueError("A Stripe event backfill is already running")
+
+    def run():
+        with app.app_context():
+            try:
+                backfill_stripe_events(since)
+            except Exception:
+                pass  # Already logged and saved to the checkpoint
+
+    thread = threading.Thread(target=run, name='stripe-event-backfill', daemon=True)
+    thread.start()
+    return thread
+
+def get_backfill_progress():
+    """Return the progress of the current or most recent backfill, or None."""
+    checkpoint = get_job_checkpoint(CHECKPOINT_NAME)
+    return checkpoint.data if checkpoint else None
@@ -1,28 +1,85 @@
 import stripe
 import logging
+import uuid
 from config import Config
 from datetime import datetime
+from app.cache import TTLCache
+from app.stripe_transport import PooledRequestsClient, CallMetrics, call_with_retries
 
 logger = logging.getLogger(__name__)
 
 # Initialize Stripe with secret key
 stripe.api_key = Config.STRIPE_SECRET_KEY
 
+# Pooled keep-alive HTTP transport shared by every thread in this worker.
+# Retries are handled by call_with_retries, not the library.
+stripe.default_http_client = PooledRequestsClient(
+    timeout=Config.STRIPE_HTTP_TIMEOUT,
+    pool_size=Config.STRIPE_HTTP_POOL_SIZE
+)
+stripe.max_network_retries = 0
+
 class StripeService:
     """Service class for Stripe API operations."""
     
+    # Seconds to wait on calls a user is actively waiting for (checkout, portal)
+    USER_FACING_TIMEOUT = 10
+    
     def __init__(self):
         self.api_key = Config.STRIPE_SECRET_KEY
         self.publishable_key = Config.STRIPE_PUBLISHABLE_KEY
         self.webhook_secret = Config.STRIPE_WEBHOOK_SECRET
+        # Read-through cache of subscription, customer and checkout session objects,
+        # keyed by Stripe ID (IDs are globally unique, e.g. sub_..., cus_..., cs_...)
+        self.cache = TTLCache(ttl=Config.STRIPE_CACHE_TTL)
+        self.http_client = stripe.default_http_client
+        self.metrics = CallMetrics()
+    
+    def _call(self, operation, func, *args, timeout=None, **kwargs):
+        """Call the Stripe API with retries, an optional per-call timeout and latency tracking."""
+        with self.http_client.timeout_override(timeout):
+            return call_with_retries(
+                operation, func, *args,
+                max_retries=Config.STRIPE_MAX_RETRIES,
+                metrics=self.metrics,
+                **kwargs
+            )
+    
+    def _iter_list(self, operation, list_func, **params):
+        """Page through a Stripe list endpoint, retrying each page independently."""
+        starting_after = None
+        while True:
+            if starting_after:
+                params['starting_after'] = starting_after
+            page = self._call(operation, list_func, **params)
+            for item in page.data:
+                yield item
+            if not page.has_more or not page.data:
+                break
+            starting_after = page.data[-1].id
     
-    def create_customer(self, email, name=None, metadata=None):
+    def get_metrics(self):
+        """Latency and retry counters per Stripe operation for this worker."""
+        return self.metrics.snapshot()
+    
+    def invalidate_cache(self, *object_ids):
+        """Drop cached Stripe objects (called when a webhook reports a change)."""
+        self.cache.invalidate(*object_ids)
+    
+    def get_cached_object(self, object_id):
+        """Return a cached Stripe object without calling the API, or None."""
+        return self.cache.get(object_id) if object_id else None
+    
+    def create_customer(self, email, name=None, metadata=None, idempotency_key=None):
         """Create a Stripe customer."""
         try:
-            customer = stripe.Customer.create(
+            customer = self._call(
+                'customer.create',
+                stripe.Customer.create,
                 email=email,
                 name=name,
-                metadata=metadata or {}
+                metadata=metadata or {},
+                idempotency_key=idempotency_key or str(uuid.uuid4())
             )
             logger.info(f"Created Stripe customer: {customer.id} for {email}")
             return customer
@@ -30,14 +87,19 @@ class StripeService:
             logger.error(f"Error creating Stripe customer: {str(e)}")
             raise ValueError(f"Error creating customer: {str(e)}")
     
-    def create_checkout_session(self, tier, customer_email, success_url, cancel_url, metadata=None):
+    def create_checkout_session(self, tier, customer_email, success_url, cancel_url, metadata=None,
+                                idempotency_key=None):
         """Create a Stripe checkout session for a subscription."""
         try:
             # Ensure we have the necessary tier information
             if not tier.get('stripe_price_id'):
                 raise ValueError(f"Tier '{tier.get('name')}' does not have a Stripe price ID configured")
             
-            session = stripe.checkout.Session.create(
+            session = self._call(
+                'checkout.session.create',
+                stripe.checkout.Session.create,
+                timeout=self.USER_FACING_TIMEOUT,
+                idempotency_key=idempotency_key or str(uuid.uuid4()),
                 payment_method_types=['card'],
                 line_items=[{
                     'price': tier['stripe_price_id'],
@@ -58,36 +120,93 @@ class StripeService:
             logger.error(f"Error creating checkout session: {str(e)}")
             raise ValueError(f"Error creating checkout session: {str(e)}")
     
-    def get_checkout_session(self, session_id):
-        """Retrieve a checkout session by ID."""
+    def get_checkout_session(self, session_id, use_cache=True):
+        """Retrieve a checkout session by ID (read-through cached)."""
+        if use_cache:
+            cached = self.cache.get(session_id)
+            if cached is not None:
+                return cached
+        
         try:
-            session = stripe.checkout.Session.retrieve(session_id)
+            session = self._call('checkout.session.retrieve', stripe.checkout.Session.retrieve, session_id,
+                                 timeout=self.USER_FACING_TIMEOUT)
+            self.cache.set(session_id, session)
             return session
         except stripe.error.StripeError as e:
             logger.error(f"Error retrieving checkout session: {str(e)}")
             raise ValueError(f"Error retrieving checkout session: {str(e)}")
     
-    def get_subscription(self, subscription_id):
-        """Get subscription details from Stripe."""
+    def get_subscription(self, subscription_id, use_cache=True):
+        """Get subscription details from Stripe (read-through cached)."""
+        if use_cache:
+            cached = self.cache.get(subscription_id)
+            if cached is not None:
+                return cached
+        
         try:
-            subscription = stripe.Subscription.retrieve(subscription_id)
+            subscription = self._call('subscription.retrieve', stripe.Subscription.retrieve, subscription_id)
+            self.cache.set(subscription_id, subscription)
             return subscription
         except stripe.error.StripeError as e:
             logger.error(f"Error retrieving subscription: {str(e)}")
             raise ValueError(f"Error retrieving subscription: {str(e)}")
     
+    def get_customer(self, customer_id, use_cache=True):
+        """Get customer details from Stripe (read-through cached)."""
+        if use_cache:
+            cached = self.cache.get(customer_id)
+            if cached is not None:
+                return cached
+        
+        try:
+            customer = self._call('customer.retrieve', stripe.Customer.retrieve, customer_id)
+            self.cache.set(customer_id, customer)
+            return customer
+        except stripe.error.StripeError as e:
+            logger.error(f"Error retrieving customer: {str(e)}")
+            raise ValueError(f"Error retrieving customer: {str(e)}")
+    
+    def iter_subscriptions(self, status='all', expand=None, page_size=100):
+        """Stream every Stripe subscription, fetching pages lazily."""
+        try:
+            yield from self._iter_list(
+                'subscription.list',
+                stripe.Subscription.list,
+                status=status,
+                limit=page_size,
+                expand=expand or []
+            )
+        except stripe.error.StripeError as e:
+            logger.error(f"Error listing subscriptions: {str(e)}")
+            raise ValueError(f"Error listing subscriptions: {str(e)}")
+    
+    def iter_events(self, types, created_after=None, page_size=100):
+        """Stream Stripe events of the given types (newest first), fetching pages lazily."""
+        params = {'types': types, 'limit': page_size}
+        if created_after:
+            params['created'] = {'gt': int(created_after)}
+        
+        try:
+            yield from self._iter_list('event.list', stripe.Event.list, **params)
+        except stripe.error.StripeError as e:
+            logger.error(f"Error listing events: {str(e)}")
+            raise ValueError(f"Error listing events: {str(e)}")
+    
     def cancel_subscription(self, subscription_id, at_period_end=True):
         """Cancel a subscription (default: at end of billing period)."""
         try:
             if at_period_end:
-                subscription = stripe.Subscription.modify(
+                subscription = self._call(
+                    'subscription.modify',
+                    stripe.Subscription.modify,
                     subscription_id,
                     cancel_at_period_end=True
                 )
                 logger.info(f"Scheduled subscription {subscription_id} for cancellation at period end")
             else:
-                subscription = stripe.Subscription.delete(subscription_id)
+                subscription = self._call('subscription.delete', stripe.Subscription.delete, subscription_id)
                 logger.info(f"Immediately cancelled subscription {subscription_id}")
+            self.cache.set(subscription_id, subscription)
             return subscription
         except stripe.error.StripeError as e:
             logger.error(f"Error cancelling subscription: {str(e)}")
@@ -96,11 +215,14 @@ class StripeService:
     def reactivate_subscription(self, subscription_id):
         """Reactivate a subscription that was set to cancel."""
         try:
-            subscription = stripe.Subscription.modify(
+            subscription = self._call(
+                'subscription.modify',
+                stripe.Subscription.modify,
                 subscription_id,
                 cancel_at_period_end=False
             )
             logger.info(f"Reactivated subscription {subscription_id}")
+            self.cache.set(subscription_id, subscription)
             return subscription
         except stripe.error.StripeError as e:
             logger.error(f"Error reactivating subscription: {str(e)}")
@@ -122,9 +244,11 @@ class StripeService:
     
     def parse_subscription_data(self, stripe_subscription):
         """Parse Stripe subscription object into our data format."""
+        # customer is an ID unless the subscription was fetched with expand=['customer']
+        customer = stripe_subscription.customer
         return {
             'stripe_subscription_id': stripe_subscription.id,
-            'stripe_customer_id': stripe_subscription.customer,
+            'stripe_customer_id': customer if isinstance(customer, str) else customer.id,
             'status': stripe_subscription.status,
             'current_period_start': datetime.fromtimestamp(stripe_subscription.current_period_start),
             'current_period_end': datetime.fromtimestamp(stripe_subscription.current_period_end),
@@ -134,7 +258,9 @@ class StripeService:
     def get_payment_methods(self, customer_id):
         """Get customer's payment methods."""
         try:
-            payment_methods = stripe.PaymentMethod.list(
+            payment_methods = self._call(
+                'payment_method.list',
+                stripe.PaymentMethod.list,
                 customer=customer_id,
                 type='card'
             )
@@ -146,7 +272,11 @@ class StripeService:
     def create_billing_portal_session(self, customer_id, return_url):
         """Create a billing portal session for customer to manage subscription."""
         try:
-            session = stripe.billing_portal.Session.create(
+            session = self._call(
+                'billing_portal.session.create',
+                stripe.billing_portal.Session.create,
+                timeout=self.USER_FACING_TIMEOUT,
+                idempotency_key=str(uuid.uuid4()),
                 customer=customer_id,
                 return_url=return_url
             )
@@ -0,0 +1,218 @@
+import calendar
+import logging
+from datetime import datetime, timedelta
+from app.models import (ENTITLED_STATUSES, Subscription, SubscriptionStatus, Tier, db, status_from_stripe,
+                        get_job_checkpoint, save_job_checkpoint, bulk_update_subscriptions,
+                        bulk_insert_subscriptions)
+from app.stripe_service import stripe_service
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_NAME = 'stripe_subscription_sync'
+
+# Scheduled runs are claimed under their own name: the checkpoint's last_run_at is the
+# incremental cursor and must only move once a run has finished
+RUN_CLAIM_NAME = 'stripe_subscription_sync_run'
+
+# Stripe keeps events for 30 days; older checkpoints need a full scan
+EVENT_RETENTION = timedelta(days=29)
+
+SUBSCRIPTION_EVENT_TYPES = [
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+]
+
+SYNCED_FIELDS = ('status', 'stripe_customer_id', 'current_period_start',
+                 'current_period_end', 'cancel_at_period_end')
+
+# Keep the stored report small; counts cover the rest
+MAX_REPORTED_CHANGES = 200
+
+def _report_value(value):
+    """Render a column value for the JSON drift report."""
+    if isinstance(value, SubscriptionStatus):
+        return value.value
+    return str(value) if value is not None else None
+
+def _to_timestamp(value):
+    """Convert a naive UTC datetime to a Unix timestamp."""
+    return calendar.timegm(value.utctimetuple())
+
+def _iter_full():
+    """Yield (stripe_subscription, observed_at) for every subscription in Stripe."""
+    observed_at = datetime.utcnow()
+    for stripe_sub in stripe_service.iter_subscriptions(expand=['data.customer']):
+        yield stripe_sub, observed_at
+
+def _iter_changed_since(last_run_at):
+    """Yield the newest snapshot of each subscription changed since last_run_at."""
+    seen = set()
+    events = stripe_service.iter_events(SUBSCRIPTION_EVENT_TYPES, created_after=_to_timestamp(last_run_at))
+    for event in events:
+        stripe_sub = event['data']['object']
+        # Events are listed newest first, so the first one per subscription wins
+        if stripe_sub['id'] in seen:
+            continue
+        seen.add(stripe_sub['id'])
+        yield stripe_sub, datetime.utcfromtimestamp(event['created'])
+
+def _chunked(iterable, size):
+    """Yield lists of at most size items from an iterable."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _desired_state(stripe_sub):
+    """Return the DB column values implied by a Stripe subscription."""
+    sub_data = stripe_service.parse_subscription_data(stripe_sub)
+    return {
+        'status': status_from_stripe(sub_data['status']),
+        'stripe_customer_id': sub_data['stripe_customer_id'],
+        'current_period_start': sub_data['current_period_start'],
+        'current_period_end': sub_data['current_period_end'],
+        'cancel_at_period_end': bool(sub_data['cancel_at_period_end']),
+    }
+
+def _customer_email(stripe_sub):
+    """Get the customer email for a subscription, using the expanded customer if present."""
+    customer = stripe_sub['customer']
+    if isinstance(customer, str):
+        customer = stripe_service.get_customer(customer)
+    return customer.get('email')
+
+def _reconcile_chunk(chunk, valid_tier_ids, report):
+    """Diff one chunk of Stripe subscriptions against the DB and apply corrections."""
+    ids = [stripe_sub['id'] for stripe_sub, _ in chunk]
+    existing = {
+        row.stripe_subscription_id: row
+        for row in db.session.query(
+            Subscription.id,
+            Subscription.stripe_subscription_id,
+            Subscription.last_event_at,
+            *[getattr(Subscription, field) for field in SYNCED_FIELDS]
+        ).filter(Subscription.stripe_subscription_id.in_(ids))
+    }
+
+    updates = []
+    inserts = []
+    now = datetime.utcnow()
+
+    for stripe_sub, observed_at in chunk:
+        desired = _desired_state(stripe_sub)
+        row = existing.get(stripe_sub['id'])
+
+        if row is None:
+            # Abandoned, unpaid or ended subscriptions never get a row (or Plex access)
+            if desired['status'] not in ENTITLED_STATUSES:
+                report['not_entitled'] += 1
+                continue
+            metadata = stripe_sub.get('metadata') or {}
+            tier_id = metadata.get('tier_id')
+            plex_username = metadata.get('plex_username')
+            if not tier_id or not tier_id.isdigit() or int(tier_id) not in valid_tier_ids or not plex_username:
+                report['unmatched_count'] += 1
+                if len(report['unmatched']) < MAX_REPORTED_CHANGES:
+                    report['unmatched'].append(stripe_sub['id'])
+                continue
+            email = _customer_email(stripe_sub) or plex_username
+            inserts.append(dict(
+                desired,
+                email=email,
+                plex_username=plex_username,
+                tier_id=int(tier_id),
+                stripe_subscription_id=stripe_sub['id'],
+                grandfathered=False,
+                last_event_at=observed_at,
+                created_at=now,
+                updated_at=now,
+            ))
+            report['missing'] += 1
+            continue
+
+        # A webhook applied after this snapshot was taken is authoritative
+        if row.last_event_at and row.last_event_at > observed_at:
+            continue
+
+        changed = {field: value for field, value in desired.items() if getattr(row, field) != value}
+        if not changed:
+            continue
+
+        report['drifted'] += 1
+        if len(report['changes']) < MAX_REPORTED_CHANGES:
+            report['changes'].append({
+                'stripe_subscription_id': stripe_sub['id'],
+                'fields': {
+                    field: [_report_value(getattr(row, field)), _report_value(value)]
+                    for field, value in changed.items()
+                }
+            })
+        updates.append(dict(changed, id=row.id, last_event_at=observed_at, updated_at=now))
+
+    try:
+        report['updated'] += bulk_update_subscriptions(updates, source='stripe_sync')
+        report['inserted'] += bulk_insert_subscriptions(inserts, source='stripe_sync')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def reconcile_stripe_subscriptions(full=False, chunk_size=500):
+    """Bring Subscription rows in line with Stripe and return a drift report.
+
+    Runs incrementally from Stripe events changed since the last run unless
+    ``full`` is set, there is no previous run, or the last run is older than
+    Stripe's event retention window.
+    """
+    started_at = datetime.utcnow()
+    checkpoint = get_job_checkpoint(CHECKPOINT_NAME)
+    last_run_at = checkpoint.last_run_at if checkpoint else None
+
+    if not full and (last_run_at is None or started_at - last_run_at > EVENT_RETENTION):
+        full = True
+
+    report = {
+        'mode': 'full' if full else 'incremental',
+        'started_at': started_at.strftime('%Y-%m-%d %H:%M:%S'),
+        'since': last_run_at.strftime('%Y-%m-%d %H:%M:%S') if last_run_at and not full else None,
+        'scanned': 0,
+        'drifted': 0,
+        'missing': 0,
+        'updated': 0,
+        'inserted': 0,
+        'not_entitled': 0,
+        'unmatched_count': 0,
+        'unmatched': [],
+        'changes': [],
+    }
+
+    logger.info(f"Starting {report['mode']} Stripe subscription reconciliation")
+    valid_tier_ids = {tier_id for (tier_id,) in db.session.query(Tier.id)}
+    source = _iter_full() if full else _iter_changed_since(last_run_at)
+
+    for chunk in _chunked(source, chunk_size):
+        _reconcile_chunk(chunk, valid_tier_ids, report)
+        report['scanned'] += len(chunk)
+        # Release identities loaded for this chunk
+        db.session.expunge_all()
+
+    report['duration_seconds'] = round((datetime.utcnow() - started_at).total_seconds(), 2)
+
+    # Next run picks up anything that changed while this one was running
+    save_job_checkpoint(CHECKPOINT_NAME, last_run_at=started_at, data=report)
+
+    logger.info(
+        f"Stripe reconciliation ({report['mode']}) complete: scanned {report['scanned']}, "
+        f"drifted {report['drifted']}, updated {report['updated']}, inserted {report['inserted']}, "
+        f"unmatched {report['unmatched_count']}, skipped {report['not_entitled']} not entitled "
+        f"in {report['duration_seconds']}s"
+    )
+    for change in report['changes']:
+        logger.warning(f"Subscription drift {change['stripe_subscription_id']}: {change['fields']}")
+
+    return report
@@ -0,0 +1,142 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+import requests
+import stripe
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# Backoff bounds for retried Stripe calls (seconds)
+INITIAL_RETRY_DELAY = 0.5
+MAX_RETRY_DELAY = 8
+MAX_RETRY_AFTER = 60
+
+class PooledRequestsClient(stripe.http_client.RequestsClient):
+    """Stripe HTTP client sharing one keep-alive connection pool across threads.
+
+    The default timeout can be overridden for calls made by the current thread
+    with ``timeout_override``.
+    """
+
+    def __init__(self, timeout=30, pool_size=10, **kwargs):
+        self._timeouts = threading.local()
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        super().__init__(timeout=timeout, session=session, **kwargs)
+
+    @property
+    def _timeout(self):
+        return getattr(self._timeouts, 'value', None) or self._default_timeout
+
+    @_timeout.setter
+    def _timeout(self, value):
+        self._default_timeout = value
+
+    @contextmanager
+    def timeout_override(self, seconds):
+        """Use a different timeout for requests made inside this block (this thread only)."""
+        previous = getattr(self._timeouts, 'value', None)
+        self._timeouts.value = seconds
+        try:
+            yield
+        finally:
+            self._timeouts.value = previous
+
+class CallMetrics:
+    """Thread-safe latency and outcome counters per Stripe operation."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, seconds, retries=0, error=False):
+        """Record one logical call (including its retries)."""
+        with self._lock:
+            stats = self._stats.setdefault(operation, {
+                'calls': 0, 'errors': 0, 'retries': 0, 'total_ms': 0.0, 'max_ms': 0.0
+            })
+            elapsed_ms = seconds * 1000
+            stats['calls'] += 1
+            stats['retries'] += retries
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if error:
+                stats['errors'] += 1
+
+    def snapshot(self):
+        """Return a copy of the counters with average latency added."""
+        with self._lock:
+            return {
+                operation: dict(
+                    stats,
+                    total_ms=round(stats['total_ms'], 1),
+                    max_ms=round(stats['max_ms'], 1),
+                    avg_ms=round(stats['total_ms'] / stats['calls'], 1) if stats['calls'] else 0.0
+                )
+                for operation, stats in self._stats.items()
+            }
+
+def _header(error, name):
+    """Read a response header from a StripeError, case-insensitively."""
+    headers = getattr(error, 'headers', None) or {}
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+def is_retryable(error):
+    """Whether a Stripe error is transient: rate limiting, connection trouble or a 5xx."""
+    if _header(error, 'stripe-should-retry') == 'false':
+        return False
+    if _header(error, 'stripe-should-retry') == 'true':
+        return True
+    if isinstance(error, (stripe.error.RateLimitError, stripe.error.APIConnectionError)):
+        return True
+    status = getattr(error, 'http_status', None)
+    return status is not None and (status == 429 or status >= 500)
+
+def retry_delay(attempt, error=None):
+    """Jittered exponential backoff, never shorter than a reasonable Retry-After."""
+    delay = min(INITIAL_RETRY_DELAY * (2 ** attempt), MAX_RETRY_DELAY)
+    delay *= 0.5 * (1 + random.random())
+
+    retry_after = _header(error, 'retry-after') if error is not None else None
+    try:
+        retry_after = float(retry_after) if retry_after is not None else 0
+    except ValueError:
+        retry_after = 0
+    if retry_after <= MAX_RETRY_AFTER:
+        delay = max(delay, retry_after)
+
+    return delay
+
+def call_with_retries(operation, func, *args, max_retries=3, metrics=None, **kwargs):
+    """Call a Stripe API function, retrying transient failures with backoff.
+
+    Callers creating objects must pass an ``idempotency_key`` so retries
+    cannot create duplicates.
+    """
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            result = func(*args, **kwargs)
+            if metrics:
+                metrics.record(operation, time.monotonic() - started, retries=attempt)
+            return result
+        except stripe.error.StripeError as e:
+            if attempt >= max_retries or not is_retryable(e):
+                if metrics:
+                    metrics.record(operation, time.monotonic() - started, retries=attempt, error=True)
+                raise
+            delay = retry_delay(attempt, e)
+            attempt += 1
+            logger.warning(
+                f"Stripe {operation} failed ({type(e).__name__}, status {getattr(e, 'http_status', None)}); "
+                f"retry {attempt}/{max_retries} in {delay:.2f}s"
+            )
+            time.sleep(delay)
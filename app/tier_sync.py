@@ -0,0 +1,111 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from app.circuit_breaker import CircuitOpenError
+from app.models import (Subscription, SubscriptionStatus, Tier, db, claim_tier_permission_syncs,
+                        finish_tier_permission_syncs)
+from app.plex_service import plex_servers
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# A claimed chunk not finished within this long (worker crash) is picked up again
+CLAIM_LEASE = timedelta(minutes=10)
+
+# Subscription statuses whose Plex share should follow the tier
+ENTITLED_STATUSES = (SubscriptionStatus.active, SubscriptionStatus.past_due)
+
+_run_lock = threading.Lock()
+
+def _load_chunk(items):
+    """Return ({subscription id: row}, {tier id: Tier}) for a claimed chunk."""
+    subscriptions = {
+        row.id: row
+        for row in db.session.query(
+            Subscription.id, Subscription.plex_username, Subscription.plex_server,
+            Subscription.status, Subscription.tier_id
+        ).filter(Subscription.id.in_([subscription_id for _, subscription_id, _, _ in items]))
+    }
+    tiers = {tier.id: tier for tier in Tier.query.filter(Tier.id.in_({tier_id for _, _, tier_id, _ in items}))}
+    return subscriptions, tiers
+
+def _update(identity, library_names, allow_downloads, plex_server):
+    """Apply one subscriber's tier settings on the server they were placed on."""
+    return plex_servers.update_user_permissions(
+        identity, library_names, allow_downloads, server_names=[plex_server] if plex_server else None
+    )
+
+def propagate_tier_permissions():
+    """Push queued tier library/download changes to existing subscribers' Plex shares.
+
+    Works through the tier_permission_syncs table a chunk at a time: each
+    chunk is claimed, applied with PLEX_SYNC_WORKERS concurrent calls (paced
+    by the Plex write token bucket) and its outcomes saved in bulk, so a
+    crashed run resumes where it stopped. Returns the number of users updated.
+    """
+    if not _run_lock.acquire(blocking=False):
+        return 0
+
+    updated = 0
+    last_id = 0
+    try:
+        with ThreadPoolExecutor(max_workers=Config.PLEX_SYNC_WORKERS,
+                                thread_name_prefix='tier-permission-sync') as executor:
+            while not plex_servers.all_open():
+                # Each pass moves forward so failed users are retried on the next run, not in a loop
+                items = claim_tier_permission_syncs(Config.PLEX_SYNC_BATCH_SIZE, CLAIM_LEASE, after_id=last_id)
+                if not items:
+                    break
+                last_id = items[-1][0]
+                subscriptions, tiers = _load_chunk(items)
+
+                done, failures, released, futures = [], [], [], []
+                for sync_id, subscription_id, tier_id, attempts in items:
+                    subscription = subscriptions.get(subscription_id)
+                    tier = tiers.get(tier_id)
+                    # Cancelled or moved to another tier since it was queued: nothing left to update
+                    if (not subscription or not tier or subscription.tier_id != tier_id
+                            or subscription.status not in ENTITLED_STATUSES):
+                        done.append(sync_id)
+                        continue
+                    library_names = tier.library_names or Config.get_library_config()
+                    futures.append((sync_id, attempts, subscription.plex_username, executor.submit(
+                        _update, subscription.plex_username, library_names, tier.allow_downloads,
+                        subscription.plex_server
+                    )))
+
+                outage = False
+                for sync_id, attempts, plex_username, future in futures:
+                    try:
+                        future.result()
+                        done.append(sync_id)
+                        updated += 1
+                    except CircuitOpenError:
+                        released.append(sync_id)
+                        outage = True
+                    except Exception as e:
+                        failures.append((sync_id, attempts, str(e)))
+                        logger.error(f"Error updating Plex permissions for {plex_username}: {str(e)}")
+
+                finish_tier_permission_syncs(done, failures, released)
+                logger.info(f"Tier permission sync: {len(done)} done, {len(failures)} failed, "
+                            f"{len(released)} deferred in this chunk ({updated} updated so far)")
+                if outage:
+                    break
+        return updated
+    finally:
+        _run_lock.release()
+
+def start_tier_permission_sync(app):
+    """Run propagate_tier_permissions in a background thread (used right after a tier edit)."""
+    def run():
+        with app.app_context():
+            try:
+                propagate_tier_permissions()
+            except Exception as e:
+                logger.error(f"Tier permission sync failed: {str(e)}")
+
+    thread = threading.Thread(target=run, name='tier-permission-sync', daemon=True)
+    thread.start()
+    return thread
@@ -30,6 +30,16 @@ def validate_email_or_username(value):
     
     return False
 
+def normalize_identity(value):
+    """Casefold and trim an email or Plex username so case variants compare equal (None stays None)."""
+    if value is None:
+        return None
+    return value.strip().casefold()
+
+def format_datetime(value, fmt='%Y-%m-%d %H:%M:%S'):
+    """Template filter (|datetime) rendering a datetime, or '' for None."""
+    return value.strftime(fmt) if value else ''
+
 def sanitize_input(value):
     """
     Sanitize user input by trimming and removing control characters.
@@ -0,0 +1,96 @@
+import logging
+import queue
+import threading
+import zlib
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+class WebhookDispatcher:
+    """Process Stripe webhook events in parallel, keeping order per subscription.
+
+    Events are partitioned by Stripe subscription ID. Each partition always
+    hashes to the same worker queue, so events for one subscription are handled
+    one at a time in arrival order while different subscriptions run in parallel.
+    Stale events (older ``event.created``) are rejected at write time by
+    ``update_subscription_status``.
+    """
+
+    def __init__(self, num_workers=4):
+        self.app = None
+        self.num_workers = num_workers
+        self._queues = []
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Bind the dispatcher to the Flask app used for worker app contexts."""
+        self.app = app
+        self.num_workers = max(1, int(app.config.get('WEBHOOK_WORKERS', self.num_workers)))
+
+    def _start(self):
+        """Start worker threads lazily (after gunicorn has forked)."""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.num_workers):
+                work_queue = queue.Queue()
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(work_queue,),
+                    name=f'webhook-worker-{index}',
+                    daemon=True
+                )
+                thread.start()
+                self._queues.append(work_queue)
+                self._threads.append(thread)
+            logger.info(f"Started {self.num_workers} webhook dispatcher workers")
+
+    @staticmethod
+    def partition_key(event):
+        """Return the Stripe subscription ID an event applies to (or the event ID)."""
+        obj = event['data']['object']
+        event_type = event['type']
+
+        if event_type.startswith('customer.subscription.'):
+            key = obj.get('id')
+        else:
+            # checkout.session.* and invoice.* carry the subscription as a field
+            key = obj.get('subscription')
+
+        return key or event['id']
+
+    def dispatch(self, event, handler):
+        """Queue an event for processing and return a Future for its result."""
+        if self.app is None:
+            raise RuntimeError("WebhookDispatcher has not been initialized with an app")
+
+        self._start()
+
+        key = self.partition_key(event)
+        index = zlib.crc32(str(key).encode('utf-8')) % len(self._queues)
+
+        future = Future()
+        self._queues[index].put((event, handler, future))
+        return future
+
+    def _worker(self, work_queue):
+        """Worker loop: handle queued events one at a time inside an app context."""
+        while True:
+            event, handler, future = work_queue.get()
+            try:
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                try:
+                    with self.app.app_context():
+                        result = handler(event)
+                    future.set_result(result)
+                except Exception as e:
+                    logger.error(f"Error processing webhook event {event['id']} ({event['type']}): {str(e)}")
+                    future.set_exception(e)
+            finally:
+                work_queue.task_done()
+
+# Global instance
+webhook_dispatcher = WebhookDispatcher()
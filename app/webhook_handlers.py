@@ -0,0 +1,256 @@
+from app.plex_service import plex_servers
+from app.circuit_breaker import CircuitOpenError
+from app.models import (create_invite_request, Tier, create_subscription,
+                        get_subscription_by_stripe_id, update_subscription_status,
+                        SubscriptionStatus, status_from_stripe, is_event_processed,
+                        mark_event_processed, defer_plex_action, get_server_loads,
+                        set_subscription_server, find_entitled_subscription)
+from app.single_flight import provision_once
+from app.stripe_service import stripe_service
+from config import Config
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stripe event types we act on (used by the webhook endpoint and the backfill tool)
+HANDLED_EVENT_TYPES = [
+    'checkout.session.completed',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+    'invoice.payment_failed',
+]
+
+def process_webhook_event(event):
+    """Route a verified Stripe event to its handler (runs on a dispatcher worker).
+    
+    Returns False if the event was already processed, True otherwise.
+    """
+    event_type = event['type']
+    event_created = datetime.utcfromtimestamp(event['created'])
+    
+    # Stripe redelivers events and the backfill tool replays them; handle each once
+    if is_event_processed(event['id']):
+        logger.info(f"Skipping already processed event {event['id']} ({event_type})")
+        return False
+    
+    # Anything this event touches is now stale in the Stripe object cache
+    obj = event['data']['object']
+    stripe_service.invalidate_cache(obj.get('id'), obj.get('subscription'), obj.get('customer'))
+    
+    if event_type == 'checkout.session.completed':
+        # Payment successful, create subscription
+        session = event['data']['object']
+        handle_checkout_completed(session)
+    
+    elif event_type == 'customer.subscription.updated':
+        # Subscription updated (renewal, cancellation scheduled, etc.)
+        subscription = event['data']['object']
+        handle_subscription_updated(subscription, event_created=event_created)
+    
+    elif event_type == 'customer.subscription.deleted':
+        # Subscription cancelled/expired
+        subscription = event['data']['object']
+        handle_subscription_deleted(subscription, event_created=event_created)
+    
+    elif event_type == 'invoice.payment_failed':
+        # Payment failed
+        invoice = event['data']['object']
+        handle_payment_failed(invoice, event_created=event_created)
+    
+    else:
+        logger.info(f"Unhandled webhook event type: {event_type}")
+        return True
+    
+    mark_event_processed(event['id'], event_type, event_created)
+    return True
+
+def _provision_checkout(stripe_subscription_id, customer_email, tier_id, plex_username):
+    """Create the subscription for a completed checkout and send its Plex invite (at most once)."""
+    # Already created (redelivered or replayed event)
+    if get_subscription_by_stripe_id(stripe_subscription_id):
+        logger.info(f"Subscription {stripe_subscription_id} already exists, skipping checkout handling")
+        return
+    
+    existing = find_entitled_subscription(plex_username, grandfathered=False)
+    replaced = None
+    if existing and existing.status == SubscriptionStatus.past_due:
+        # Subscribing again after a failed payment replaces the unpaid subscription
+        if existing.stripe_subscription_id:
+            stripe_service.cancel_subscription(existing.stripe_subscription_id, at_period_end=False)
+        update_subscription_status(existing.id, status=SubscriptionStatus.cancelled, source='checkout')
+        logger.info(f"Checkout {stripe_subscription_id} replaces past-due subscription #{existing.id}")
+        replaced = existing
+    elif existing:
+        # A second paid subscription for the same Plex user is refused and cancelled so it isn't
+        # billed again; the failed invite row shows it on the admin dashboard for a refund
+        try:
+            stripe_service.cancel_subscription(stripe_subscription_id, at_period_end=False)
+        except ValueError as e:
+            error_msg = (f"Duplicate checkout {stripe_subscription_id} (already subscribed as #{existing.id}) "
+                         f"could not be cancelled: {str(e)}")
+            create_invite_request(email_or_username=plex_username, status='failed', error_message=error_msg,
+                                  subscription_id=existing.id)
+            logger.error(f"{error_msg} ({plex_username})")
+            raise
+        error_msg = (f"Duplicate checkout {stripe_subscription_id} cancelled: already subscribed as "
+                     f"#{existing.id}; refund its first payment")
+        create_invite_request(email_or_username=plex_username, status='failed', error_message=error_msg,
+                              subscription_id=existing.id)
+        logger.error(f"{error_msg} ({plex_username})")
+        return
+    
+    # Get subscription details from Stripe
+    stripe_sub = stripe_service.get_subscription(stripe_subscription_id)
+    sub_data = stripe_service.parse_subscription_data(stripe_sub)
+    
+    # Current per-server load, taken before this subscription counts towards it
+    loads = get_server_loads()
+    
+    # Create subscription in database
+    subscription = create_subscription(
+        email=customer_email,
+        plex_username=plex_username,
+        tier_id=tier_id,
+        stripe_customer_id=sub_data['stripe_customer_id'],
+        stripe_subscription_id=sub_data['stripe_subscription_id'],
+        current_period_start=sub_data['current_period_start'],
+        current_period_end=sub_data['current_period_end'],
+        source='checkout'
+    )
+    
+    # Get tier to send Plex invite
+    tier = Tier.query.get(tier_id)
+    if tier and replaced:
+        # Still shared from the replaced subscription: keep its server and apply this tier's libraries
+        if replaced.plex_server:
+            set_subscription_server(subscription.id, replaced.plex_server)
+        try:
+            plex_servers.update_user_permissions(
+                plex_username, tier.library_names or Config.get_library_config(), tier.allow_downloads,
+                server_names=[replaced.plex_server] if replaced.plex_server else None
+            )
+        except ValueError as e:
+            logger.error(f"Could not apply tier {tier.name} to {plex_username}'s existing share: {str(e)}")
+        logger.info(f"Moved {plex_username} from subscription #{replaced.id} to #{subscription.id}")
+    elif tier:
+        try:
+            # Send Plex invite with tier settings on the best server for the tier
+            server_name = plex_servers.send_invite_with_tier(plex_username, tier, loads)
+            set_subscription_server(subscription.id, server_name)
+        except CircuitOpenError:
+            # Plex is down; the deferred action job sends the invite later
+            defer_plex_action('invite', plex_username, tier_id=tier.id, subscription_id=subscription.id)
+            logger.warning(f"Plex unavailable, queued invite for {plex_username}")
+            return
+        
+        # Create invite request record
+        create_invite_request(
+            email_or_username=plex_username,
+            status='success',
+            error_message=None,
+            subscription_id=subscription.id
+        )
+        
+        logger.info(f"Successfully created subscription and sent Plex invite for {customer_email}")
+    else:
+        logger.error(f"Tier {tier_id} not found when processing checkout")
+
+def handle_checkout_completed(session):
+    """Handle successful checkout - create subscription and send Plex invite."""
+    try:
+        stripe_subscription_id = session.get('subscription')
+        customer_email = session.get('customer_email') or session.get('customer_details', {}).get('email')
+        tier_id = int(session.get('metadata', {}).get('tier_id'))
+        plex_username = session.get('metadata', {}).get('plex_username') or customer_email
+        
+        # Concurrent deliveries of this checkout (parallel redeliveries) share one provisioning
+        provision_once('checkout', plex_username,
+                       lambda: _provision_checkout(stripe_subscription_id, customer_email, tier_id, plex_username),
+                       scope=stripe_subscription_id)
+    
+    except Exception as e:
+        logger.error(f"Error handling checkout completion: {str(e)}")
+        raise
+
+def handle_subscription_updated(stripe_subscription, event_created=None):
+    """Handle subscription updates from Stripe."""
+    try:
+        subscription = get_subscription_by_stripe_id(stripe_subscription['id'])
+        if subscription:
+            # Parse updated data
+            sub_data = stripe_service.parse_subscription_data(stripe_subscription)
+            
+            # Determine status
+            status = status_from_stripe(sub_data['status'])
+            
+            # Update subscription (skipped if a newer event was already applied)
+            updated = update_subscription_status(
+                subscription.id,
+                status=status,
+                current_period_end=sub_data['current_period_end'],
+                cancel_at_period_end=sub_data['cancel_at_period_end'],
+                event_created=event_created,
+                source='webhook'
+            )
+            
+            if updated:
+                logger.info(f"Updated subscription {subscription.id} status to {status.value}")
+            else:
+                logger.info(f"Ignored stale update for subscription {subscription.id}")
+    
+    except Exception as e:
+        logger.error(f"Error handling subscription update: {str(e)}")
+        raise
+
+def handle_subscription_deleted(stripe_subscription, event_created=None):
+    """Handle subscription cancellation/deletion."""
+    try:
+        subscription = get_subscription_by_stripe_id(stripe_subscription['id'])
+        # Already replaced by a newer subscription for the same user, who keeps their access
+        if (subscription and subscription.status == SubscriptionStatus.cancelled
+                and find_entitled_subscription(subscription.plex_username)):
+            logger.info(f"Subscription {subscription.id} was replaced; not revoking {subscription.plex_username}")
+        elif subscription:
+            # Revoke Plex access on every server (queued for later if Plex is down)
+            try:
+                plex_servers.revoke_access(subscription.plex_username)
+            except CircuitOpenError:
+                defer_plex_action('revoke', subscription.plex_username, subscription_id=subscription.id)
+                logger.warning(f"Plex unavailable, queued access revocation for {subscription.plex_username}")
+            
+            # Update subscription status
+            update_subscription_status(
+                subscription.id,
+                status=SubscriptionStatus.cancelled,
+                event_created=event_created,
+                source='webhook'
+            )
+            
+            logger.info(f"Cancelled subscription {subscription.id} and revoked Plex access for {subscription.email}")
+    
+    except Exception as e:
+        logger.error(f"Error handling subscription deletion: {str(e)}")
+        raise
+
+def handle_payment_failed(invoice, event_created=None):
+    """Handle failed payment."""
+    try:
+        stripe_subscription_id = invoice.get('subscription')
+        if stripe_subscription_id:
+            subscription = get_subscription_by_stripe_id(stripe_subscription_id)
+            if subscription:
+                # Update status to past_due (skipped if a newer event was already applied)
+                updated = update_subscription_status(
+                    subscription.id,
+                    status=SubscriptionStatus.past_due,
+                    event_created=event_created,
+                    source='webhook'
+                )
+                
+                if updated:
+                    logger.warning(f"Payment failed for subscription {subscription.id} ({subscription.email})")
+    
+    except Exception as e:
+        logger.error(f"Error handling payment failure: {str(e)}")
+        raise
@@ -1,5 +1,6 @@
 import os
 import json
+import tempfile
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -19,6 +20,75 @@ class Config:
     PLEX_TOKEN = os.getenv('PLEX_TOKEN', '')
     PLEX_SERVER_NAME = os.getenv('PLEX_SERVER_NAME', '')
     
+    # Additional Plex servers to place subscribers on, comma-separated, each optionally with a
+    # subscriber capacity ("Main=200,Overflow=50"). PLEX_SERVER_NAME is always included first.
+    PLEX_SERVERS = os.getenv('PLEX_SERVERS', '')
+    
+    # Seconds to cache each server's library list
+    PLEX_LIBRARY_CACHE_TTL = int(os.getenv('PLEX_LIBRARY_CACHE_TTL', '300'))
+    
+    # Plex connection pool: connections per worker, seconds between health checks of idle
+    # connections, and seconds to wait for a free connection
+    PLEX_POOL_SIZE = int(os.getenv('PLEX_POOL_SIZE', '4'))
+    PLEX_HEALTH_CHECK_INTERVAL = int(os.getenv('PLEX_HEALTH_CHECK_INTERVAL', '60'))
+    PLEX_POOL_TIMEOUT = int(os.getenv('PLEX_POOL_TIMEOUT', '30'))
+    
+    # Background Plex connection keeper: warm-up at worker start and periodic liveness probes.
+    # PLEX_WARM_CONNECTIONS=0 warms the whole pool.
+    PLEX_KEEPALIVE_ENABLED = os.getenv('PLEX_KEEPALIVE_ENABLED', 'True').lower() == 'true'
+    PLEX_KEEPALIVE_INTERVAL = int(os.getenv('PLEX_KEEPALIVE_INTERVAL', '30'))
+    PLEX_WARM_CONNECTIONS = int(os.getenv('PLEX_WARM_CONNECTIONS', '0'))
+    
+    # Plex circuit breaker: opens when at least MIN_CALLS calls in WINDOW seconds fail at
+    # FAILURE_RATE or more, then fails fast for RESET_TIMEOUT seconds before a trial call
+    PLEX_BREAKER_FAILURE_RATE = float(os.getenv('PLEX_BREAKER_FAILURE_RATE', '0.5'))
+    PLEX_BREAKER_MIN_CALLS = int(os.getenv('PLEX_BREAKER_MIN_CALLS', '5'))
+    PLEX_BREAKER_WINDOW = int(os.getenv('PLEX_BREAKER_WINDOW', '60'))
+    PLEX_BREAKER_RESET_TIMEOUT = int(os.getenv('PLEX_BREAKER_RESET_TIMEOUT', '30'))
+    
+    # Plex outbound rate limits (token buckets: calls per second and burst size), shared by
+    # all gunicorn workers through a small SQLite file. Callers wait up to MAX_WAIT seconds.
+    PLEX_READ_RATE = float(os.getenv('PLEX_READ_RATE', '5'))
+    PLEX_READ_BURST = int(os.getenv('PLEX_READ_BURST', '10'))
+    PLEX_WRITE_RATE = float(os.getenv('PLEX_WRITE_RATE', '1'))
+    PLEX_WRITE_BURST = int(os.getenv('PLEX_WRITE_BURST', '5'))
+    PLEX_RATE_LIMIT_MAX_WAIT = int(os.getenv('PLEX_RATE_LIMIT_MAX_WAIT', '60'))
+    PLEX_RATE_LIMIT_STORE = os.getenv(
+        'PLEX_RATE_LIMIT_STORE', os.path.join(tempfile.gettempdir(), 'helpr-plex-ratelimit.sqlite')
+    )
+    
+    # Friend roster snapshot: refreshed every REFRESH_INTERVAL seconds, trusted for MAX_AGE seconds
+    PLEX_ROSTER_REFRESH_INTERVAL = int(os.getenv('PLEX_ROSTER_REFRESH_INTERVAL', '300'))
+    PLEX_ROSTER_MAX_AGE = int(os.getenv('PLEX_ROSTER_MAX_AGE', '900'))
+    
+    # Nightly Plex access reconciliation: parallel workers and users per batch
+    PLEX_SYNC_WORKERS = int(os.getenv('PLEX_SYNC_WORKERS', '4'))
+    PLEX_SYNC_BATCH_SIZE = int(os.getenv('PLEX_SYNC_BATCH_SIZE', '50'))
+    
+    # Admin bulk subscription actions: subscriptions per chunk and concurrent Plex/Stripe calls
+    ADMIN_BULK_CHUNK_SIZE = int(os.getenv('ADMIN_BULK_CHUNK_SIZE', '100'))
+    ADMIN_BULK_WORKERS = int(os.getenv('ADMIN_BULK_WORKERS', '8'))
+    
+    # Live admin dashboard (server-sent events): seconds between checks for changes made by other
+    # workers, open streams allowed per worker (each holds a gunicorn thread) and seconds before a
+    # stream is closed for the browser to reconnect
+    DASHBOARD_EVENT_POLL_INTERVAL = float(os.getenv('DASHBOARD_EVENT_POLL_INTERVAL', '2'))
+    DASHBOARD_MAX_STREAMS = int(os.getenv('DASHBOARD_MAX_STREAMS', '2'))
+    DASHBOARD_STREAM_SECONDS = int(os.getenv('DASHBOARD_STREAM_SECONDS', '300'))
+    
+    # Invite request retention: rows older than this many days are rolled up into daily counts,
+    # archived (compressed) and deleted, this many per transaction; 0 keeps everything
+    INVITE_RETENTION_DAYS = int(os.getenv('INVITE_RETENTION_DAYS', '90'))
+    INVITE_RETENTION_BATCH_SIZE = int(os.getenv('INVITE_RETENTION_BATCH_SIZE', '1000'))
+    
+    # Rows per transaction when filling the casefolded identity columns of existing rows
+    IDENTITY_BACKFILL_BATCH_SIZE = int(os.getenv('IDENTITY_BACKFILL_BATCH_SIZE', '1000'))
+    
+    # Duplicate invite submissions for the same user wait up to this long for the first one's result;
+    # a claim left by a worker that died is taken over after the lease
+    INVITE_FLIGHT_WAIT_SECONDS = int(os.getenv('INVITE_FLIGHT_WAIT_SECONDS', '60'))
+    INVITE_FLIGHT_LEASE_SECONDS = int(os.getenv('INVITE_FLIGHT_LEASE_SECONDS', '120'))
+    
     # Admin credentials
     ADMIN_USERNAME = os.getenv('ADMIN_USERNAME', '')
     ADMIN_PASSWORD_HASH = os.getenv('ADMIN_PASSWORD_HASH', '')
@@ -34,6 +104,18 @@ class Config:
     STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
     STRIPE_WEBHOOK_SECRET = os.getenv('STRIPE_WEBHOOK_SECRET', '')
     
+    # Stripe HTTP transport: default timeout (seconds), pooled connections and retry budget
+    STRIPE_HTTP_TIMEOUT = int(os.getenv('STRIPE_HTTP_TIMEOUT', '30'))
+    STRIPE_HTTP_POOL_SIZE = int(os.getenv('STRIPE_HTTP_POOL_SIZE', '10'))
+    STRIPE_MAX_RETRIES = int(os.getenv('STRIPE_MAX_RETRIES', '3'))
+    
+    # Seconds to cache Stripe subscription/customer/checkout objects (webhooks invalidate early)
+    STRIPE_CACHE_TTL = int(os.getenv('STRIPE_CACHE_TTL', '300'))
+    
+    # Webhook processing settings
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '4'))
+    WEBHOOK_DISPATCH_TIMEOUT = float(os.getenv('WEBHOOK_DISPATCH_TIMEOUT', '10'))
+    
     # Configuration file path
     CONFIG_FILE = 'config.json'
     
@@ -125,6 +207,20 @@ class Config:
                 return tier
         return None
     
+    @staticmethod
+    def get_plex_servers():
+        """Return [(server name, capacity or None)], primary server (PLEX_SERVER_NAME) first."""
+        servers = {}
+        for entry in Config.PLEX_SERVERS.split(','):
+            name, _, capacity = entry.partition('=')
+            name = name.strip()
+            if name:
+                servers[name] = int(capacity) if capacity.strip().isdigit() else None
+        primary = Config.PLEX_SERVER_NAME
+        result = [(primary, servers.pop(primary, None))]
+        result.extend(servers.items())
+        return result
+    
     @staticmethod
     def validate_config():
         """Validate that all required configuration is present."""